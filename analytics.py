@@ -0,0 +1,212 @@
+"""Columnar cross-session analytics with NumPy.
+
+``ResponseMatrix`` loads every answer, archived sessions included, into a
+dense sessions x questions ``uint8`` array (answers 0..5, ``MISSING``
+where a session did not answer a question). Questions are ordered by
+category, so per-category figures are contiguous column slices and
+everything below is a handful of vectorized reductions; scoring 100k
+sessions takes a fraction of a second. Nothing here needs Kivy.
+
+    python analytics.py --db survey.db --by phc
+"""
+import argparse
+import sys
+
+import numpy as np
+
+import archive
+import database
+import packed_storage
+
+MISSING = 255
+NUM_ANSWERS = 6
+# Answers at or above this ("Optimum" and better) count as compliant
+COMPLIANT_FROM = 3
+
+
+def _load_rows(conn, session_ids, column_of, answers, chunk_size, schema="main"):
+    """Fill ``answers`` from response rows.
+
+    SQLite folds each session's rows into one row of comma-separated
+    question ids and a string of answer digits ('9' for anything that is
+    not a valid answer), so Python builds one tuple per session rather
+    than one per answer; ``chunk_size`` is still counted in answers.
+    """
+    cursor = conn.execute(f'''
+        SELECT session_id, COUNT(*), group_concat(COALESCE(question_id, 0)),
+               group_concat(CASE WHEN length(answer) = 1 AND answer BETWEEN '0' AND '5' THEN answer ELSE '9' END, '')
+        FROM {schema}.responses
+        WHERE session_id IS NOT NULL
+        GROUP BY session_id
+    ''')
+    sessions_per_chunk = max(1, chunk_size // max(1, answers.shape[1]))
+    while True:
+        rows = cursor.fetchmany(sessions_per_chunk)
+        if not rows:
+            break
+        sids = np.repeat(np.array([row[0] for row in rows], dtype=np.int64), [row[1] for row in rows])
+        qids = np.fromstring(",".join([row[2] for row in rows]), dtype=np.int64, sep=",")
+        values = np.frombuffer("".join([row[3] for row in rows]).encode("ascii"), dtype=np.uint8) - ord("0")
+        values[values >= NUM_ANSWERS] = MISSING
+        # Drop responses whose session or question no longer exists
+        rows_idx = np.minimum(np.searchsorted(session_ids, sids), len(session_ids) - 1)
+        known_qids = np.minimum(qids, len(column_of) - 1)
+        cols = column_of[known_qids]
+        keep = (session_ids[rows_idx] == sids) & (qids == known_qids) & (cols >= 0)
+        answers[rows_idx[keep], cols[keep]] = values[keep]
+
+
+def _load_packed(conn, session_ids, column_of, answers, chunk_size):
+    """Fill ``answers`` straight from packed_responses blobs.
+
+    Each chunk's blobs are grouped by category and stacked into one
+    (blobs x width) byte array, so a blob byte lands in its matrix cell
+    without going through SQL rows at all.
+    """
+    columns = {category_id: column_of[np.asarray(qids, dtype=np.int64)]
+               for category_id, qids in packed_storage.category_questions(conn).items()}
+    cursor = conn.execute("SELECT session_id, category_id, answers FROM packed_responses")
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        by_category = {}
+        for session_id, category_id, blob in rows:
+            if category_id in columns:
+                by_category.setdefault(category_id, []).append((session_id, blob))
+        for category_id, blobs in by_category.items():
+            cols = columns[category_id]
+            width = len(cols)
+            sids = np.array([sid for sid, _ in blobs], dtype=np.int64)
+            values = np.frombuffer(b"".join(blob[:width].ljust(width, bytes([MISSING])) for _, blob in blobs),
+                                   dtype=np.uint8).reshape(-1, width)
+            rows_idx = np.minimum(np.searchsorted(session_ids, sids), len(session_ids) - 1)
+            known = session_ids[rows_idx] == sids
+            r, c = np.nonzero((values != MISSING) & known[:, None] & (cols >= 0))
+            answers[rows_idx[r], cols[c]] = values[r, c]
+
+
+class ResponseMatrix:
+    def __init__(self, session_ids, question_ids, question_categories, answers, sub_centres, phcs):
+        self.session_ids = np.asarray(session_ids, dtype=np.int64)
+        self.question_ids = np.asarray(question_ids, dtype=np.int64)
+        self.question_categories = np.asarray(question_categories, dtype=np.int64)
+        self.answers = answers
+        # Sessions' sub-centre and PHC as codes into the name lists
+        self.sub_centre_names, self.sub_centre_codes = np.unique(np.asarray(sub_centres, dtype=str), return_inverse=True)
+        self.phc_names, self.phc_codes = np.unique(np.asarray(phcs, dtype=str), return_inverse=True)
+        self.category_ids, starts = np.unique(self.question_categories, return_index=True)
+        self._category_bounds = dict(zip(self.category_ids.tolist(),
+                                         zip(starts.tolist(), list(starts[1:]) + [len(self.question_ids)])))
+
+    @classmethod
+    def load(cls, conn=None, chunk_size=50000):
+        conn = conn or database.get_connection()
+        questions = np.array(conn.execute(
+            "SELECT id, category_id FROM questions ORDER BY category_id, id").fetchall(), dtype=np.int64).reshape(-1, 2)
+        session_sql = "SELECT id, COALESCE(sub_centre, ''), COALESCE(phc, '') FROM {}.sessions"
+        sessions = conn.execute(session_sql.format("main")).fetchall()
+        for schema in archive.each_archive(conn):
+            sessions.extend(conn.execute(session_sql.format(schema)))
+        sessions.sort()
+        session_ids = np.array([row[0] for row in sessions], dtype=np.int64)
+        answers = np.full((len(session_ids), len(questions)), MISSING, dtype=np.uint8)
+
+        # questions.id -> column, via a dense lookup table
+        column_of = np.full(int(questions[:, 0].max(initial=0)) + 1, -1, dtype=np.int64)
+        column_of[questions[:, 0]] = np.arange(len(questions))
+
+        if not len(session_ids) or not len(questions):
+            return cls(session_ids, questions[:, 0], questions[:, 1], answers,
+                       [row[1] for row in sessions], [row[2] for row in sessions])
+        # Archives always hold rows, whatever the live storage mode
+        for schema in archive.each_archive(conn):
+            _load_rows(conn, session_ids, column_of, answers, chunk_size, schema)
+        load_answers = _load_packed if packed_storage.storage_mode(conn) == packed_storage.PACKED else _load_rows
+        load_answers(conn, session_ids, column_of, answers, chunk_size)
+        return cls(session_ids, questions[:, 0], questions[:, 1], answers,
+                   [row[1] for row in sessions], [row[2] for row in sessions])
+
+    def _columns(self, category_id=None):
+        if category_id is None:
+            return slice(None)
+        start, stop = self._category_bounds.get(category_id, (0, 0))
+        return slice(start, stop)
+
+    def session_scores(self, category_id=None):
+        """Mean answer per session (NaN where a session answered nothing)."""
+        block = self.answers[:, self._columns(category_id)]
+        answered = block != MISSING
+        totals = np.where(answered, block, 0).sum(axis=1, dtype=np.int64)
+        counts = answered.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return totals / counts
+
+    def mean_scores(self):
+        """``{category_id: mean answer}`` over every answered question."""
+        result = {}
+        for category_id in self.category_ids.tolist():
+            block = self.answers[:, self._columns(category_id)]
+            answered = block != MISSING
+            n = answered.sum()
+            result[category_id] = float(np.where(answered, block, 0).sum(dtype=np.int64) / n) if n else float("nan")
+        return result
+
+    def compliance_rates(self, threshold=COMPLIANT_FROM):
+        """``{category_id: share of answers >= threshold}``."""
+        result = {}
+        for category_id in self.category_ids.tolist():
+            block = self.answers[:, self._columns(category_id)]
+            answered = block != MISSING
+            n = answered.sum()
+            result[category_id] = float(((block >= threshold) & answered).sum() / n) if n else float("nan")
+        return result
+
+    def answer_distribution(self, category_id=None):
+        """``(question_ids, counts)`` with counts shaped (questions, 6)."""
+        cols = self._columns(category_id)
+        block = self.answers[:, cols]
+        # One comparison pass per answer on the uint8 block; no wider copy of it
+        counts = np.stack([(block == value).sum(axis=0) for value in range(NUM_ANSWERS)], axis=1)
+        return self.question_ids[cols], counts
+
+    def ranking(self, by="sub_centre", category_id=None):
+        """Rank sub-centres or PHCs by their sessions' mean score.
+
+        Returns ``[(name, mean score, sessions), ...]`` best first; sessions
+        that answered nothing in the category are left out.
+        """
+        names, codes = ((self.sub_centre_names, self.sub_centre_codes) if by == "sub_centre"
+                        else (self.phc_names, self.phc_codes))
+        scores = self.session_scores(category_id)
+        scored = ~np.isnan(scores)
+        totals = np.bincount(codes[scored], weights=scores[scored], minlength=len(names))
+        sessions = np.bincount(codes[scored], minlength=len(names))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = totals / sessions
+        order = np.argsort(-np.nan_to_num(means, nan=-1.0), kind="stable")
+        return [(str(names[i]), float(means[i]), int(sessions[i])) for i in order if sessions[i]]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cross-session survey scores.")
+    parser.add_argument("--db", default=database.DB_NAME, help="path to survey.db")
+    parser.add_argument("--by", choices=("sub_centre", "phc"), default="sub_centre", help="ranking group")
+    parser.add_argument("--category", type=int, help="limit the ranking to one category id")
+    parser.add_argument("--top", type=int, default=10, help="ranking rows to show")
+    args = parser.parse_args(argv)
+    database.manager.path = args.db
+    matrix = ResponseMatrix.load()
+    names = dict(database.get_categories())
+    print(f"{len(matrix.session_ids)} sessions x {len(matrix.question_ids)} questions")
+    compliance = matrix.compliance_rates()
+    for category_id, mean in matrix.mean_scores().items():
+        print(f"{names.get(category_id, category_id)}: mean {mean:.2f}, compliance {compliance[category_id]:.1%}")
+    print(f"Top {args.top} by {args.by}:")
+    for name, mean, sessions in matrix.ranking(args.by, args.category)[:args.top]:
+        print(f"  {name or '(blank)'}: {mean:.2f} over {sessions} sessions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,376 @@
+"""Archival of old sessions into per-year or per-quarter database files.
+
+``archive_sessions`` moves every session whose ``day`` is before a cutoff,
+with its answers, out of survey.db into ``archive/survey-<period>.db``
+next to it (``2024`` or ``2024Q1``), so the live tables only hold recent
+visits. The main file keeps what the app needs about archived data:
+
+``archives``
+    one row per archive file, with its path and the range it covers;
+``archived_sessions``
+    which archive each moved session id went to;
+``archived_counts`` / ``archived_trend_daily``
+    the archived answers' counts per question and PHC, and per category,
+    PHC and day, so rollups.py and trends.py still verify and rebuild to
+    all-time totals.
+
+The rollups themselves are left as they are, so the Results screen and
+trends keep showing all-time figures without opening any archive. Only a
+query about one archived session (``responses_by_category``) ATTACHes its
+file, read-only and just for that query. Bulk readers of raw answers
+(exporter.py, analytics.py, reports.py) go through ``each_archive``.
+
+Some old sessions always stay live (``_held_back``): those holding the
+newest session, response and packed row ids, so SQLite never hands out
+an archived id again, and any session with answers above the device's
+push watermark, so nothing is archived before it has been pushed. Until
+a device's first push that means every session with answers.
+
+    python archive.py archive --before 2025-01-01 --period quarter
+    python archive.py status
+"""
+import argparse
+import datetime
+import logging
+import os
+import sys
+from contextlib import contextmanager
+from urllib.request import pathname2url
+
+import packed_storage
+from rollups import ANSWER_COLUMNS
+
+log = logging.getLogger(__name__)
+
+YEAR = "year"
+QUARTER = "quarter"
+_PERIOD_SQL = {
+    YEAR: "substr(day, 1, 4)",
+    QUARTER: "substr(day, 1, 4) || 'Q' || ((CAST(substr(day, 6, 2) AS INTEGER) + 2) / 3)",
+}
+ARCHIVE_DIR = "archive"
+
+_COLS = ", ".join(ANSWER_COLUMNS)
+_ADD_EXCLUDED = ", ".join(f"{c} = {c} + excluded.{c}" for c in ANSWER_COLUMNS)
+_SUM_ANSWERS = ", ".join(f"SUM(r.answer = '{i}')" for i in range(len(ANSWER_COLUMNS)))
+_COUNT_COLUMNS = ", ".join(f"{col} INTEGER NOT NULL DEFAULT 0" for col in ANSWER_COLUMNS)
+
+
+def create_tables(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS archives (
+            name TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            first_day TEXT,
+            last_day TEXT,
+            sessions INTEGER NOT NULL DEFAULT 0,
+            responses INTEGER NOT NULL DEFAULT 0,
+            archived_at TEXT
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS archived_sessions (
+            id INTEGER PRIMARY KEY,
+            uid TEXT,
+            archive TEXT NOT NULL
+        )
+    ''')
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS archived_counts (
+            archive TEXT NOT NULL,
+            question_id INTEGER NOT NULL,
+            phc TEXT NOT NULL,
+            {_COUNT_COLUMNS},
+            PRIMARY KEY (archive, question_id, phc)
+        ) WITHOUT ROWID
+    ''')
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS archived_trend_daily (
+            archive TEXT NOT NULL,
+            category_id INTEGER NOT NULL,
+            phc TEXT NOT NULL,
+            day TEXT NOT NULL,
+            {_COUNT_COLUMNS},
+            PRIMARY KEY (archive, category_id, phc, day)
+        ) WITHOUT ROWID
+    ''')
+
+
+def _create_archive_schema(c, schema):
+    # Archives always hold answers as rows, whatever the live storage mode
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.sessions (
+            id INTEGER PRIMARY KEY,
+            uid TEXT,
+            date TEXT,
+            day TEXT,
+            sub_centre TEXT,
+            location TEXT,
+            phc TEXT,
+            reported_by TEXT,
+            timestamp DATETIME
+        )
+    ''')
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.responses (
+            id INTEGER PRIMARY KEY,
+            session_id INTEGER,
+            question_id INTEGER,
+            answer TEXT,
+            timestamp DATETIME
+        )
+    ''')
+    c.execute(f"CREATE INDEX IF NOT EXISTS {schema}.idx_responses_session_question "
+              "ON responses (session_id, question_id)")
+
+
+def _main_path(conn):
+    return conn.execute("PRAGMA database_list").fetchone()[2] or os.path.join(os.getcwd(), "survey.db")
+
+
+def _relative_path(conn, name):
+    # Relative to survey.db, so the two can be moved together; named after
+    # it so databases sharing a directory do not share archives
+    stem = os.path.splitext(os.path.basename(_main_path(conn)))[0]
+    return os.path.join(ARCHIVE_DIR, f"{stem}-{name}.db")
+
+
+def archive_path(conn, name):
+    """Absolute path of archive ``name``."""
+    row = conn.execute("SELECT path FROM archives WHERE name=?", (name,)).fetchone()
+    return os.path.join(os.path.dirname(_main_path(conn)), row[0] if row else _relative_path(conn, name))
+
+
+@contextmanager
+def attached(conn, name, readonly=True):
+    """ATTACH archive ``name`` for the duration of the block; yields its schema name."""
+    schema = f"archive_{name}"
+    path = archive_path(conn, name)
+    if readonly:
+        # Needs the connection opened with uri=True, as ConnectionManager does
+        conn.execute("ATTACH DATABASE ? AS " + schema, (f"file:{pathname2url(os.path.abspath(path))}?mode=ro",))
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn.execute("ATTACH DATABASE ? AS " + schema, (path,))
+    try:
+        yield schema
+    finally:
+        conn.execute("DETACH DATABASE " + schema)
+
+
+def each_archive(conn, first_day=None, last_day=None):
+    """Attach every archive covering any of ``first_day``..``last_day`` in turn.
+
+    Yields each one's schema name, oldest first; an archive is detached
+    before the next is attached. Missing archive files are skipped with a
+    warning.
+    """
+    clauses, params = [], []
+    if first_day:
+        clauses.append("last_day >= ?")
+        params.append(first_day)
+    if last_day:
+        clauses.append("first_day <= ?")
+        params.append(last_day)
+    where = "WHERE " + " AND ".join(clauses) if clauses else ""
+    for (name,) in conn.execute(f"SELECT name FROM archives {where} ORDER BY first_day, name", params).fetchall():
+        if not os.path.exists(archive_path(conn, name)):
+            log.warning("archive %s is missing from %s; its sessions are left out", name, archive_path(conn, name))
+            continue
+        with attached(conn, name) as schema:
+            yield schema
+
+
+def _has_archives(conn):
+    return conn.execute("SELECT 1 FROM archives LIMIT 1").fetchone() is not None
+
+
+def archive_of(conn, session_id):
+    row = conn.execute("SELECT archive FROM archived_sessions WHERE id=?", (session_id,)).fetchone()
+    return row[0] if row else None
+
+
+def archive_of_uid(conn, uid):
+    row = conn.execute("SELECT archive FROM archived_sessions WHERE uid=?", (uid,)).fetchone()
+    return row[0] if row else None
+
+
+def _held_back(conn):
+    """Ids of sessions that must stay live whatever their age."""
+    import database
+
+    # Row ids are rowids, which SQLite hands out again from the largest one
+    # left. Keeping the sessions that hold the newest session, response and
+    # packed row means archived ids are never reused, and sync's watermarks
+    # can rely on ids only growing.
+    held = {sid for (sid,) in conn.execute('''
+        SELECT MAX(id) FROM sessions
+        UNION SELECT session_id FROM responses WHERE id = (SELECT MAX(id) FROM responses)
+        UNION SELECT session_id FROM packed_responses WHERE id = (SELECT MAX(id) FROM packed_responses)''')
+        if sid is not None}
+    # Sessions with answers not pushed yet stay too, since push only reads
+    # the live tables; before the first push that is every session with
+    # answers. A sync server merges rather than pushes, so it has none.
+    if conn.execute("SELECT 1 FROM sync_changes LIMIT 1").fetchone() is None:
+        for table in ("responses", "packed_responses"):
+            watermark = int(database.get_meta(conn, database.WATERMARK_PREFIX + table, 0))
+            held.update(sid for (sid,) in conn.execute(
+                f"SELECT DISTINCT session_id FROM {table} WHERE id > ?", (watermark,)))
+    return held
+
+
+def _sessions_to_archive(conn, before, period):
+    rows = conn.execute(f"SELECT {_PERIOD_SQL[period]}, id FROM sessions WHERE day < ? ORDER BY id",
+                        (before,)).fetchall()
+    held = _held_back(conn)
+    by_name = {}
+    for name, sid in rows:
+        if sid not in held:
+            by_name.setdefault(name, []).append(sid)
+    return by_name
+
+
+def _archive_one(conn, name, session_ids):
+    source = packed_storage.response_source(conn)
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS archive_moving (id INTEGER PRIMARY KEY)")
+    moving = "SELECT id FROM temp.archive_moving"
+    try:
+        # First copy into the archive and commit there. The copy replaces
+        # whatever an interrupted earlier run left, so if anything fails
+        # before the live rows are deleted below, rerunning is safe.
+        with attached(conn, name, readonly=False) as schema:
+            _create_archive_schema(conn, schema)
+            with conn:
+                conn.execute("DELETE FROM temp.archive_moving")
+                conn.executemany("INSERT INTO temp.archive_moving (id) VALUES (?)", [(sid,) for sid in session_ids])
+                conn.execute(f'''INSERT OR REPLACE INTO {schema}.sessions
+                                 (id, uid, date, day, sub_centre, location, phc, reported_by, timestamp)
+                                 SELECT id, uid, date, day, sub_centre, location, phc, reported_by, timestamp
+                                 FROM main.sessions WHERE id IN ({moving})''')
+                conn.execute(f"DELETE FROM {schema}.responses WHERE session_id IN ({moving})")
+                conn.execute(f'''INSERT INTO {schema}.responses (session_id, question_id, answer, timestamp)
+                                 SELECT session_id, question_id, answer, timestamp
+                                 FROM main.{source} WHERE session_id IN ({moving})''')
+                summary = conn.execute(f"SELECT MIN(day), MAX(day), COUNT(*), "
+                                       f"(SELECT COUNT(*) FROM {schema}.responses) FROM {schema}.sessions").fetchone()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(f'''
+                INSERT INTO archived_counts (archive, question_id, phc, {_COLS})
+                SELECT ?, r.question_id, COALESCE(s.phc, ''), {_SUM_ANSWERS}
+                FROM {source} r JOIN sessions s ON s.id = r.session_id
+                WHERE r.session_id IN ({moving})
+                GROUP BY r.question_id, COALESCE(s.phc, '')
+                ON CONFLICT(archive, question_id, phc) DO UPDATE SET {_ADD_EXCLUDED}''', (name,))
+            conn.execute(f'''
+                INSERT INTO archived_trend_daily (archive, category_id, phc, day, {_COLS})
+                SELECT ?, q.category_id, COALESCE(s.phc, ''), s.day, {_SUM_ANSWERS}
+                FROM {source} r JOIN sessions s ON s.id = r.session_id JOIN questions q ON q.id = r.question_id
+                WHERE r.session_id IN ({moving}) AND s.day IS NOT NULL
+                GROUP BY q.category_id, COALESCE(s.phc, ''), s.day
+                ON CONFLICT(archive, category_id, phc, day) DO UPDATE SET {_ADD_EXCLUDED}''', (name,))
+            conn.execute(f"INSERT OR REPLACE INTO archived_sessions (id, uid, archive) "
+                         f"SELECT id, uid, ? FROM sessions WHERE id IN ({moving})", (name,))
+            conn.execute(f"DELETE FROM responses WHERE session_id IN ({moving})")
+            conn.execute(f"DELETE FROM packed_responses WHERE session_id IN ({moving})")
+            conn.execute(f"DELETE FROM sessions WHERE id IN ({moving})")
+            conn.execute('''INSERT OR REPLACE INTO archives
+                            (name, path, first_day, last_day, sessions, responses, archived_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                         (name, _relative_path(conn, name), *summary,
+                          datetime.datetime.now().isoformat(timespec="seconds")))
+    finally:
+        conn.execute("DROP TABLE IF EXISTS temp.archive_moving")
+
+
+def archive_sessions(conn, before, period=YEAR):
+    """Move sessions whose ``day`` is before ``before`` into archive files.
+
+    Returns ``{archive name: sessions moved}``. Rollups are not touched:
+    they go on counting archived answers.
+    """
+    moved = {}
+    for name, session_ids in sorted(_sessions_to_archive(conn, before, period).items()):
+        _archive_one(conn, name, session_ids)
+        moved[name] = len(session_ids)
+    return moved
+
+
+def responses_by_category(conn, category_id, session_id):
+    """get_responses_by_category rows for one archived session, read from its archive."""
+    with attached(conn, archive_of(conn, session_id)) as schema:
+        return conn.execute(f'''
+            SELECT q.id, q.question_text, r.answer, COUNT(r.id)
+            FROM questions q
+            LEFT JOIN {schema}.responses r ON q.id = r.question_id AND r.session_id = ?
+            WHERE q.category_id=? AND q.retired = 0
+            GROUP BY q.id, r.answer
+            ORDER BY q.id
+        ''', (session_id, category_id)).fetchall()
+
+
+def add_archived_counts(conn, category_id, rows):
+    """Fold archived answers into live ``(question_id, text, answer, count)`` rows."""
+    if not _has_archives(conn):
+        return rows
+    archived = {qid: counts for qid, *counts in conn.execute(f'''
+        SELECT a.question_id, {", ".join(f"SUM(a.{col})" for col in ANSWER_COLUMNS)}
+        FROM archived_counts a JOIN questions q ON q.id = a.question_id
+        WHERE q.category_id=?
+        GROUP BY a.question_id''', (category_id,))}
+    if not archived:
+        return rows
+    texts = {}
+    answers = {}
+    for qid, text, answer, count in rows:
+        texts[qid] = text
+        by_answer = answers.setdefault(qid, {})
+        if answer is not None:
+            by_answer[answer] = by_answer.get(answer, 0) + count
+    for qid, counts in archived.items():
+        if qid in answers:
+            for i, n in enumerate(counts):
+                if n:
+                    answers[qid][str(i)] = answers[qid].get(str(i), 0) + n
+    merged = []
+    for qid, by_answer in answers.items():
+        if by_answer:
+            merged.extend((qid, texts[qid], answer, by_answer[answer]) for answer in sorted(by_answer))
+        else:
+            merged.append((qid, texts[qid], None, 0))
+    return merged
+
+
+def main(argv=None):
+    import database
+    from migrations import create_db
+
+    parser = argparse.ArgumentParser(description="Move old sessions into per-period archive files.")
+    parser.add_argument("command", choices=("archive", "status"))
+    parser.add_argument("--db", default=database.DB_NAME, help="path to survey.db")
+    parser.add_argument("--before", help="archive sessions before this day (YYYY-MM-DD)")
+    parser.add_argument("--older-than", type=int, metavar="DAYS", help="archive sessions older than this many days")
+    parser.add_argument("--period", choices=(YEAR, QUARTER), default=YEAR, help="one archive file per year or quarter")
+    args = parser.parse_args(argv)
+    database.manager.path = args.db
+    conn = database.get_connection()
+    create_db(conn)
+    if args.command == "archive":
+        if args.before:
+            before = args.before
+        elif args.older_than is not None:
+            before = (datetime.date.today() - datetime.timedelta(days=args.older_than)).isoformat()
+        else:
+            parser.error("archive needs --before or --older-than")
+        for name, n in archive_sessions(conn, before, args.period).items():
+            print(f"{name}: {n} sessions archived")
+    live = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+    print(f"{live} live sessions")
+    for name, path, first_day, last_day, sessions, responses in conn.execute(
+            "SELECT name, path, first_day, last_day, sessions, responses FROM archives ORDER BY name"):
+        print(f"{name}: {sessions} sessions, {responses} responses, {first_day} to {last_day} in {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,442 @@
+"""Micro-benchmarks for the survey data paths.
+
+Run ``python bench.py submit`` to check that saving a category's answers
+stays within its latency budget regardless of how many questions it has,
+``python bench.py queue`` to measure what a queued save costs the UI thread,
+``python bench.py plans`` to check that the results queries are served from
+indexes, ``python bench.py storage`` to compare database size and
+aggregation speed of row and packed answer storage, ``python bench.py
+charts`` to compare the native Kivy chart widget with the matplotlib PNG
+path, ``python bench.py reports`` to time the sub-centre report generator
+with one worker and with one per core, ``python bench.py search`` to time
+session-picker type-ahead over 100k sessions, or ``python bench.py startup``
+to enforce the time-to-first-frame budget. The process exits non-zero when a
+target is missed.
+
+``python bench.py dataset`` times the main data and Results paths against
+seeded synthetic databases of each ``--sessions`` size (default 1k, 10k and
+100k). Pass ``--json results.json`` to keep the numbers for comparing runs::
+
+    python bench.py dataset --sessions 1000,10000 --seed 1 --json before.json
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+import database
+import datagen
+import packed_storage
+from charts import chart_cache
+from migrations import create_db
+from write_queue import write_queue
+
+# Saving any category must stay under this. The bulk path commits once, so
+# its cost is dominated by a single fsync rather than one per question.
+SUBMIT_TARGET_MS = 30.0
+
+DATASET_SIZES = (1000, 10000, 100000)
+
+# Each keystroke of a session-picker search must come back within this
+SEARCH_TARGET_MS = 10.0
+# What a user might type, one prefix per keystroke
+SEARCH_TYPING = ("phc 3 sc 3-2", "village 7", "surveyor 12", "sc 1-")
+
+# Structured results of the benchmarks that produce them, for --json
+report = {}
+
+
+def _use_temp_database(workdir):
+    database.manager.close_all()
+    database.manager.path = os.path.join(workdir, "bench.db")
+    create_db()
+
+
+def _database_bytes():
+    # Fold the WAL back in first, or the file size misses recent writes
+    database.get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return os.path.getsize(database.manager.path)
+
+
+def _median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def bench_submit(repeat=25, sizes=(17, 24, 25, 45)):
+    session = iter(range(1, 10 ** 9))
+    worst = 0.0
+    for n in sizes:
+        answers = [(qid, str(qid % 6)) for qid in range(1, n + 1)]
+
+        def per_row():
+            sid = next(session)
+            for qid, answer in answers:
+                database.insert_response(sid, qid, answer)
+
+        bulk = _median_ms(lambda: database.insert_responses(next(session), answers), repeat)
+        single = _median_ms(per_row, repeat)
+        worst = max(worst, bulk)
+        print(f"submit  {n:4d} questions  bulk {bulk:8.3f} ms  per-row {single:8.3f} ms  x{single / max(bulk, 1e-6):.1f}")
+    ok = worst <= SUBMIT_TARGET_MS
+    print(f"submit  worst {worst:.3f} ms (target {SUBMIT_TARGET_MS} ms) -> {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+def bench_queue(saves=200, questions=25):
+    # What the UI thread pays per save, against the writer thread's latency
+    answers = [(qid, str(qid % 6)) for qid in range(1, questions + 1)]
+    sessions = iter(range(10 ** 6, 10 ** 9))
+    enqueue = _median_ms(lambda: write_queue.submit(
+        lambda conn, sid=next(sessions): database.add_responses(conn, sid, answers)), saves)
+    start = time.perf_counter()
+    write_queue.flush()
+    drain = (time.perf_counter() - start) * 1000
+    stats = write_queue.stats()
+    ok = stats["failed"] == 0
+    print(f"queue   {saves} saves  enqueue {enqueue:8.3f} ms  drain {drain:8.1f} ms  {stats['batches']} batches  "
+          f"latency avg {stats['latency_avg'] * 1000:.1f} ms max {stats['latency_max'] * 1000:.1f} ms -> {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+def bench_plans():
+    try:
+        plans = database.check_query_plans()
+    except RuntimeError as e:
+        print(f"plans   {e} -> FAIL")
+        return False
+    for name, details in plans.items():
+        print(f"plans   {name}: {' | '.join(details)}")
+    print("plans   no table scans -> OK")
+    return True
+
+
+def bench_storage(sessions=2000, repeat=5, seed=0):
+    # Same synthetic visits stored both ways, each in its own database
+    path = database.manager.path
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            for mode in (packed_storage.ROWS, packed_storage.PACKED):
+                os.mkdir(os.path.join(workdir, mode))
+                _use_temp_database(os.path.join(workdir, mode))
+                conn = database.get_connection()
+                packed_storage.convert(conn, mode)
+                datagen.generate(conn, sessions, seed)
+                conn.execute("VACUUM")
+                size = _database_bytes()
+                categories = [cid for cid, _ in database.get_categories()]
+                read = _median_ms(lambda: [database.get_responses_by_category(cid) for cid in categories], repeat)
+                results[mode] = (size, read, database.get_responses_by_category(categories[0]))
+                print(f"storage {mode:6s} {sessions} sessions  {size / 1024:9.1f} KiB  all categories {read:8.3f} ms")
+    finally:
+        database.manager.close_all()
+        database.manager.path = path
+    (rows_size, rows_read, rows_result), (packed_size, packed_read, packed_result) = results.values()
+    ok = rows_result == packed_result
+    print(f"storage packed is {rows_size / packed_size:.1f}x smaller and {rows_read / max(packed_read, 1e-6):.1f}x faster "
+          f"to aggregate; results {'match' if ok else 'DIFFER'} -> {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+def _time_data_paths(sessions, seed, repeat):
+    timings = {}
+    start = time.perf_counter()
+    create_db()
+    timings["create_db_new_ms"] = (time.perf_counter() - start) * 1000
+    conn = database.get_connection()
+    start = time.perf_counter()
+    datagen.generate(conn, sessions, seed)
+    timings["generate_s"] = time.perf_counter() - start
+
+    # Reopening an up-to-date database, as on every app start
+    database.manager.close_all()
+    start = time.perf_counter()
+    create_db()
+    timings["create_db_open_ms"] = (time.perf_counter() - start) * 1000
+    conn = database.get_connection()
+
+    def submit_details():
+        with conn:
+            return database.add_session(conn, uuid.uuid4().hex, "2026-01-01", "SC", "Village", "PHC 1", "bench")
+
+    timings["submit_details_ms"] = _median_ms(submit_details, repeat)
+    session_id = submit_details()
+    category_id, name = database.get_categories()[1]
+    answers = [(qid, str(qid % 6)) for qid, _ in database.get_questions_by_category(category_id)]
+    timings["insert_responses_ms"] = _median_ms(lambda: database.insert_responses(session_id, answers), repeat)
+
+    categories = [cid for cid, _ in database.get_categories()]
+    timings["responses_by_category_ms"] = _median_ms(
+        lambda: [database.get_responses_by_category(cid) for cid in categories], repeat) / len(categories)
+    timings["responses_by_session_ms"] = _median_ms(
+        lambda: [database.get_responses_by_category(cid, session_id) for cid in categories], repeat) / len(categories)
+    timings["db_bytes"] = _database_bytes()
+    return timings
+
+
+def _time_results_screen(databases, repeat):
+    """Time create_pie_chart and show_results_for_category inside the real app.
+
+    Returns ``{sessions: {name: ms}}``, or None when Kivy cannot open a window.
+    """
+    try:
+        os.environ.setdefault("KIVY_NO_ARGS", "1")
+        from kivy.core.window import Window  # noqa: F401  creates the GL context
+        from kivy.clock import Clock
+        from kivy.uix.screenmanager import NoTransition
+        from main import SurveyApp
+    except Exception as e:
+        print(f"dataset Results screen skipped: {e}")
+        return None
+    timings = {}
+
+    class ResultsBenchApp(SurveyApp):
+        def build(self):
+            root = super().build()
+            chart_cache.disk_dir = None
+            return root
+
+        def on_start(self):
+            self.root.transition = NoTransition()
+            self.root.current = "results"
+            self.screen = self.root.get_screen("results")
+            self.pending = iter(databases)
+            Clock.schedule_once(self.open_next)
+
+        def open_next(self, dt):
+            try:
+                sessions, path = next(self.pending)
+            except StopIteration:
+                self.stop()
+                return
+            database.manager.close_all()
+            database.manager.path = path
+            create_db()
+            # Let the screen lay out with real data before anything is timed
+            self.screen.refresh_categories()
+            self.screen.show_results_for_category(database.get_categories()[0][0])
+            Clock.schedule_once(lambda dt: self.run_bench(sessions), 0.2)
+
+        def run_bench(self, sessions):
+            try:
+                screen = self.screen
+                categories = [cid for cid, _ in database.get_categories()]
+                counts = [counts for _, _, counts in database.get_answer_counts(categories[0])]
+                seeds = iter(range(10 ** 9))
+
+                def pie_chart():
+                    chart_cache.clear()
+                    screen.create_pie_chart(counts[next(seeds) % len(counts)])
+
+                def show_results():
+                    for cid in categories:
+                        screen.show_results_for_category(cid)
+                        # Build the visible rows now rather than on the next frame
+                        screen.result_view.refresh_views()
+
+                timings[sessions] = {
+                    "create_pie_chart_ms": _median_ms(pie_chart, repeat),
+                    "show_results_for_category_ms": _median_ms(show_results, repeat) / len(categories),
+                    "result_rows": len(screen.result_view.layout_manager.children),
+                }
+            except Exception:
+                self.stop()
+                raise
+            Clock.schedule_once(self.open_next)
+
+    ResultsBenchApp().run()
+    return timings
+
+
+def bench_dataset(sizes=DATASET_SIZES, seed=0, repeat=5):
+    path = database.manager.path
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            databases = []
+            for sessions in sizes:
+                database.manager.close_all()
+                database.manager.path = os.path.join(workdir, f"{sessions}.db")
+                results[sessions] = _time_data_paths(sessions, seed, repeat)
+                databases.append((sessions, database.manager.path))
+            for sessions, timings in (_time_results_screen(databases, repeat) or {}).items():
+                results[sessions].update(timings)
+    finally:
+        database.manager.close_all()
+        database.manager.path = path
+    for sessions, timings in results.items():
+        print(f"dataset {sessions:7d} sessions  " + "  ".join(
+            f"{name} {value:.3f}" for name, value in timings.items() if name != "db_bytes")
+            + f"  db {timings['db_bytes'] / 2 ** 20:.1f} MiB")
+    report["dataset"] = {"seed": seed, "sessions": {str(n): timings for n, timings in results.items()}}
+    return True
+
+
+def bench_charts(repeat=20):
+    # Needs Kivy (with a window for texture uploads) and matplotlib
+    try:
+        os.environ.setdefault("KIVY_NO_ARGS", "1")
+        from kivy.core.window import Window  # noqa: F401  creates the GL context
+        from chart_widgets import AnswerChart
+        from main import ResultsScreen
+    except Exception as e:
+        print(f"charts  skipped: {e}")
+        return True
+    screen = ResultsScreen(name="bench")
+    counts = [[(seed * (i + 3)) % 7 for i in range(6)] for seed in range(repeat)]
+    seeds = iter(range(10 ** 9))
+
+    def matplotlib_chart():
+        chart_cache.clear()
+        screen.create_pie_chart(counts[next(seeds) % repeat])
+
+    chart = AnswerChart(size=(400, 160))
+
+    def native_update():
+        chart.counts = counts[next(seeds) % repeat]
+
+    native_new = _median_ms(lambda: AnswerChart(counts=counts[next(seeds) % repeat], size=(400, 160)), repeat)
+    native = _median_ms(native_update, repeat)
+    png = _median_ms(matplotlib_chart, repeat)
+    print(f"charts  create_pie_chart {png:8.3f} ms  AnswerChart new {native_new:8.3f} ms  "
+          f"update {native:8.3f} ms  x{png / max(native_new, 1e-6):.1f}")
+    return True
+
+
+def bench_reports(sessions=200, seed=0):
+    # Same data rendered with one worker and with one per core, each into a
+    # fresh directory so neither run reuses the other's chart cache
+    try:
+        import reports
+        from charts import preload_matplotlib
+        preload_matplotlib()
+    except ImportError as e:
+        print(f"reports skipped: {e}")
+        return True
+    datagen.generate(database.get_connection(), sessions, seed)
+    cores = os.cpu_count() or 1
+    seconds = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for workers in sorted({1, cores}):
+            stats = reports.generate_reports(os.path.join(workdir, str(workers)), workers=workers)
+            seconds[workers] = stats["seconds"]
+            print(f"reports {workers:2d} workers  {stats['reports']} reports  {stats['unique_charts']}/{stats['charts']} "
+                  f"charts rendered  {stats['seconds']:.1f} s")
+    if cores > 1:
+        print(f"reports x{seconds[1] / seconds[cores]:.1f} faster on {cores} cores")
+    report["reports"] = {"sessions": sessions, "seconds_by_workers": seconds}
+    return True
+
+
+def bench_search(sessions=100000, seed=0, repeat=5):
+    import session_search
+    conn = database.get_connection()
+    if sessions > conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]:
+        datagen.generate(conn, sessions, seed)
+    if not session_search.available(conn):
+        print("search  no FTS5 in this SQLite, using the LIKE fallback")
+    timings = {}
+    for text in SEARCH_TYPING:
+        for end in range(1, len(text) + 1):
+            prefix = text[:end]
+            if prefix.strip() and prefix not in timings:
+                timings[prefix] = _median_ms(lambda: database.search_sessions(prefix), repeat)
+    worst = max(timings, key=timings.get)
+    ok = timings[worst] <= SEARCH_TARGET_MS
+    for text in SEARCH_TYPING:
+        print(f"search  {text!r:16s} {timings[text]:7.3f} ms  {len(database.search_sessions(text))} shown")
+    print(f"search  {sessions} sessions, {len(timings)} keystrokes, worst {timings[worst]:.3f} ms ({worst!r}) "
+          f"(target {SEARCH_TARGET_MS} ms) -> {'OK' if ok else 'FAIL'}")
+    report["search"] = {"sessions": sessions, "keystrokes_ms": timings}
+    return ok
+
+
+def bench_startup():
+    # Launches the real app, which quits after its first frame and exits
+    # non-zero when it misses SURVEY_STARTUP_BUDGET_MS
+    try:
+        import kivy  # noqa: F401
+    except ImportError as e:
+        print(f"startup skipped: {e}")
+        return True
+    import json
+    import subprocess
+    with tempfile.TemporaryDirectory() as workdir:
+        report_path = os.path.join(workdir, "startup.json")
+        env = dict(os.environ, SURVEY_STARTUP_PROFILE=report_path, KIVY_NO_ARGS="1")
+        main_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "main.py")
+        proc = subprocess.run([sys.executable, main_py], cwd=workdir, env=env)
+        if not os.path.exists(report_path):
+            print(f"startup no report written (exit {proc.returncode}) -> FAIL")
+            return False
+        with open(report_path) as f:
+            report = json.load(f)
+    phases = "  ".join(f"{name} {ms:.1f}" for name, ms in report["phases_ms"].items())
+    ok = proc.returncode == 0 and report["within_budget"]
+    print(f"startup first frame {report['first_frame_ms']:.1f} ms  ({phases}) -> {'OK' if ok else 'FAIL'}")
+    return ok
+
+
+BENCHMARKS = {
+    "charts": bench_charts,
+    "dataset": bench_dataset,
+    "startup": bench_startup,
+    "plans": bench_plans,
+    "queue": bench_queue,
+    "reports": bench_reports,
+    "search": bench_search,
+    "storage": bench_storage,
+    "submit": bench_submit,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("names", nargs="*", metavar="name", help="benchmarks to run: %s (default: all)" % ", ".join(sorted(BENCHMARKS)))
+    parser.add_argument("--sessions", default=",".join(map(str, DATASET_SIZES)),
+                        help="comma-separated dataset sizes (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="synthetic data seed")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error("unknown benchmark: %s" % ", ".join(sorted(unknown)))
+    try:
+        sizes = [int(n) for n in args.sessions.split(",")]
+    except ValueError:
+        parser.error(f"--sessions must be comma-separated numbers, not {args.sessions}")
+    options = {"dataset": {"sizes": sizes, "seed": args.seed}, "reports": {"seed": args.seed},
+               "search": {"seed": args.seed}, "storage": {"seed": args.seed}}
+    outcomes = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        _use_temp_database(workdir)
+        for name in args.names or sorted(BENCHMARKS):
+            outcomes[name] = BENCHMARKS[name](**options.get(name, {}))
+        write_queue.close()
+        database.manager.close_all()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({
+                "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "sqlite": sqlite3.sqlite_version,
+                "platform": platform.platform(),
+                "ok": outcomes,
+                **report,
+            }, f, indent=2)
+    return 0 if all(outcomes.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
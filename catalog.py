@@ -0,0 +1,108 @@
+"""In-memory catalog of survey categories and questions.
+
+The question bank only changes when a migration reseeds it, so it is read
+from survey.db once and kept as immutable ``__slots__`` records indexed by
+category id and question id. Retired questions (dropped from the bank but
+still referenced by stored answers) are left out of the category lists,
+yet ``question()`` still finds them by id. ``get_catalog()`` builds it on first use;
+migrations.create_db calls ``invalidate()`` whenever it changes the schema
+or question bank, and the next caller rebuilds it.
+"""
+import threading
+
+
+class _Record:
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__ if name != "questions")
+        return f"{type(self).__name__}({fields})"
+
+
+class Question(_Record):
+    # position is the question's index within its category; None if retired
+    __slots__ = ("id", "category_id", "position", "text")
+
+
+class Category(_Record):
+    __slots__ = ("id", "name", "questions")
+
+
+class Catalog:
+    __slots__ = ("categories", "retired", "_categories", "_questions")
+
+    def __init__(self, categories, retired=()):
+        self.categories = tuple(categories)
+        self.retired = tuple(retired)
+        self._categories = {category.id: category for category in self.categories}
+        self._questions = {question.id: question for question in self.retired}
+        self._questions.update(
+            (question.id, question) for category in self.categories for question in category.questions)
+
+    @classmethod
+    def load(cls, conn):
+        rows = {}
+        retired = []
+        for qid, category_id, text, is_retired in conn.execute(
+                "SELECT id, category_id, question_text, retired FROM questions ORDER BY category_id, id"):
+            if is_retired:
+                retired.append(Question(qid, category_id, None, text))
+                continue
+            questions = rows.setdefault(category_id, [])
+            questions.append(Question(qid, category_id, len(questions), text))
+        # A category whose questions were all retired has left the bank too
+        retired_only = {question.category_id for question in retired} - rows.keys()
+        return cls((Category(category_id, name, tuple(rows.get(category_id, ())))
+                    for category_id, name in conn.execute("SELECT id, name FROM survey_categories ORDER BY id")
+                    if category_id not in retired_only), retired)
+
+    def category(self, category_id):
+        return self._categories.get(category_id)
+
+    def question(self, question_id):
+        return self._questions.get(question_id)
+
+    def questions(self, category_id):
+        category = self._categories.get(category_id)
+        return category.questions if category else ()
+
+    def category_name(self, category_id):
+        category = self._categories.get(category_id)
+        return category.name if category else ""
+
+    def __len__(self):
+        return len(self._questions)
+
+
+_catalog = None
+_lock = threading.Lock()
+
+
+def get_catalog(conn=None):
+    global _catalog
+    catalog = _catalog
+    if catalog is None:
+        with _lock:
+            if _catalog is None:
+                if conn is None:
+                    from database import get_connection
+                    conn = get_connection()
+                _catalog = Catalog.load(conn)
+            catalog = _catalog
+    return catalog
+
+
+def invalidate():
+    global _catalog
+    with _lock:
+        _catalog = None
@@ -0,0 +1,92 @@
+"""Answer-distribution charts drawn directly with Kivy graphics instructions.
+
+``AnswerChart`` shows one question's six answer counts as a pie (``Ellipse``
+segments) or bar chart (``Rectangle``) with a Bad..Excellent legend. The
+instructions and legend labels are created once and updated in place
+whenever ``counts`` changes, so there is no figure, PNG encode or texture
+upload per chart and matplotlib never has to be imported.
+"""
+from kivy.graphics import Color, Ellipse, Rectangle
+from kivy.metrics import dp
+from kivy.properties import ListProperty, OptionProperty
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.label import Label
+from kivy.uix.widget import Widget
+from kivy.utils import get_color_from_hex
+
+from charts import PIE_COLORS, PIE_LABELS
+
+
+class _LegendRow(BoxLayout):
+    def __init__(self, color, **kwargs):
+        super().__init__(orientation='horizontal', spacing=dp(6), size_hint_y=None, height=dp(18), **kwargs)
+        self.swatch = Widget(size_hint=(None, None), size=(dp(12), dp(12)))
+        with self.swatch.canvas:
+            Color(*color)
+            self._swatch_rect = Rectangle(pos=self.swatch.pos, size=self.swatch.size)
+        self.swatch.bind(pos=self._update_swatch, size=self._update_swatch)
+        self.label = Label(font_size=12, color=(0.2, 0.2, 0.2, 1), halign='left', valign='middle')
+        self.label.bind(size=lambda instance, value: setattr(instance, 'text_size', value))
+        self.add_widget(self.swatch)
+        self.add_widget(self.label)
+
+    def _update_swatch(self, *args):
+        self._swatch_rect.pos = (self.swatch.x, self.swatch.center_y - dp(6))
+        self._swatch_rect.size = (dp(12), dp(12))
+
+
+class AnswerChart(BoxLayout):
+    counts = ListProperty([0] * len(PIE_LABELS))
+    kind = OptionProperty('pie', options=('pie', 'bar'))
+
+    def __init__(self, **kwargs):
+        super().__init__(orientation='horizontal', spacing=dp(10), padding=dp(4), **kwargs)
+        self._colors = [get_color_from_hex(c) for c in PIE_COLORS]
+        self.plot = Widget()
+        self._shapes = []
+        with self.plot.canvas:
+            for color in self._colors:
+                Color(*color)
+                self._shapes.append((Ellipse(size=(0, 0)), Rectangle(size=(0, 0))))
+        self.legend = BoxLayout(orientation='vertical', size_hint_x=0.45, spacing=dp(2))
+        self._rows = [_LegendRow(color) for color in self._colors]
+        for row in self._rows:
+            self.legend.add_widget(row)
+        self.add_widget(self.plot)
+        self.add_widget(self.legend)
+        self.plot.bind(pos=self._redraw, size=self._redraw)
+        self.bind(counts=self._redraw, kind=self._redraw)
+        self._redraw()
+
+    def _redraw(self, *args):
+        counts = [max(0, int(c)) for c in self.counts]
+        total = sum(counts)
+        for row, label, count in zip(self._rows, PIE_LABELS, counts):
+            row.opacity = 1 if count else 0
+            row.label.text = f"{label} ({count})  {100.0 * count / total:.1f}%" if count else ""
+        if self.kind == 'pie':
+            self._draw_pie(counts, total)
+        else:
+            self._draw_bars(counts)
+
+    def _draw_pie(self, counts, total):
+        diameter = min(self.plot.width, self.plot.height)
+        pos = (self.plot.center_x - diameter / 2, self.plot.center_y - diameter / 2)
+        # Start at 12 o'clock and run counter-clockwise, like matplotlib's startangle=90
+        angle = 0.0
+        for (ellipse, rect), count in zip(self._shapes, counts):
+            rect.size = (0, 0)
+            sweep = 360.0 * count / total if total else 0.0
+            ellipse.pos = pos
+            ellipse.size = (diameter, diameter) if sweep else (0, 0)
+            ellipse.angle_start = -angle
+            ellipse.angle_end = -(angle + sweep)
+            angle += sweep
+
+    def _draw_bars(self, counts):
+        peak = max(counts) or 1
+        slot = self.plot.width / len(counts)
+        for i, ((ellipse, rect), count) in enumerate(zip(self._shapes, counts)):
+            ellipse.size = (0, 0)
+            rect.pos = (self.plot.x + i * slot + slot * 0.15, self.plot.y)
+            rect.size = (slot * 0.7, self.plot.height * count / peak)
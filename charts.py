@@ -0,0 +1,280 @@
+"""Answer-distribution chart rendering and caching.
+
+``render_pie_png`` draws one question's counts with matplotlib's Agg
+backend and returns PNG bytes; nothing here depends on Kivy, and
+matplotlib is only imported on first render. ``ChartCache`` keeps recently
+used charts keyed on the six-element counts tuple plus the render size,
+bounded by entry count and texture bytes, with an optional on-disk PNG
+tier that survives restarts. ``ChartRenderer`` runs the rendering on a
+small worker pool so the UI thread only uploads textures.
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import instrument
+
+log = logging.getLogger(__name__)
+
+PIE_LABELS = ["Bad", "Poor", "Avg", "Optimum", "Good", "Excellent"]
+# One fixed colour per answer so every renderer shows the same slice colours
+PIE_COLORS = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b"]
+PIE_FIGSIZE = (4, 3)
+PIE_DPI = 100
+
+
+def preload_matplotlib():
+    # matplotlib is imported lazily so the app can run on the native Kivy
+    # charts without ever loading it; this pays the import cost up front
+    from matplotlib import use as mpl_use
+    mpl_use('Agg')
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+    return Figure, FigureCanvasAgg
+
+
+@instrument.timed("chart.render_pie_png")
+def render_pie_png(counts, figsize=PIE_FIGSIZE, dpi=PIE_DPI):
+    Figure, FigureCanvasAgg = preload_matplotlib()
+
+    # Remove zero-counts for better pie chart
+    filtered_counts = []
+    filtered_labels = []
+    filtered_colors = []
+    for count, label, color in zip(counts, PIE_LABELS, PIE_COLORS):
+        if count > 0:
+            filtered_counts.append(count)
+            filtered_labels.append(f"{label} ({count})")
+            filtered_colors.append(color)
+
+    if not filtered_counts:
+        filtered_counts = [1]
+        filtered_labels = ["No Data"]
+        filtered_colors = None
+
+    # Build the figure without pyplot: its global state is not thread-safe,
+    # and these are rendered from worker threads
+    fig = Figure(figsize=figsize)
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    ax.pie(filtered_counts, labels=filtered_labels, colors=filtered_colors, autopct='%1.1f%%', startangle=90)
+    ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle
+
+    buf = BytesIO()
+    fig.tight_layout()
+    fig.savefig(buf, format='png', dpi=dpi)
+    return buf.getvalue()
+
+
+def chart_key(counts, figsize=PIE_FIGSIZE, dpi=PIE_DPI):
+    return (tuple(int(c) for c in counts), tuple(figsize), dpi)
+
+
+class ChartCache:
+    """LRU cache of rendered charts.
+
+    The memory tier holds whatever the caller renders into (Kivy textures in
+    the app) and evicts least recently used entries once either
+    ``max_entries`` or ``max_bytes`` is exceeded. When ``disk_dir`` is set,
+    PNG bytes are also kept on disk so a restart does not re-render them.
+    The disk tier is capped at ``max_disk_files`` and ``max_disk_bytes``
+    (None for no cap): past either, the least recently used files, by
+    mtime, are deleted until it is back under 90% of the cap.
+    """
+
+    def __init__(self, max_entries=128, max_bytes=32 * 1024 * 1024, disk_dir=None,
+                 max_disk_files=2000, max_disk_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.max_disk_files = max_disk_files
+        self.max_disk_bytes = max_disk_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_lock = threading.Lock()
+        # Files and bytes in disk_dir; counted on the first put_png
+        self._disk_usage = None
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, nbytes):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self._entries[key] = (value, nbytes)
+            self.bytes += nbytes
+            while self._entries and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+                _, (_, evicted_bytes) = self._entries.popitem(last=False)
+                self.bytes -= evicted_bytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def _disk_path(self, key):
+        digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()
+        return os.path.join(self.disk_dir, digest + ".png")
+
+    def get_png(self, key):
+        if not self.disk_dir:
+            return None
+        path = self._disk_path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            # Pruning goes by mtime, so a hit keeps the file
+            os.utime(path)
+        except OSError:
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        return data
+
+    def put_png(self, key, data):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            tmp = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError:
+            return
+        if self.max_disk_files is None and self.max_disk_bytes is None:
+            return
+        with self._disk_lock:
+            if self._disk_usage is None:
+                self._disk_usage = self._count_disk()
+            else:
+                files, nbytes = self._disk_usage
+                self._disk_usage = (files + 1, nbytes + len(data))
+            if self._over_disk_cap(*self._disk_usage, 1.0):
+                self._prune_disk()
+
+    def _over_disk_cap(self, files, nbytes, fraction):
+        return ((self.max_disk_files is not None and files > self.max_disk_files * fraction)
+                or (self.max_disk_bytes is not None and nbytes > self.max_disk_bytes * fraction))
+
+    def _disk_files(self):
+        try:
+            with os.scandir(self.disk_dir) as entries:
+                return [(entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                        for entry in entries if entry.name.endswith(".png")]
+        except OSError:
+            return []
+
+    def _count_disk(self):
+        files = self._disk_files()
+        return len(files), sum(size for _, size, _ in files)
+
+    def _prune_disk(self):
+        files = sorted(self._disk_files())
+        count, nbytes = len(files), sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if not self._over_disk_cap(count, nbytes, 0.9):
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            count -= 1
+            nbytes -= size
+            self.disk_evictions += 1
+        self._disk_usage = (count, nbytes)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions,
+            }
+
+
+class ChartRenderer:
+    """Renders pie chart PNGs on a worker pool.
+
+    ``submit`` returns immediately; ``on_done(key, png)`` is called from the
+    worker thread, so UI callers must hop back to their own thread (Kivy:
+    ``Clock.schedule_once``) before touching textures. ``cancel_pending``
+    drops every job that has not started yet.
+    """
+
+    def __init__(self, cache=None, max_workers=2):
+        self.cache = cache
+        self.max_workers = max_workers
+        self._executor = None
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def _render(self, key, counts):
+        png = self.cache.get_png(key) if self.cache else None
+        if png is None:
+            png = render_pie_png(counts, key[1], key[2])
+            if self.cache:
+                self.cache.put_png(key, png)
+        return png
+
+    def submit(self, counts, on_done, figsize=PIE_FIGSIZE, dpi=PIE_DPI):
+        key = chart_key(counts, figsize, dpi)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="chart")
+            future = self._executor.submit(self._render, key, counts)
+            self._pending.add(future)
+
+        def done(f):
+            with self._lock:
+                self._pending.discard(f)
+            if f.cancelled():
+                return
+            if f.exception() is not None:
+                log.error("chart render failed for %s", key, exc_info=f.exception())
+                return
+            on_done(key, f.result())
+
+        future.add_done_callback(done)
+        return future
+
+    def cancel_pending(self):
+        with self._lock:
+            pending = list(self._pending)
+        for future in pending:
+            future.cancel()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+chart_cache = ChartCache()
+chart_renderer = ChartRenderer(chart_cache)
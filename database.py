@@ -0,0 +1,267 @@
+import datetime
+import os
+import sqlite3
+import threading
+import time
+
+import archive
+import catalog
+import instrument
+import packed_storage
+import rollups
+import session_search
+import trends
+
+DB_NAME = "survey.db"
+# app_meta key prefix of sync's per-table push watermark
+WATERMARK_PREFIX = "sync_watermark:"
+
+
+class ConnectionManager:
+    """Hands out one long-lived, pre-configured SQLite connection per thread.
+
+    Opening a connection and applying the pragmas is the expensive part on
+    slow flash storage, so it is done once per thread and reused by every
+    query helper. ``stats()`` reports how many connections were opened and
+    how long callers spent waiting for one.
+    """
+
+    def __init__(self, path=DB_NAME, synchronous="NORMAL", cached_statements=256, busy_timeout=5.0):
+        self.path = path
+        self.synchronous = synchronous
+        self.cached_statements = cached_statements
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._generation = 0
+        self.opened = 0
+        self.acquired = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=self.busy_timeout,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+            # Lets archive.py ATTACH archive files read-only via file: URIs
+            uri=True,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+
+    def get(self):
+        start = time.perf_counter()
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.generation != self._generation:
+            conn = self._open()
+            self._local.conn = conn
+            self._local.generation = self._generation
+            with self._lock:
+                self._connections.append(conn)
+                self.opened += 1
+        waited = time.perf_counter() - start
+        with self._lock:
+            self.acquired += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+        return conn
+
+    def close_all(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+            self._generation += 1
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                pass
+
+    def remove_database(self):
+        # Connections must be closed first, otherwise they keep writing to the
+        # unlinked file.
+        self.close_all()
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(self.path + suffix):
+                os.remove(self.path + suffix)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "opened": self.opened,
+                "open": len(self._connections),
+                "acquired": self.acquired,
+                "wait_total": self.wait_total,
+                "wait_max": self.wait_max,
+                "wait_avg": self.wait_total / self.acquired if self.acquired else 0.0,
+            }
+
+
+manager = ConnectionManager()
+
+
+def get_connection():
+    return manager.get()
+
+
+def close_connections():
+    manager.close_all()
+
+
+def connection_stats():
+    return manager.stats()
+
+
+# The question bank is served from catalog.get_catalog(), which reads it
+# from the database once and is invalidated by migrations.create_db
+
+@instrument.timed("db.get_categories")
+def get_categories():
+    return [(category.id, category.name) for category in catalog.get_catalog().categories]
+
+
+@instrument.timed("db.get_questions_by_category")
+def get_questions_by_category(category_id):
+    return [(question.id, question.text) for question in catalog.get_catalog().questions(category_id)]
+
+
+@instrument.timed("db.get_category_name")
+def get_category_name(category_id):
+    return catalog.get_catalog().category_name(category_id)
+
+
+RESPONSES_BY_CATEGORY_SQL = '''
+    SELECT q.id, q.question_text, r.answer, COUNT(r.id)
+    FROM questions q
+    LEFT JOIN responses r ON q.id = r.question_id
+    WHERE q.category_id=? AND q.retired = 0
+    GROUP BY q.id, r.answer
+    ORDER BY q.id
+'''
+
+RESPONSES_BY_CATEGORY_AND_SESSION_SQL = '''
+    SELECT q.id, q.question_text, r.answer, COUNT(r.id)
+    FROM questions q
+    LEFT JOIN responses r ON q.id = r.question_id AND r.session_id = ?
+    WHERE q.category_id=? AND q.retired = 0
+    GROUP BY q.id, r.answer
+    ORDER BY q.id
+'''
+
+
+@instrument.timed("db.get_responses_by_category")
+def get_responses_by_category(category_id, session_id=None):
+    conn = get_connection()
+    if session_id and archive.archive_of(conn, session_id):
+        return archive.responses_by_category(conn, category_id, session_id)
+    if packed_storage.storage_mode(conn) == packed_storage.PACKED:
+        rows = packed_storage.responses_by_category(conn, category_id, session_id)
+    else:
+        c = conn.cursor()
+        if session_id:
+            c.execute(RESPONSES_BY_CATEGORY_AND_SESSION_SQL, (session_id, category_id))
+        else:
+            c.execute(RESPONSES_BY_CATEGORY_SQL, (category_id,))
+        rows = c.fetchall()
+    # Totals over all sessions include the archived ones
+    return rows if session_id else archive.add_archived_counts(conn, category_id, rows)
+
+
+def check_query_plans(conn=None):
+    """Fail if a results query would scan a whole table instead of an index.
+
+    Returns ``{name: [plan detail, ...]}`` for both shapes of
+    get_responses_by_category and raises RuntimeError on any full scan.
+    """
+    conn = conn or get_connection()
+    plans = {
+        "by_category": conn.execute("EXPLAIN QUERY PLAN " + RESPONSES_BY_CATEGORY_SQL, (1,)).fetchall(),
+        "by_category_and_session": conn.execute(
+            "EXPLAIN QUERY PLAN " + RESPONSES_BY_CATEGORY_AND_SESSION_SQL, (1, 1)).fetchall(),
+    }
+    plans = {name: [row[3] for row in rows] for name, rows in plans.items()}
+    scans = [f"{name}: {detail}" for name, details in plans.items()
+             for detail in details if detail.startswith("SCAN")]
+    if scans:
+        raise RuntimeError("query plan falls back to a scan: " + "; ".join(scans))
+    return plans
+
+
+def get_meta(conn, key, default=None):
+    """Value stored under ``key`` in app_meta, or ``default``."""
+    row = conn.execute("SELECT value FROM app_meta WHERE key=?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def set_meta(conn, key, value):
+    """Store ``value`` under ``key`` in app_meta, inside the caller's transaction."""
+    conn.execute("INSERT OR REPLACE INTO app_meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+
+@instrument.timed("db.get_answer_counts")
+def get_answer_counts(category_id, phc=None):
+    return rollups.get_answer_counts(get_connection(), category_id, phc)
+
+
+@instrument.timed("db.search_sessions")
+def search_sessions(text, limit=session_search.DEFAULT_LIMIT):
+    return session_search.search(get_connection(), text, limit)
+
+
+@instrument.timed("db.add_session")
+def add_session(conn, uid, date, sub_centre, location, phc, reported_by):
+    """Insert a session inside the caller's transaction and return its id."""
+    day = trends.normalize_date(date, datetime.date.today().isoformat())
+    c = conn.execute('''INSERT INTO sessions (uid, date, day, sub_centre, location, phc, reported_by)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)''', (uid, date, day, sub_centre, location, phc, reported_by))
+    return c.lastrowid
+
+
+def session_exists(conn, uid):
+    """True if a session with ``uid`` is stored, live or moved out by archive.py.
+
+    Importing, merging and generating sessions all check this before
+    inserting one, so an archived session is never counted again.
+    """
+    return conn.execute("SELECT 1 FROM sessions WHERE uid=? UNION ALL "
+                        "SELECT 1 FROM archived_sessions WHERE uid=? LIMIT 1", (uid, uid)).fetchone() is not None
+
+
+def session_id_for_uid(conn, uid):
+    row = conn.execute("SELECT id FROM sessions WHERE uid=?", (uid,)).fetchone()
+    if row is None:
+        raise LookupError(f"no session with uid {uid}")
+    return row[0]
+
+
+@instrument.timed("db.add_responses")
+def add_responses(conn, session_id, answers):
+    """Store ``(question_id, answer)`` pairs inside the caller's transaction."""
+    answers = list(answers)
+    packed_storage.write_responses(conn, session_id, answers)
+    rollups.bump(conn, session_id, answers)
+    trends.bump(conn, session_id, answers)
+    return len(answers)
+
+
+@instrument.timed("db.insert_response")
+def insert_response(session_id, question_id, answer):
+    conn = get_connection()
+    with conn:
+        add_responses(conn, session_id, [(question_id, answer)])
+
+
+@instrument.timed("db.insert_responses")
+def insert_responses(session_id, answers):
+    """Save a whole category's answers in a single transaction.
+
+    ``answers`` is an iterable of ``(question_id, answer)`` pairs. Either all
+    rows are written or, if any insert fails, none are.
+    """
+    conn = get_connection()
+    with conn:
+        return add_responses(conn, session_id, answers)
@@ -0,0 +1,125 @@
+"""Seeded synthetic survey data for benchmarks and manual testing.
+
+``generate`` adds N sessions with answers to every question of (usually)
+all four categories. Answers are not uniform noise: each PHC, sub-centre
+and question gets a fixed quality offset and each visit some variation of
+its own, so rankings, trends and charts look like field data. The same
+seed always produces the same database content, and rerunning with the
+same seed skips the sessions that already exist::
+
+    python datagen.py --sessions 10000 --seed 1 --db survey.db
+"""
+import argparse
+import datetime
+import random
+import sys
+import time
+
+import database
+import packed_storage
+import rollups
+import trends
+
+START_DATE = datetime.date(2025, 1, 1)
+# Chance that a visit leaves out a whole category
+SKIP_CATEGORY = 0.1
+ANSWER_TEXT = tuple(str(i) for i in range(len(rollups.ANSWER_COLUMNS)))
+
+
+def generate(conn, sessions, seed=0, phcs=8, sub_centres_per_phc=5, days=365):
+    """Add ``sessions`` synthetic sessions; returns how many were new.
+
+    Everything is written in one transaction. When most rows are new the
+    response indexes are dropped while rows go in and rebuilt at the end,
+    and the rollups are updated once from counts kept on the side instead
+    of per session.
+    """
+    rng = random.Random(seed)
+    layout = packed_storage.question_layout(conn)
+    positions = layout[0]
+    by_category = {}
+    for qid, (category_id, _) in sorted(positions.items()):
+        by_category.setdefault(category_id, []).append(qid)
+    difficulty = {qid: rng.gauss(0, 0.5) for qid in sorted(positions)}
+    centres = []
+    for p in range(phcs):
+        phc_quality = rng.gauss(0, 0.6)
+        for s in range(sub_centres_per_phc):
+            centres.append((f"PHC {p + 1}", f"SC {p + 1}-{s + 1}", f"Village {p + 1}-{s + 1}",
+                            phc_quality + rng.gauss(0, 0.4)))
+    counts_by_phc = {centre[0]: {qid: [0] * len(ANSWER_TEXT) for qid in positions} for centre in centres}
+    daily = {}
+
+    table = "packed_responses" if packed_storage.storage_mode(conn) == packed_storage.PACKED else "responses"
+    added = 0
+    conn.execute("BEGIN")
+    try:
+        indexes = []
+        # Rebuilding the indexes only pays off when most rows are new
+        if sessions > conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]:
+            indexes = conn.execute("SELECT name, sql FROM sqlite_master WHERE type='index' AND tbl_name=? "
+                                   "AND sql IS NOT NULL", (table,)).fetchall()
+        for name, _ in indexes:
+            conn.execute(f"DROP INDEX {name}")
+        for i in range(sessions):
+            phc, sub_centre, location, quality = rng.choice(centres)
+            day = (START_DATE + datetime.timedelta(days=rng.randrange(days))).isoformat()
+            visit = 2.5 + quality + rng.gauss(0, 0.3)
+            phc_counts = counts_by_phc[phc]
+            answers = []
+            session_daily = []
+            for category_id, qids in by_category.items():
+                if rng.random() < SKIP_CATEGORY:
+                    continue
+                category_counts = [0] * len(ANSWER_TEXT)
+                for qid in qids:
+                    answer = min(5, max(0, round(visit - difficulty[qid] + rng.gauss(0, 1.0))))
+                    answers.append((qid, ANSWER_TEXT[answer]))
+                    category_counts[answer] += 1
+                session_daily.append(((category_id, phc, day), category_counts))
+            uid = f"synthetic:{seed}:{i}"
+            if database.session_exists(conn, uid):
+                continue
+            session_id = conn.execute('''INSERT INTO sessions (uid, date, day, sub_centre, location, phc, reported_by)
+                                         VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                                      (uid, day, day, sub_centre, location, phc, f"Surveyor {i % 20 + 1}")).lastrowid
+            packed_storage.write_responses(conn, session_id, answers, layout)
+            for qid, answer in answers:
+                phc_counts[qid][int(answer)] += 1
+            for key, category_counts in session_daily:
+                total = daily.setdefault(key, [0] * len(ANSWER_TEXT))
+                for a, n in enumerate(category_counts):
+                    total[a] += n
+            added += 1
+        for _, sql in indexes:
+            conn.execute(sql)
+        rollups.add_counts(conn, {(qid, phc): counts for phc, phc_counts in counts_by_phc.items()
+                                  for qid, counts in phc_counts.items() if any(counts)})
+        trends.add_counts(conn, daily)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return added
+
+
+def main(argv=None):
+    import database
+    from migrations import create_db
+
+    parser = argparse.ArgumentParser(description="Fill survey.db with seeded synthetic sessions.")
+    parser.add_argument("--sessions", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--db", default=database.DB_NAME, help="path to survey.db")
+    args = parser.parse_args(argv)
+    database.manager.path = args.db
+    conn = database.get_connection()
+    create_db(conn)
+    start = time.perf_counter()
+    added = generate(conn, args.sessions, args.seed)
+    print(f"{added} sessions added in {time.perf_counter() - start:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
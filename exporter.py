@@ -0,0 +1,285 @@
+"""Streaming exporter for collected sessions and responses.
+
+Joins every response with its session, question and category and streams
+the records out with ``fetchmany`` in fixed-size chunks, so memory stays
+constant however many rows survey.db holds. Archived sessions are
+included: each archive file is attached in turn. Three output formats:
+
+``csv``
+    One header row, then one row per response.
+``jsonl``
+    One JSON object per response.
+``col``
+    Compact columnar binary: after ``COLUMNAR_MAGIC``, a sequence of
+    blocks, each ``<I`` row count followed by every column in
+    ``EXPORT_COLUMNS`` order. Integer columns are little-endian arrays
+    (``<q`` ids, ``B`` answers with 255 for missing); text columns are a
+    per-block string table (``<I`` count, then ``<I`` length + UTF-8 bytes
+    each) followed by ``<I`` codes. A zero row count ends the file.
+    ``read_columnar`` reads it back block by block.
+
+    python exporter.py visits.csv --phc "PHC A" --from 2026-01-01 --to 2026-03-31
+"""
+import argparse
+import csv
+import json
+import struct
+import sys
+import time
+from array import array
+
+import archive
+import database
+import packed_storage
+import rollups
+import trends
+
+EXPORT_COLUMNS = (
+    "session_id", "session_uid", "date", "sub_centre", "location", "phc", "reported_by",
+    "category", "question_id", "question_text", "answer", "timestamp",
+)
+INT_COLUMNS = {"session_id": "q", "question_id": "q", "answer": "B"}
+MISSING_ANSWER = 255
+COLUMNAR_MAGIC = b"SURVEYCOL1\n"
+
+_EXPORT_SQL = '''
+    SELECT s.id, s.uid, s.date, s.sub_centre, s.location, s.phc, s.reported_by,
+           c.name, q.id, q.question_text, r.answer, r.timestamp
+    FROM {schema}.responses r
+    JOIN {schema}.sessions s ON s.id = r.session_id
+    JOIN main.questions q ON q.id = r.question_id
+    JOIN main.survey_categories c ON c.id = q.category_id
+    {where}
+    ORDER BY r.session_id, r.question_id
+'''
+
+# Packed storage: one row per (session, category) blob, walked in
+# idx_packed_session order and unpacked by _unpack_chunks
+_PACKED_EXPORT_SQL = '''
+    SELECT s.id, s.uid, s.date, s.sub_centre, s.location, s.phc, s.reported_by,
+           p.category_id, p.answers, p.timestamp
+    FROM packed_responses p
+    JOIN sessions s ON s.id = p.session_id
+    {where}
+    ORDER BY p.session_id, p.category_id
+'''
+
+
+class ExportStats:
+    def __init__(self, fmt):
+        self.format = fmt
+        self.rows = 0
+        self.bytes = 0
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"{self.format}: {self.rows} rows, {self.bytes:,} bytes in {self.seconds:.2f} s "
+                f"({self.rows_per_second:,.0f} rows/s)")
+
+
+def _where(date_from, date_to, phc, sub_centre, category, category_column):
+    clauses, params = [], []
+    if date_from:
+        clauses.append("s.day >= ?")
+        params.append(date_from)
+    if date_to:
+        clauses.append("s.day <= ?")
+        params.append(date_to)
+    if phc:
+        clauses.append("s.phc = ?")
+        params.append(phc)
+    if sub_centre:
+        clauses.append("s.sub_centre = ?")
+        params.append(sub_centre)
+    if category:
+        if str(category).isdigit():
+            clauses.append(f"{category_column} = ?")
+            params.append(int(category))
+        else:
+            clauses.append(f"{category_column} = (SELECT id FROM main.survey_categories WHERE name = ?)")
+            params.append(category)
+    return "WHERE " + " AND ".join(clauses) if clauses else "", params
+
+
+def iter_records(conn=None, date_from=None, date_to=None, phc=None, sub_centre=None, category=None, chunk_size=5000):
+    """Yield lists of up to ``chunk_size`` joined rows in EXPORT_COLUMNS order.
+
+    The date range applies to each session's normalised ``day``, so visits
+    typed as "15/01/2026" or "Jan 15, 2026" are filtered like ISO dates;
+    the bounds may be written either way too. ``category`` may be a
+    category name or id. Sessions moved out by archive.py come first, from
+    each archive overlapping the dates asked for, then live ones. Rows come
+    in session order, by question id within a session, or by category then
+    question in packed storage.
+    """
+    conn = conn or database.get_connection()
+    date_from = trends.normalize_date(date_from, date_from)
+    date_to = trends.normalize_date(date_to, date_to)
+    filters = (date_from, date_to, phc, sub_centre, category)
+    where, params = _where(*filters, "c.id")
+    for schema in archive.each_archive(conn, date_from, date_to):
+        yield from _chunks(conn.execute(_EXPORT_SQL.format(schema=schema, where=where), params), chunk_size)
+    if packed_storage.storage_mode(conn) == packed_storage.PACKED:
+        where, params = _where(*filters, "p.category_id")
+        yield from _unpack_chunks(conn, conn.execute(_PACKED_EXPORT_SQL.format(where=where), params), chunk_size)
+    else:
+        yield from _chunks(conn.execute(_EXPORT_SQL.format(schema="main", where=where), params), chunk_size)
+
+
+def _chunks(cursor, chunk_size):
+    # Closed even if the caller stops early, so an attached archive can be detached
+    try:
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+    finally:
+        cursor.close()
+
+
+def _unpack_chunks(conn, cursor, chunk_size):
+    texts = dict(conn.execute("SELECT id, question_text FROM questions"))
+    names = dict(conn.execute("SELECT id, name FROM survey_categories"))
+    questions = {category_id: [(qid, texts[qid]) for qid in qids]
+                 for category_id, qids in packed_storage.category_questions(conn).items()}
+    chunk = []
+    # Each blob holds a category's worth of answers, so fetch fewer of them
+    for rows in _chunks(cursor, max(1, chunk_size // 32)):
+        for *session, category_id, blob, timestamp in rows:
+            name = names.get(category_id)
+            chunk.extend((*session, name, qid, text, str(value), timestamp)
+                         for (qid, text), value in zip(questions.get(category_id, ()), blob)
+                         if value != packed_storage.MISSING)
+            if len(chunk) >= chunk_size:
+                yield chunk[:chunk_size]
+                chunk = chunk[chunk_size:]
+    if chunk:
+        yield chunk
+
+
+def write_csv(chunks, f):
+    writer = csv.writer(f)
+    writer.writerow(EXPORT_COLUMNS)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield len(rows)
+
+
+def write_jsonl(chunks, f):
+    for rows in chunks:
+        f.write("".join(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows))
+        yield len(rows)
+
+
+def _encode_strings(values):
+    table = {}
+    codes = array("I", (table.setdefault(v if v is not None else "", len(table)) for v in values))
+    parts = [struct.pack("<I", len(table))]
+    for text in table:
+        data = text.encode("utf-8")
+        parts.append(struct.pack("<I", len(data)))
+        parts.append(data)
+    if sys.byteorder != "little":
+        codes.byteswap()
+    parts.append(codes.tobytes())
+    return b"".join(parts)
+
+
+def _encode_ints(values, typecode):
+    if typecode == "B":
+        idx = (rollups.answer_index(v) for v in values)
+        data = array("B", (MISSING_ANSWER if i is None else i for i in idx))
+    else:
+        data = array(typecode, (v or 0 for v in values))
+    if sys.byteorder != "little":
+        data.byteswap()
+    return data.tobytes()
+
+
+def write_columnar(chunks, f):
+    f.write(COLUMNAR_MAGIC)
+    for rows in chunks:
+        f.write(struct.pack("<I", len(rows)))
+        for name, values in zip(EXPORT_COLUMNS, zip(*rows)):
+            typecode = INT_COLUMNS.get(name)
+            f.write(_encode_ints(values, typecode) if typecode else _encode_strings(values))
+        yield len(rows)
+    f.write(struct.pack("<I", 0))
+
+
+def read_columnar(f):
+    """Yield ``{column: list or array}`` per block of a ``col`` export."""
+    if f.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+        raise ValueError("not a survey columnar export")
+
+    def read_u32():
+        return struct.unpack("<I", f.read(4))[0]
+
+    while True:
+        n = read_u32()
+        if n == 0:
+            return
+        block = {}
+        for name in EXPORT_COLUMNS:
+            typecode = INT_COLUMNS.get(name)
+            if typecode:
+                data = array(typecode)
+                data.frombytes(f.read(data.itemsize * n))
+            else:
+                table = [f.read(read_u32()).decode("utf-8") for _ in range(read_u32())]
+                data = array("I")
+                data.frombytes(f.read(data.itemsize * n))
+            if sys.byteorder != "little":
+                data.byteswap()
+            block[name] = data if typecode else [table[code] for code in data]
+        yield block
+
+
+WRITERS = {
+    "csv": (write_csv, "w"),
+    "jsonl": (write_jsonl, "w"),
+    "col": (write_columnar, "wb"),
+}
+
+
+def export(path, fmt="csv", conn=None, **filters):
+    writer, mode = WRITERS[fmt]
+    stats = ExportStats(fmt)
+    start = time.perf_counter()
+    open_kwargs = {"newline": "", "encoding": "utf-8"} if mode == "w" else {}
+    with open(path, mode, **open_kwargs) as f:
+        for written in writer(iter_records(conn, **filters), f):
+            stats.rows += written
+        stats.bytes = f.tell()
+    stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export sessions and responses.")
+    parser.add_argument("path", help="output file")
+    parser.add_argument("--db", default=database.DB_NAME, help="path to survey.db")
+    parser.add_argument("--format", choices=sorted(WRITERS), help="output format (default: from file extension)")
+    parser.add_argument("--from", dest="date_from", help="first session date (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", help="last session date (YYYY-MM-DD)")
+    parser.add_argument("--phc")
+    parser.add_argument("--sub-centre")
+    parser.add_argument("--category", help="category name or id")
+    args = parser.parse_args(argv)
+    fmt = args.format or args.path.rsplit(".", 1)[-1]
+    if fmt not in WRITERS:
+        parser.error(f"cannot tell the format of {args.path}; pass --format")
+    database.manager.path = args.db
+    stats = export(args.path, fmt, date_from=args.date_from, date_to=args.date_to,
+                   phc=args.phc, sub_centre=args.sub_centre, category=args.category)
+    print(stats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
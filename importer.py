@@ -0,0 +1,190 @@
+"""Headless bulk importer for survey responses collected on other devices.
+
+Streams CSV or JSONL files into ``sessions`` and ``responses`` without
+Kivy, committing every ``--chunk-size`` sessions so memory stays constant
+however large the input is. Each input row is one answer::
+
+    session_uid,date,sub_centre,location,phc,reported_by,category,question_text,answer
+
+Rows of a session must be contiguous. ``session_uid`` is optional; without
+it a session is identified by its details plus its answers. A JSONL line
+may instead hold a whole session, with an ``answers`` list of
+``{"category", "question_text", "answer"}`` objects.
+
+Questions are matched by category name and question text. Sessions whose
+uid is already in the database are skipped, as are unknown questions,
+answers outside 0..5 and repeated answers to the same question. Sessions
+are committed in chunks, so re-running an interrupted import picks up
+where it stopped.
+
+    python importer.py device1.csv device2.jsonl --db survey.db
+"""
+import argparse
+import csv
+import datetime
+import hashlib
+import json
+import sys
+import time
+
+import database
+import packed_storage
+import rollups
+import trends
+from migrations import create_db
+
+SESSION_FIELDS = ("date", "sub_centre", "location", "phc", "reported_by")
+
+
+class ImportStats:
+    def __init__(self):
+        self.rows = 0
+        self.sessions = 0
+        self.duplicates = 0
+        self.responses = 0
+        self.unmatched = 0
+        self.invalid = 0
+        self.seconds = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return (f"{self.rows} rows in {self.seconds:.2f} s ({self.rows_per_second:,.0f} rows/s): "
+                f"{self.sessions} sessions and {self.responses} responses imported, "
+                f"{self.duplicates} duplicate sessions, {self.unmatched} unmatched questions, "
+                f"{self.invalid} invalid answers skipped")
+
+
+def _flat_rows(path, fmt):
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "csv":
+            yield from csv.DictReader(f)
+            return
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            answers = record.pop("answers", None)
+            if answers is None:
+                yield record
+                continue
+            for answer in answers:
+                yield {**record, **answer}
+
+
+def _session_key(row):
+    return row.get("session_uid") or tuple(row.get(field) or "" for field in SESSION_FIELDS)
+
+
+def iter_sessions(path, fmt=None):
+    """Yield ``(details, answers)`` per session, reading ``path`` lazily.
+
+    ``answers`` is a list of ``(category, question_text, answer)`` rows.
+    """
+    fmt = fmt or ("jsonl" if path.endswith((".jsonl", ".json")) else "csv")
+    current_key = None
+    details = None
+    answers = []
+    for row in _flat_rows(path, fmt):
+        key = _session_key(row)
+        if key != current_key:
+            if details is not None:
+                yield details, answers
+            current_key = key
+            details = {field: row.get(field) or "" for field in SESSION_FIELDS}
+            details["uid"] = row.get("session_uid") or None
+            answers = []
+        answers.append((row.get("category") or "", row.get("question_text") or "", str(row.get("answer", "")).strip()))
+    if details is not None:
+        yield details, answers
+
+
+def _content_uid(details, answers):
+    digest = hashlib.sha1()
+    digest.update(json.dumps([details[f] for f in SESSION_FIELDS]).encode("utf-8"))
+    digest.update(json.dumps(sorted(answers)).encode("utf-8"))
+    return "import:" + digest.hexdigest()
+
+
+def _question_index(conn):
+    return {
+        (category, text): qid
+        for qid, category, text in conn.execute('''
+            SELECT q.id, c.name, q.question_text
+            FROM questions q JOIN survey_categories c ON c.id = q.category_id
+        ''')
+    }
+
+
+def import_files(paths, chunk_size=500, fmt=None, conn=None):
+    conn = conn or database.get_connection()
+    create_db(conn)
+    questions = _question_index(conn)
+    layout = packed_storage.question_layout(conn)
+    today = datetime.date.today().isoformat()
+    stats = ImportStats()
+    start = time.perf_counter()
+    pending = 0
+    conn.execute("BEGIN")
+    try:
+        for path in paths:
+            for details, answers in iter_sessions(path, fmt):
+                stats.rows += len(answers)
+                seen = set()
+                rows = []
+                for category, text, answer in answers:
+                    qid = questions.get((category, text))
+                    if qid is None:
+                        stats.unmatched += 1
+                    elif rollups.answer_index(answer) is None or qid in seen:
+                        stats.invalid += 1
+                    else:
+                        seen.add(qid)
+                        rows.append((qid, answer))
+                if not rows:
+                    continue
+                uid = details["uid"] or _content_uid(details, answers)
+                if database.session_exists(conn, uid):
+                    stats.duplicates += 1
+                    continue
+                day = trends.normalize_date(details["date"], today)
+                session_id = conn.execute('''INSERT INTO sessions (uid, day, date, sub_centre, location, phc, reported_by)
+                                             VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                                          (uid, day, *(details[f] for f in SESSION_FIELDS))).lastrowid
+                packed_storage.write_responses(conn, session_id, rows, layout)
+                rollups.bump(conn, session_id, rows, phc=details["phc"])
+                trends.bump(conn, session_id, rows)
+                stats.sessions += 1
+                stats.responses += len(rows)
+                pending += 1
+                if pending >= chunk_size:
+                    conn.commit()
+                    conn.execute("BEGIN")
+                    pending = 0
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        stats.seconds = time.perf_counter() - start
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import survey responses from CSV/JSONL files.")
+    parser.add_argument("paths", nargs="+", help="CSV or JSONL files to import")
+    parser.add_argument("--db", default=database.DB_NAME, help="path to survey.db")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="input format (default: from file extension)")
+    parser.add_argument("--chunk-size", type=int, default=500, help="sessions per transaction")
+    args = parser.parse_args(argv)
+    database.manager.path = args.db
+    stats = import_files(args.paths, chunk_size=args.chunk_size, fmt=args.format)
+    print(stats)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
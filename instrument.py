@@ -0,0 +1,140 @@
+"""Opt-in timing instrumentation for the app's hot paths.
+
+Set ``SURVEY_INSTRUMENT=1`` before starting the app to record a call count
+and latency histogram per operation (database helpers, screen entries,
+chart renders, queued writes) and show the in-app overlay with frame time
+and the slowest recent operations. Setting ``SURVEY_TRACE`` to a file path
+turns it on too and writes every timed call there on exit, in the Chrome
+trace event format (open it in chrome://tracing or Perfetto).
+
+When the flag is off ``timed`` returns the function it decorates
+unchanged and ``span`` returns a shared no-op context manager, so the
+instrumented code runs exactly as before.
+"""
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+
+TRACE_PATH = os.environ.get("SURVEY_TRACE")
+ENABLED = bool(os.environ.get("SURVEY_INSTRUMENT") or TRACE_PATH)
+
+# Upper bounds of the latency histogram buckets, in milliseconds; the last
+# bucket counts everything slower
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+_NULL_SPAN = nullcontext()
+
+
+class OperationStats:
+    __slots__ = ("count", "total", "max", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, ms):
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        self.histogram[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+
+    def percentile(self, fraction):
+        """Upper bound of the bucket holding the given fraction of calls."""
+        wanted = self.count * fraction
+        seen = 0
+        for bound, n in zip(BUCKETS_MS + (float("inf"),), self.histogram):
+            seen += n
+            if n and seen >= wanted:
+                return bound
+        return 0.0
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "avg_ms": self.total / self.count if self.count else 0.0,
+            "max_ms": self.max,
+            "p95_ms": self.percentile(0.95),
+            "histogram": dict(zip([f"<={b}" for b in BUCKETS_MS] + ["slower"], self.histogram)),
+        }
+
+
+class Recorder:
+    def __init__(self, recent=256, trace_events=20000):
+        self.start = time.perf_counter()
+        self.operations = {}
+        self._recent = deque(maxlen=recent)
+        self._trace = deque(maxlen=trace_events)
+        self._lock = threading.Lock()
+
+    def record(self, name, began, ended=None):
+        ended = time.perf_counter() if ended is None else ended
+        ms = (ended - began) * 1000
+        with self._lock:
+            stats = self.operations.get(name)
+            if stats is None:
+                stats = self.operations[name] = OperationStats()
+            stats.add(ms)
+            self._recent.append((ended, ms, name))
+            self._trace.append((name, began, ms, threading.get_ident()))
+
+    def slowest(self, n=5, window=10.0):
+        """``[(ms, name), ...]`` of the slowest calls in the last ``window`` seconds."""
+        since = time.perf_counter() - window
+        with self._lock:
+            recent = [(ms, name) for ended, ms, name in self._recent if ended >= since]
+        return sorted(recent, reverse=True)[:n]
+
+    def report(self):
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in sorted(self.operations.items())}
+
+    def dump(self, path):
+        """Write recorded calls as Chrome trace events, plus the summary."""
+        pid = os.getpid()
+        with self._lock:
+            events = [{"name": name, "ph": "X", "pid": pid, "tid": tid,
+                       "ts": (began - self.start) * 1e6, "dur": ms * 1000}
+                      for name, began, ms, tid in self._trace]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "summary": self.report()}, f)
+
+
+recorder = Recorder()
+
+
+def timed(name):
+    """Decorator recording each call of the function under ``name``."""
+    def decorate(fn):
+        if not ENABLED:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            began = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                recorder.record(name, began)
+        return wrapper
+    return decorate
+
+
+@contextmanager
+def _span(name):
+    began = time.perf_counter()
+    try:
+        yield
+    finally:
+        recorder.record(name, began)
+
+
+def span(name):
+    """Context manager recording the enclosed block under ``name``."""
+    return _span(name) if ENABLED else _NULL_SPAN
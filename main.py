@@ -1,267 +1,66 @@
-import sqlite3
+import logging
 import os
-from kivy.app import App
-from kivy.uix.boxlayout import BoxLayout
-from kivy.uix.label import Label
-from kivy.uix.button import Button
-from kivy.uix.togglebutton import ToggleButton
-from kivy.uix.textinput import TextInput
-from kivy.uix.scrollview import ScrollView
-from kivy.uix.image import AsyncImage, Image
-from kivy.uix.modalview import ModalView
-from kivy.uix.screenmanager import ScreenManager, Screen
-from kivy.uix.gridlayout import GridLayout
-from kivy.clock import Clock
-from kivy.metrics import dp
-from kivy.graphics import Color, Rectangle, RoundedRectangle
-from kivy.utils import get_color_from_hex
-import matplotlib.pyplot as plt
-from matplotlib import use as mpl_use
-from kivy.core.image import Image as CoreImage
+import sys
+import threading
+import time
+import uuid
+from array import array
+from collections import OrderedDict, deque
+from startup import profile
+
+with profile.phase("import kivy"):
+    from kivy.app import App
+    from kivy.uix.boxlayout import BoxLayout
+    from kivy.uix.label import Label
+    from kivy.uix.button import Button
+    from kivy.uix.togglebutton import ToggleButton
+    from kivy.uix.textinput import TextInput
+    from kivy.uix.recycleview import RecycleView
+    from kivy.uix.recycleview.views import RecycleDataViewBehavior
+    from kivy.uix.recycleboxlayout import RecycleBoxLayout
+    from kivy.uix.modalview import ModalView
+    from kivy.uix.screenmanager import ScreenManager, Screen
+    from kivy.uix.gridlayout import GridLayout
+    from kivy.clock import Clock
+    from kivy.metrics import dp
+    from kivy.graphics import Color, Rectangle, RoundedRectangle
+    from kivy.utils import get_color_from_hex
 from io import BytesIO
+with profile.phase("import data layer"):
+    from database import (
+        close_connections,
+        get_categories, get_questions_by_category, get_category_name,
+        get_responses_by_category, get_answer_counts,
+        add_session, add_responses, session_id_for_uid, search_sessions,
+    )
+    from migrations import create_db, add_change_listener
+    from write_queue import write_queue
+    import instrument
+    import maintenance
+    from rollups import answer_index
+    from charts import chart_cache, chart_key, chart_renderer, render_pie_png, preload_matplotlib, PIE_LABELS
 
-# Use Agg backend for matplotlib
-mpl_use('Agg')
-
-DB_NAME = "survey.db"
-
-# --- QUESTIONS BY SECTION ---
-infra_questions = [
-    "Is the subcentre a Government or Rented building?",
-    "What is the condition of the building? (Good/Average/Poor)",
-    "Is the surrounding cleanliness satisfactory?",
-    "Is electricity supply available?",
-    "Is power backup (Inverter/Solar) available?",
-    "Is safe drinking water available?",
-    "Are toilets available and functional?",
-    "Is the hand washing facility functional?",
-    "Is the BMWM facility functional?",
-    "Is patient seating adequate?",
-    "Are ANC IEC posters displayed?",
-    "Are Danger Signs IEC posters displayed?",
-    "Are HRP IEC posters displayed?",
-    "Are Breastfeeding IEC posters displayed?",
-    "Are BPCR IEC posters displayed?",
-    "Are BMW IEC posters displayed?",
-    "Are Steps of Hand Washing posters displayed?"
-]
-anc_questions = [
-    "Is the newborn weighing machine functional?",
-    "Is the examination table available?",
-    "Is the adult weighing scale available?",
-    "Is the infant weighing scale available?",
-    "Is the adult height scale available?",
-    "Is the infantometer available?",
-    "Is the BP apparatus available?",
-    "Is the stethoscope available?",
-    "Is the fetoscope available?",
-    "Is the thermometer (digital & low-reading) available?",
-    "Is the hemoglobinometer available?",
-    "Are urine sugar/albumin strips available?",
-    "Is a glucometer with strips available?",
-    "Is the pregnancy test kit (Nischay) available?",
-    "Is the vaccine carrier with ice packs available?",
-    "Is a measuring tape available?",
-    "Are IFA tablets available?",
-    "Are calcium tablets available?",
-    "Is albendazole available?",
-    "Are tetanus / Td vials available?",
-    "Is vitamin K injection available?",
-    "Is oxytocin injection available?",
-    "Is the emergency drug kit available?",
-    "Is the HBNC Kit for ASHA available?"
-]
-delivery_questions = [
-    "Is a digital watch available?",
-    "Is a digital thermometer available?",
-    "Is a neonatal weighing scale with sling available?",
-    "Is a baby blanket available?",
-    "Is a feeding spoon available?",
-    "Is a warm bag available?",
-    "Are essential newborn medicines available?",
-    "Are sterile gloves available?",
-    "Is a delivery/SBA kit available?",
-    "Is hand sanitizer available?",
-    "Is soap available?",
-    "Is a towel available?",
-    "Is chlorine solution available?",
-    "Is bucket & mug available?",
-    "Is a needle/hub cutter available?",
-    "Are color-coded waste bins available?",
-    "Are MCP cards with RCH ID available?",
-    "Are PMSMA stickers available?",
-    "Are ANC/PNC registers available?",
-    "Are referral slips available?",
-    "Is data entered in ANMOL/UWIN within 48 hours?",
-    "Is contact of nearest FRU displayed?",
-    "Is stock register updated?",
-    "Is ANC first visit within 12 weeks conducted?",
-    "Are all first visit lab investigations done?"
-]
-hbnc_questions = [
-    "Are all first visit clinical assessments done?",
-    "Are first visit medications given?",
-    "Is danger signs counselling provided in first visit?",
-    "Is counselling on nutrition, hygiene and breastfeeding done?",
-    "Is ANC second visit conducted between 14–26 weeks?",
-    "Are second visit lab investigations done?",
-    "Are second visit clinical assessments done?",
-    "Are second visit medications given?",
-    "Is danger signs counselling provided in second visit?",
-    "Is ANC third visit conducted?",
-    "Are third visit lab investigations done?",
-    "Are third visit clinical assessments done?",
-    "Is danger signs counselling provided in third visit?",
-    "Is ANC fourth visit (36–40 wks) conducted?",
-    "Are fourth visit lab investigations done?",
-    "Are fourth visit clinical assessments done?",
-    "Is danger signs counselling provided in fourth visit?",
-    "Is institutional delivery promoted?",
-    "Is trained staff available for deliveries?",
-    "Are referral slips/registers maintained for deliveries?",
-    "Are hygiene protocols and clean delivery kits used?",
-    "Is transport arranged for delivery?",
-    "Are HRPs/emergencies referred timely with feedback?",
-    "Are JSY/JSSK/Ija Boi incentives disbursed properly?",
-    "Is respectful maternity care ensured?",
-    "Is breastfeeding initiated within 1 hour of birth?",
-    "Is postnatal care equipment available (clamp, resuscitator, wraps)?",
-    "Are PNC visits conducted on recommended days?",
-    "Is postnatal assessment of mother and baby documented?",
-    "Is the newborn monitored for weight, feeding, danger signs?",
-    "Is exclusive breastfeeding promoted postnatally?",
-    "Are postnatal visit records properly maintained?",
-    "Is counselling on cord care, hygiene, immunization provided?",
-    "Is KMC advised for LBW/preterm babies?",
-    "Has ASHA completed 7 HBNC visits (13 for LBW)?",
-    "Did ASHA assess temperature, weight, cord care in each visit?",
-    "Is ASHA trained and equipped for HBNC?",
-    "Is exclusive breastfeeding promoted by ASHA?",
-    "Are danger signs identified and referred by ASHA?",
-    "Are ASHAs equipped with HBNC kits?",
-    "Are ASHAs trained on breastfeeding, hygiene, danger signs?",
-    "Are ASHAs oriented on JSY/Eja Boi schemes?",
-    "Are ASHA incentives regularly disbursed?",
-    "Is ASHA diary/register reviewed regularly?",
-    "Are ASHAs treated respectfully at health facilities?"
-]
-
-def create_db():
-    # Always delete old DB to avoid schema mismatch
-    if os.path.exists(DB_NAME):
-        os.remove(DB_NAME)
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS sessions (
-            id INTEGER PRIMARY KEY,
-            date TEXT, 
-            sub_centre TEXT,
-            location TEXT,
-            phc TEXT,
-            reported_by TEXT,
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS survey_categories (
-            id INTEGER PRIMARY KEY,
-            name TEXT UNIQUE
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS questions (
-            id INTEGER PRIMARY KEY, 
-            category_id INTEGER,
-            question_text TEXT,
-            FOREIGN KEY(category_id) REFERENCES survey_categories(id)
-        )
-    ''')
-    c.execute('''
-        CREATE TABLE IF NOT EXISTS responses (
-            id INTEGER PRIMARY KEY, 
-            session_id INTEGER,
-            question_id INTEGER, 
-            answer TEXT, 
-            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(session_id) REFERENCES sessions(id),
-            FOREIGN KEY(question_id) REFERENCES questions(id)
-        )
-    ''')
-    # Insert categories
-    categories = [
-        "Infrastructure & Equipment",
-        "ANC Services",
-        "Delivery & Postnatal Care",
-        "HBNC & ASHA Activities"
-    ]
-    for name in categories:
-        c.execute("INSERT INTO survey_categories (name) VALUES (?)", (name,))
-    # Insert questions per category
-    for cat_id, questions in enumerate([
-        infra_questions, anc_questions, delivery_questions, hbnc_questions
-    ], start=1):
-        for q in questions:
-            c.execute('INSERT INTO questions (category_id, question_text) VALUES (?, ?)', (cat_id, q))
-    conn.commit()
-    conn.close()
-
-def get_categories():
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT id, name FROM survey_categories")
-    categories = c.fetchall()
-    conn.close()
-    return categories
-
-def get_questions_by_category(category_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute('''SELECT id, question_text FROM questions WHERE category_id=?''', (category_id,))
-    questions = c.fetchall()
-    conn.close()
-    return questions
-
-def get_category_name(category_id):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    c.execute("SELECT name FROM survey_categories WHERE id=?", (category_id,))
-    row = c.fetchone()
-    conn.close()
-    return row[0] if row else ""
-
-def get_responses_by_category(category_id, session_id=None):
-    conn = sqlite3.connect(DB_NAME)
-    c = conn.cursor()
-    
-    if session_id:
-        c.execute('''
-            SELECT q.id, q.question_text, r.answer, COUNT(r.id)
-            FROM questions q
-            LEFT JOIN responses r ON q.id = r.question_id AND r.session_id = ?
-            WHERE q.category_id=?
-            GROUP BY q.id, r.answer
-            ORDER BY q.id
-        ''', (session_id, category_id))
-    else:
-        c.execute('''
-            SELECT q.id, q.question_text, r.answer, COUNT(r.id)
-            FROM questions q
-            LEFT JOIN responses r ON q.id = r.question_id
-            WHERE q.category_id=?
-            GROUP BY q.id, r.answer
-            ORDER BY q.id
-        ''', (category_id,))
-    
-    rows = c.fetchall()
-    conn.close()
-    return rows
+log = logging.getLogger(__name__)
+
+# Seconds on_pause waits for queued writes before letting Android suspend the app
+PAUSE_FLUSH_TIMEOUT = 1.5
+
+# The charting stack is only needed by the Results screen; it is imported on
+# first use, or preloaded once the first frame has been drawn
+Image = CoreImage = AnswerChart = None
 
-def insert_response(session_id, question_id, answer):
-    conn = sqlite3.connect(DB_NAME)
-    conn.execute('''INSERT INTO responses (session_id, question_id, answer) VALUES (?, ?, ?)''', (session_id, question_id, answer))
-    conn.commit()
-    conn.close()
+def load_chart_modules():
+    global Image, CoreImage, AnswerChart
+    if AnswerChart is not None:
+        return
+    with profile.phase("import charting"):
+        from kivy.uix.image import Image
+        from kivy.core.image import Image as CoreImage
+        from chart_widgets import AnswerChart
+
+def on_main_thread(callback):
+    """Wrap a write_queue callback so it runs on the Kivy main thread."""
+    return lambda value: Clock.schedule_once(lambda dt: callback(value))
 
 class DetailsFormScreen(Screen):
     def __init__(self, **kwargs):
@@ -278,25 +77,37 @@ class DetailsFormScreen(Screen):
         self.layout.add_widget(self.location)
         self.layout.add_widget(self.phc)
         self.layout.add_widget(self.reported_by)
+        self.error = Label(text="", color=(1, 0, 0, 1), size_hint_y=None, height=30)
+        self.layout.add_widget(self.error)
         submit_btn = Button(text="Submit & Proceed", size_hint_y=None, height=50)
         submit_btn.bind(on_press=self.submit_details)
         self.layout.add_widget(submit_btn)
         self.add_widget(self.layout)
     
     def submit_details(self, instance):
-        conn = sqlite3.connect(DB_NAME)
-        c = conn.cursor()
-        c.execute('''INSERT INTO sessions (date, sub_centre, location, phc, reported_by)
-                     VALUES (?, ?, ?, ?, ?)''',
-                 (self.date.text, self.sub_centre.text, self.location.text, 
-                  self.phc.text, self.reported_by.text))
-        session_id = c.lastrowid
-        conn.commit()
-        conn.close()
+        # The session is written in the background; later writes for it find
+        # it by uid, since the queue runs them in order
+        uid = uuid.uuid4().hex
+        details = (self.date.text, self.sub_centre.text, self.location.text,
+                   self.phc.text, self.reported_by.text)
         app = App.get_running_app()
-        app.current_session_id = session_id
+        app.current_session_uid = uid
+        app.current_session_id = None
+        self.error.text = ""
+        write_queue.submit(lambda conn: add_session(conn, uid, *details),
+                           on_done=on_main_thread(lambda session_id: setattr(app, "current_session_id", session_id)),
+                           on_error=on_main_thread(lambda e: self._on_save_failed(uid)))
         app.root.current = "dashboard"
 
+    def _on_save_failed(self, uid):
+        # The form still holds what was typed, so the user can submit it again
+        app = App.get_running_app()
+        if app.current_session_uid != uid:
+            return
+        app.current_session_uid = None
+        self.error.text = "Could not save the survey details, please try again."
+        app.root.current = "details"
+
 class DashboardScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -315,9 +126,20 @@ class DashboardScreen(Screen):
         )
         show_results_btn.bind(on_press=self.show_results)
         self.layout.add_widget(show_results_btn)
+        find_session_btn = Button(
+            text="Find Past Session",
+            size_hint_y=None,
+            height=60,
+            background_color=get_color_from_hex("#36b9cc"),
+            color=(1,1,1,1),
+            font_size=18
+        )
+        find_session_btn.bind(on_press=self.find_session)
+        self.layout.add_widget(find_session_btn)
         self.add_widget(self.layout)
         Clock.schedule_once(self.load_categories)
     
+    @instrument.timed("dashboard.load_categories")
     def load_categories(self, dt):
         self.category_container.clear_widgets()
         categories = get_categories()
@@ -341,13 +163,220 @@ class DashboardScreen(Screen):
     def show_results(self, *args):
         app = App.get_running_app()
         app.root.current = "results"
-        app.root.get_screen("results").refresh_categories()
+        results = app.root.get_screen("results")
+        results.show_session(None)
+        # Answers submitted just before may still be queued; show them too
+        write_queue.after_pending(on_main_thread(lambda _: results.refresh_if_current()))
+
+    def find_session(self, *args):
+        app = App.get_running_app()
+        app.root.current = "sessions"
+        sessions = app.root.get_screen("sessions")
+        write_queue.after_pending(on_main_thread(lambda _: sessions.manager.current == "sessions" and sessions.search()))
+
+class SessionRow(RecycleDataViewBehavior, Button):
+    """One recycled session-picker entry; pressing it opens that session."""
+
+    def __init__(self, **kwargs):
+        super().__init__(
+            size_hint_y=None,
+            height=dp(56),
+            halign='left',
+            valign='middle',
+            font_size=15,
+            background_color=get_color_from_hex("#4e73df"),
+            **kwargs
+        )
+        self.session_id = None
+        self.bind(width=lambda instance, value: setattr(instance, 'text_size', (value - dp(20), None)))
+
+    def refresh_view_attrs(self, rv, index, data):
+        self.session_id = data['session_id']
+        self.text = data['text']
+
+    def on_press(self):
+        App.get_running_app().root.get_screen("sessions").open_session(self.session_id, self.text)
+
+class SessionPickerScreen(Screen):
+    """Type-ahead search over past sessions, backed by session_search."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.layout = BoxLayout(orientation='vertical', padding=20, spacing=15)
+        self.layout.add_widget(Label(text="Find a Past Session", font_size=24, bold=True,
+                                     size_hint_y=None, height=dp(40)))
+        self.query = TextInput(hint_text="Sub-centre, location, PHC or reporter", multiline=False,
+                               size_hint_y=None, height=dp(45))
+        # Search once typing pauses rather than on every keystroke
+        self._search_trigger = Clock.create_trigger(self.search, 0.15)
+        self.query.bind(text=lambda *a: self._search_trigger())
+        self.layout.add_widget(self.query)
+        self.status = Label(font_size=14, size_hint_y=None, height=dp(25), color=(0.4,0.4,0.4,1))
+        self.layout.add_widget(self.status)
+        self.session_list = RecycleView(size_hint=(1, 1))
+        session_layout = RecycleBoxLayout(orientation='vertical', size_hint_y=None, spacing=5,
+                                          default_size=(None, dp(56)), default_size_hint=(1, None))
+        session_layout.bind(minimum_height=session_layout.setter('height'))
+        self.session_list.add_widget(session_layout)
+        self.session_list.viewclass = SessionRow
+        self.layout.add_widget(self.session_list)
+        back_btn = Button(text="Back to Dashboard", size_hint_y=None, height=45,
+                          background_color=get_color_from_hex("#1cc88a"), color=(1,1,1,1), font_size=15)
+        back_btn.bind(on_press=lambda x: setattr(App.get_running_app().root, 'current', 'dashboard'))
+        self.layout.add_widget(back_btn)
+        self.add_widget(self.layout)
+
+    def on_enter(self, *args):
+        self.query.focus = True
+        self.search()
+
+    @instrument.timed("sessions.search")
+    def search(self, *args):
+        text = self.query.text.strip()
+        rows = search_sessions(text) if text else []
+        self.session_list.data = [
+            {'session_id': session_id,
+             'text': " | ".join(part or "-" for part in (date, sub_centre, location, phc, reported_by))}
+            for session_id, date, sub_centre, location, phc, reported_by in rows
+        ]
+        self.session_list.scroll_y = 1
+        if not text:
+            self.status.text = "Type to search"
+        else:
+            self.status.text = f"{len(rows)} session{'s' if len(rows) != 1 else ''} found" if rows else "No sessions found"
+
+    def open_session(self, session_id, label):
+        app = App.get_running_app()
+        app.root.current = "results"
+        app.root.get_screen("results").show_session(session_id, label)
+
+ANSWER_LABELS = PIE_LABELS
+# Marks an unanswered question in SurveyScreen.answers
+NO_ANSWER = -1
+
+class QuestionCard(RecycleDataViewBehavior, BoxLayout):
+    """One recycled questionnaire card.
+
+    Only enough cards to fill the viewport exist; RecycleView rebinds them
+    to rows as the list scrolls. The card holds no answer state of its own:
+    it reads and writes the screen's shared ``answers`` array.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(orientation="vertical", padding=dp(10), spacing=5, **kwargs)
+        self.index = 0
+        self.answers = None
+        with self.canvas.before:
+            Color(1, 1, 1, 1)
+            self.card_bg = RoundedRectangle(pos=self.pos, size=self.size, radius=[14])
+        self.bind(pos=self._update_bg, size=self._update_bg)
+
+        self.question_label = Label(
+            font_size=17,
+            bold=True,
+            color=(0.15, 0.15, 0.25, 1),
+            size_hint_y=None,
+            height=dp(35),
+            halign='left',
+            valign='middle',
+        )
+        self.question_label.bind(width=lambda instance, value: setattr(instance, 'text_size', (value, None)))
+        self.add_widget(self.question_label)
+
+        rating_box = BoxLayout(orientation='horizontal', spacing=10, size_hint_y=None, height=dp(35))
+        self.buttons = []
+        for i in range(len(ANSWER_LABELS)):
+            rb = ToggleButton(
+                group=f"card-{id(self)}",
+                text=str(i),
+                size_hint=(None, None),
+                width=dp(35),
+                height=dp(35),
+                background_color=(0.95, 0.95, 0.98, 1),
+                color=(0.2, 0.2, 0.2, 1),
+                allow_no_selection=True
+            )
+            rb.bind(on_press=lambda btn, i=i: self._on_rating(btn, i))
+            rating_box.add_widget(rb)
+            self.buttons.append(rb)
+        self.add_widget(rating_box)
+
+        label_box = BoxLayout(orientation='horizontal', spacing=10, size_hint_y=None, height=dp(20))
+        for label in ANSWER_LABELS:
+            label_box.add_widget(Label(
+                text=label, 
+                font_size=12, 
+                color=(0.3,0.3,0.3,1), 
+                size_hint=(None, None), 
+                width=dp(35), 
+                height=dp(20), 
+                halign='center', 
+                valign='middle'
+            ))
+        self.add_widget(label_box)
+
+    def _update_bg(self, *args):
+        self.card_bg.pos = self.pos
+        self.card_bg.size = self.size
+
+    @instrument.timed("survey.bind_card")
+    def refresh_view_attrs(self, rv, index, data):
+        self.index = index
+        self.answers = data['answers']
+        self.question_label.text = data['text']
+        selected = self.answers[index]
+        for i, btn in enumerate(self.buttons):
+            btn.state = 'down' if i == selected else 'normal'
+
+    def _on_rating(self, btn, i):
+        self.answers[self.index] = i if btn.state == 'down' else NO_ANSWER
+
+class QuestionViewCache:
+    """Bounded LRU of built questionnaires, keyed by category id.
+
+    Each entry holds what SurveyScreen needs to show a category without
+    touching the database: the title, the question id array, the answers
+    array and the RecycleView data that references it. The whole cache is
+    dropped when a migration changes the question bank.
+    """
+
+    def __init__(self, max_categories=8):
+        self.max_categories = max_categories
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, category_id):
+        entry = self._entries.get(category_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(category_id)
+        self.hits += 1
+        return entry
+
+    def put(self, category_id, entry):
+        self._entries[category_id] = entry
+        self._entries.move_to_end(category_id)
+        while len(self._entries) > self.max_categories:
+            self._entries.popitem(last=False)
+
+    def invalidate(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+question_view_cache = QuestionViewCache()
+add_change_listener(question_view_cache.invalidate)
 
 class SurveyScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         self.layout = BoxLayout(orientation="vertical", spacing=10, padding=10)
-        self.spinners = {}
+        # Parallel compact arrays: question ids and the selected answer per question
+        self.question_ids = array('q')
+        self.answers = array('b')
         self.build_ui()
     
     def on_pre_enter(self):
@@ -374,22 +403,36 @@ class SurveyScreen(Screen):
         ))
         self.layout.add_widget(header)
 
-        # ScrollView for questions
-        self.scroll = ScrollView(size_hint=(1, 0.8))
-        self.questions_box = BoxLayout(
-            orientation="vertical", 
-            spacing=15, 
-            size_hint_y=None, 
+        # Category title
+        self.title = Label(
+            font_size=20,
+            bold=True,
+            size_hint_y=None,
+            height=dp(40),
+            color=(0.1, 0.1, 0.1, 1)
+        )
+        self.layout.add_widget(self.title)
+
+        # Recycled list of questions: only the visible cards are ever built
+        self.questions_view = RecycleView(size_hint=(1, 0.8))
+        questions_layout = RecycleBoxLayout(
+            orientation="vertical",
+            spacing=15,
+            size_hint_y=None,
+            default_size=(None, dp(100)),
+            default_size_hint=(1, None),
             padding=[0, 10, 0, 10]
         )
-        self.questions_box.bind(minimum_height=self.questions_box.setter('height'))
-        self.scroll.add_widget(self.questions_box)
-        self.layout.add_widget(self.scroll)
+        questions_layout.bind(minimum_height=questions_layout.setter('height'))
+        self.questions_view.add_widget(questions_layout)
+        # viewclass is forwarded to the layout manager, so set it once that exists
+        self.questions_view.viewclass = QuestionCard
+        self.layout.add_widget(self.questions_view)
 
         # Navigation buttons
         btns = BoxLayout(size_hint=(1, None), height=dp(50), spacing=15, padding=[0, 5, 0, 0])
         
-        back_btn = Button(
+        self.back_btn = back_btn = Button(
             text="Back to Dashboard",
             background_color=get_color_from_hex("#6c757d"),
             font_size=16,
@@ -399,7 +442,7 @@ class SurveyScreen(Screen):
         back_btn.bind(on_press=self.back_to_dashboard)
         btns.add_widget(back_btn)
         
-        submit_btn = Button(
+        self.submit_btn = submit_btn = Button(
             text="Submit Survey",
             background_color=get_color_from_hex("#1cc88a"),
             font_size=16,
@@ -420,82 +463,37 @@ class SurveyScreen(Screen):
         self.header_bg.size = self.layout.children[-1].size
         self.header_bg.pos = self.layout.children[-1].pos
 
+    @instrument.timed("survey.load_questions")
     def load_questions(self):
-        self.questions_box.clear_widgets()
-        self.spinners.clear()
-        
         # Get current category from app
         app = App.get_running_app()
         category_id = app.current_category
-        category_name = get_category_name(category_id)
-        
-        # Add category title
-        title = Label(
-            text=f"Survey: {category_name}",
-            font_size=20,
-            bold=True,
-            size_hint_y=None,
-            height=dp(40),
-            color=(0.1, 0.1, 0.1, 1)
-        )
-        self.questions_box.add_widget(title)
         
-        # Load questions for this category
-        questions = get_questions_by_category(category_id)
-        
-        for qid, text in questions:
-            b = BoxLayout(orientation="vertical", size_hint_y=None, height=dp(100), padding=dp(10), spacing=5)
-            with b.canvas.before:
-                Color(1, 1, 1, 1)
-                RoundedRectangle(pos=b.pos, size=b.size, radius=[14])
-                b.bind(pos=self._update_card_bg, size=self._update_card_bg)
-
-            question_label = Label(
-                text=text,
-                font_size=17,
-                bold=True,
-                color=(0.15, 0.15, 0.25, 1),
-                size_hint_y=None,
-                height=dp(35),
-                halign='left',
-                valign='middle',
-            )
-            question_label.bind(width=lambda instance, value: setattr(instance, 'text_size', (value, None)))
-            b.add_widget(question_label)
-            
-            rating_box = BoxLayout(orientation='horizontal', spacing=10, size_hint_y=None, height=dp(35))
-            radio_group = []
-            for i in range(6):
-                rb = ToggleButton(
-                    group=str(qid),
-                    text=str(i),
-                    size_hint=(None, None),
-                    width=dp(35),
-                    height=dp(35),
-                    background_color=(0.95, 0.95, 0.98, 1),
-                    color=(0.2, 0.2, 0.2, 1),
-                    allow_no_selection=True
-                )
-                rating_box.add_widget(rb)
-                radio_group.append(rb)
-            self.spinners[qid] = radio_group
-            b.add_widget(rating_box)
-
-            label_box = BoxLayout(orientation='horizontal', spacing=10, size_hint_y=None, height=dp(20))
-            for label in ["Bad", "Poor", "Avg", "Optimum", "Good", "Excellent"]:
-                label_box.add_widget(Label(
-                    text=label, 
-                    font_size=12, 
-                    color=(0.3,0.3,0.3,1), 
-                    size_hint=(None, None), 
-                    width=dp(35), 
-                    height=dp(20), 
-                    halign='center', 
-                    valign='middle'
-                ))
-            b.add_widget(label_box)
-
-            self.questions_box.add_widget(b)
+        # Re-entering a cached category only clears the previous answers
+        entry = question_view_cache.get(category_id)
+        if entry is None:
+            questions = get_questions_by_category(category_id)
+            answers = array('b', [NO_ANSWER]) * len(questions)
+            entry = {
+                'title': f"Survey: {get_category_name(category_id)}",
+                'question_ids': array('q', (qid for qid, _ in questions)),
+                'answers': answers,
+                'data': [{'text': text, 'answers': answers} for _, text in questions],
+            }
+            question_view_cache.put(category_id, entry)
+        self.title.text = entry['title']
+        self.question_ids = entry['question_ids']
+        self.answers = entry['answers']
+        self.questions_view.data = entry['data']
+        # On a cache hit data is the same list, so the view would not
+        # rebind its cards by itself and they would keep the old toggles
+        self.reset_answers()
+        self.questions_view.scroll_y = 1
+
+    def reset_answers(self):
+        for i in range(len(self.answers)):
+            self.answers[i] = NO_ANSWER
+        self.questions_view.refresh_from_data()
 
     def _update_card_bg(self, instance, *args):
         for instr in instance.canvas.before.children:
@@ -504,31 +502,39 @@ class SurveyScreen(Screen):
                 instr.size = instance.size
 
     def submit(self, *a):
-        # Get current session ID
         app = App.get_running_app()
-        session_id = app.current_session_id
+        session_uid = app.current_session_uid
         
         # Validate all questions answered
-        for qid, radio_group in self.spinners.items():
-            selected = None
-            for idx, btn in enumerate(radio_group):
-                if btn.state == 'down':
-                    selected = idx
-                    break
-            if selected is None:
-                self.show_modal("Please answer all questions in this survey!", error=True)
-                return
-        
-        # Save responses
-        for qid, radio_group in self.spinners.items():
-            for idx, btn in enumerate(radio_group):
-                if btn.state == 'down':
-                    insert_response(session_id, int(qid), str(idx))
-                    btn.state = 'normal'
-                    break
+        if NO_ANSWER in self.answers:
+            self.show_modal("Please answer all questions in this survey!", error=True)
+            return
         
-        self.show_modal("Survey submitted successfully!")
+        # Saved by the writer thread in its own savepoint, so a failure never
+        # leaves a half-written category; the answers stay on screen until it
+        # has landed, so a failed save can simply be submitted again
+        answers = [(qid, str(answer)) for qid, answer in zip(self.question_ids, self.answers)]
+        self.set_saving(True)
+        write_queue.submit(
+            lambda conn: add_responses(conn, session_id_for_uid(conn, session_uid), answers),
+            on_done=on_main_thread(self._on_submitted),
+            on_error=on_main_thread(self._on_submit_failed),
+        )
+
+    def set_saving(self, saving):
+        self.submit_btn.disabled = saving
+        self.back_btn.disabled = saving
+        self.submit_btn.text = "Saving..." if saving else "Submit Survey"
+
+    def _on_submitted(self, n):
+        self.set_saving(False)
+        self.reset_answers()
         self.back_to_dashboard()
+        self.show_modal("Survey submitted successfully!")
+
+    def _on_submit_failed(self, e):
+        self.set_saving(False)
+        self.show_modal("Could not save survey, please try again.", error=True)
 
     def back_to_dashboard(self, *args):
         App.get_running_app().root.current = "dashboard"
@@ -555,6 +561,90 @@ class SurveyScreen(Screen):
         modal.add_widget(box)
         modal.open()
 
+def texture_from_png(key, png):
+    # Must run on the main thread; textures can only be created there
+    texture = CoreImage(BytesIO(png), ext='png').texture
+    chart_cache.put(key, texture, texture.width * texture.height * 4)
+    return texture
+
+class ResultRow(RecycleDataViewBehavior, BoxLayout):
+    """One recycled results row: the question and its answer chart.
+
+    Rows only exist for the part of the list near the viewport. When a row
+    is rebound to another question its chart is updated in place (native
+    charts) or its texture swapped for the new one, so textures of
+    questions scrolled far away are no longer held by any widget.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(orientation='vertical', padding=5, **kwargs)
+        self.question_label = Label(font_size=15, bold=True, size_hint_y=None, height=30, color=(0.1,0.1,0.2,1))
+        self.add_widget(self.question_label)
+        self.chart = None
+        self.chart_key = None
+        self._native_chart = None
+        self._image = None
+        self._message = Label(font_size=14)
+
+    def _show(self, widget):
+        if self.chart is not widget:
+            if self.chart is not None:
+                self.remove_widget(self.chart)
+            self.add_widget(widget)
+            self.chart = widget
+        if widget is not self._image and self._image is not None:
+            self._image.texture = None
+
+    def _show_message(self, text, color):
+        self._message.text = text
+        self._message.color = color
+        self._show(self._message)
+
+    def _show_texture(self, texture):
+        if self._image is None:
+            self._image = Image(size_hint_y=None, height=160)
+        self._show(self._image)
+        self._image.texture = texture
+
+    @instrument.timed("results.bind_row")
+    def refresh_view_attrs(self, rv, index, data):
+        self.question_label.text = data['text']
+        counts = data['counts']
+        self.chart_key = chart_key(counts)
+        if sum(counts) == 0:
+            self._show_message("No responses for this question", (0.5,0,0,1))
+        elif App.get_running_app().native_charts:
+            if self._native_chart is None:
+                self._native_chart = AnswerChart(size_hint_y=None, height=160)
+            self._native_chart.counts = counts
+            self._show(self._native_chart)
+        else:
+            # matplotlib charts show from cache at once and otherwise render in the background
+            texture = chart_cache.get(self.chart_key)
+            if texture is not None:
+                self._show_texture(texture)
+            else:
+                self._show_message("Loading chart...", (0.4,0.4,0.4,1))
+                chart_renderer.submit(
+                    counts,
+                    lambda key, png: Clock.schedule_once(lambda dt: self._on_chart_rendered(key, png)))
+
+    def _on_chart_rendered(self, key, png):
+        texture = texture_from_png(key, png)
+        # The row may have been recycled for another question meanwhile
+        if key == self.chart_key:
+            self._show_texture(texture)
+
+def session_answer_counts(rows):
+    """get_responses_by_category rows as ``[(question_id, text, [c0..c5])]``."""
+    results = OrderedDict()
+    for qid, text, answer, count in rows:
+        counts = results.setdefault(qid, (text, [0] * len(ANSWER_LABELS)))[1]
+        idx = answer_index(answer)
+        if idx is not None:
+            counts[idx] += count
+    return [(qid, text, counts) for qid, (text, counts) in results.items()]
+
 class ResultsScreen(Screen):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
@@ -565,17 +655,66 @@ class ResultsScreen(Screen):
         self.category_dropdown.bind(minimum_height=self.category_dropdown.setter('height'))
         self.layout.add_widget(Label(text="Select Survey to View Results", font_size=22, bold=True))
         self.layout.add_widget(self.category_dropdown)
-        # Results area
-        self.result_scroll = ScrollView(size_hint=(1, 1))
-        self.result_box = BoxLayout(orientation='vertical', size_hint_y=None, spacing=10)
-        self.result_box.bind(minimum_height=self.result_box.setter('height'))
-        self.result_scroll.add_widget(self.result_box)
-        self.layout.add_widget(self.result_scroll)
+        # Results area: a recycled list, so only rows near the viewport build charts
+        self.result_title = Label(font_size=20, bold=True, size_hint_y=None, height=40)
+        self.layout.add_widget(self.result_title)
+        self.result_view = RecycleView(size_hint=(1, 1))
+        result_layout = RecycleBoxLayout(
+            orientation='vertical',
+            size_hint_y=None,
+            spacing=10,
+            default_size=(None, 220),
+            default_size_hint=(1, None)
+        )
+        result_layout.bind(minimum_height=result_layout.setter('height'))
+        self.result_view.add_widget(result_layout)
+        self.result_view.viewclass = ResultRow
+        self.layout.add_widget(self.result_view)
+        # Back button
+        self.back_btn = Button(
+            text="Back to Dashboard",
+            size_hint_y=None,
+            height=45,
+            background_color=get_color_from_hex("#1cc88a"),
+            color=(1,1,1,1),
+            font_size=15
+        )
+        self.back_btn.bind(on_press=self.go_back)
+        self.layout.add_widget(self.back_btn)
+        self.selected_category = None
+        # Set when showing one past session picked on the sessions screen
+        self.session_id = None
+        self.session_label = ""
+        self.clear_results()
+
+    def show_session(self, session_id, label=""):
+        self.session_id = session_id
+        self.session_label = label
         self.selected_category = None
+        self.refresh_categories()
+
+    def refresh_if_current(self):
+        """Re-read the shown category's totals, if this screen is still showing them."""
+        if self.manager.current == "results" and self.session_id is None and self.selected_category:
+            self.show_results_for_category(self.selected_category)
+
+    def go_back(self, *args):
+        App.get_running_app().root.current = "sessions" if self.session_id else "dashboard"
 
+    def on_leave(self, *args):
+        chart_renderer.cancel_pending()
+
+    def clear_results(self):
+        chart_renderer.cancel_pending()
+        self.result_title.text = ""
+        self.result_view.data = []
+        self.back_btn.opacity = 0
+        self.back_btn.disabled = True
+
+    @instrument.timed("results.refresh_categories")
     def refresh_categories(self):
         self.category_dropdown.clear_widgets()
-        self.result_box.clear_widgets()
+        self.clear_results()
         categories = get_categories()
         for cat_id, name in categories:
             btn = Button(
@@ -589,104 +728,162 @@ class ResultsScreen(Screen):
             btn.bind(on_press=lambda x, cid=cat_id: self.show_results_for_category(cid))
             self.category_dropdown.add_widget(btn)
 
+    @instrument.timed("results.show_results_for_category")
     def show_results_for_category(self, category_id):
-        self.result_box.clear_widgets()
+        load_chart_modules()
+        self.clear_results()
+        self.selected_category = category_id
         category_name = get_category_name(category_id)
-        self.result_box.add_widget(Label(text=f"Results: {category_name}", font_size=20, bold=True, size_hint_y=None, height=40))
         
-        # Get results for this category
-        results = get_responses_by_category(category_id)
+        with instrument.span("results.load_counts"):
+            if self.session_id:
+                # One session's answers, from the live tables or its archive
+                results = session_answer_counts(get_responses_by_category(category_id, self.session_id))
+            else:
+                # Per-question answer counts come pre-aggregated from the rollup table
+                results = get_answer_counts(category_id)
         if not results:
-            self.result_box.add_widget(Label(text="No responses yet.", font_size=16, color=(1,0,0,1), size_hint_y=None, height=30))
+            self.result_title.text = "No responses yet."
             return
-        
-        # Group results by question
-        question_map = {}
-        for qid, text, answer, count in results:
-            if qid not in question_map:
-                question_map[qid] = {"text": text, "counts": [0]*6}
-            if answer is not None and answer.isdigit():
-                idx = int(answer)
-                if 0 <= idx <= 5:
-                    question_map[qid]["counts"][idx] += count
-        
-        # Display results with pie charts
-        for qid, data in question_map.items():
-            text = data["text"]
-            counts = data["counts"]
-            
-            # Create question box
-            q_box = BoxLayout(orientation='vertical', size_hint_y=None, height=220, padding=5)
-            q_box.add_widget(Label(text=text, font_size=15, bold=True, size_hint_y=None, height=30, color=(0.1,0.1,0.2,1)))
-            
-            # Add pie chart
-            if sum(counts) > 0:
-                pie_img = self.create_pie_chart(counts)
-                q_box.add_widget(pie_img)
-            else:
-                q_box.add_widget(Label(text="No responses for this question", font_size=14, color=(0.5,0,0,1)))
-            
-            self.result_box.add_widget(q_box)
-        
-        # Back button
-        back_btn = Button(
-            text="Back to Dashboard",
-            size_hint_y=None,
-            height=45,
-            background_color=get_color_from_hex("#1cc88a"),
-            color=(1,1,1,1),
-            font_size=15
-        )
-        back_btn.bind(on_press=lambda x: setattr(App.get_running_app().root, 'current', 'dashboard'))
-        self.result_box.add_widget(back_btn)
+        self.result_title.text = f"Results: {category_name}"
+        if self.session_id:
+            self.result_title.text += f" ({self.session_label})"
+        self.result_view.data = [{'text': text, 'counts': counts} for qid, text, counts in results]
+        self.result_view.scroll_y = 1
+        self.back_btn.opacity = 1
+        self.back_btn.disabled = False
 
+    @instrument.timed("results.create_pie_chart")
     def create_pie_chart(self, counts):
-        labels = ["Bad", "Poor", "Avg", "Optimum", "Good", "Excellent"]
-        # Remove zero-counts for better pie chart
-        filtered_counts = []
-        filtered_labels = []
-        for i, (count, label) in enumerate(zip(counts, labels)):
-            if count > 0:
-                filtered_counts.append(count)
-                filtered_labels.append(f"{label} ({count})")
-        
-        if not filtered_counts:
-            filtered_counts = [1]
-            filtered_labels = ["No Data"]
-        
-        # Create the pie chart
-        fig, ax = plt.subplots(figsize=(4, 3))
-        ax.pie(filtered_counts, labels=filtered_labels, autopct='%1.1f%%', startangle=90)
-        ax.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle
-        
-        # Save to buffer
-        buf = BytesIO()
-        plt.tight_layout()
-        plt.savefig(buf, format='png', dpi=100)
-        plt.close(fig)
-        buf.seek(0)
-        
-        # Convert to Kivy image
-        img = CoreImage(buf, ext='png')
-        return Image(texture=img.texture, size_hint_y=None, height=160)
+        load_chart_modules()
+        # Charts are keyed on the counts vector, so unchanged questions reuse
+        # the texture (or the PNG cached on disk) instead of re-rendering
+        key = chart_key(counts)
+        texture = chart_cache.get(key)
+        if texture is None:
+            png = chart_cache.get_png(key)
+            if png is None:
+                png = render_pie_png(counts)
+                chart_cache.put_png(key, png)
+            texture = texture_from_png(key, png)
+        return Image(texture=texture, size_hint_y=None, height=160)
+
+class PerfOverlay(Label):
+    """Frame time and the slowest recent operations, drawn over every screen.
+
+    Only created when instrumentation is switched on.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(
+            font_size=12,
+            color=(1, 1, 1, 1),
+            halign='left',
+            valign='top',
+            size_hint=(None, None),
+            size=(dp(260), dp(110)),
+            **kwargs
+        )
+        self.text_size = self.size
+        self._frames = deque(maxlen=120)
+        with self.canvas.before:
+            Color(0, 0, 0, 0.6)
+            self.bg = Rectangle(pos=self.pos, size=self.size)
+        self.bind(pos=self._update_bg)
+        Clock.schedule_interval(self._on_frame, 0)
+        Clock.schedule_interval(self.update, 0.5)
+
+    def _update_bg(self, *args):
+        self.bg.pos = self.pos
+
+    def _on_frame(self, dt):
+        self._frames.append(dt * 1000)
+
+    def update(self, dt):
+        from kivy.core.window import Window
+        self.pos = (Window.width - self.width, Window.height - self.height)
+        frames = self._frames
+        lines = [f"frame {sum(frames) / len(frames):.1f} ms avg, {max(frames):.1f} max" if frames else "frame -"]
+        lines += [f"{ms:7.1f} ms  {name}" for ms, name in instrument.recorder.slowest(5)]
+        self.text = "\n".join(lines)
 
 class SurveyApp(App):
     current_category = 1
     current_session_id = None
+    current_session_uid = None
+    # Draw results with Kivy graphics instead of matplotlib PNGs
+    native_charts = True
+    exit_code = 0
     
     def build(self):
-        create_db()
-        sm = ScreenManager()
-        
-        # Create screens
-        sm.add_widget(DetailsFormScreen(name="details"))
-        sm.add_widget(DashboardScreen(name="dashboard"))
-        sm.add_widget(SurveyScreen(name="survey"))
-        sm.add_widget(ResultsScreen(name="results"))
+        with profile.phase("create_db"):
+            create_db()
+        chart_cache.disk_dir = os.path.join(self.user_data_dir, "chart_cache")
+        with profile.phase("build screens"):
+            sm = ScreenManager()
+            
+            # Create screens
+            sm.add_widget(DetailsFormScreen(name="details"))
+            sm.add_widget(DashboardScreen(name="dashboard"))
+            sm.add_widget(SurveyScreen(name="survey"))
+            sm.add_widget(ResultsScreen(name="results"))
+            sm.add_widget(SessionPickerScreen(name="sessions"))
         
         # Start with details form
         sm.current = "details"
+        if instrument.ENABLED:
+            # Time each transition from the switch until the new screen is entered
+            self._transition_began = time.perf_counter()
+            sm.bind(current=self._on_screen_change)
+            for screen in sm.screens:
+                screen.bind(on_enter=self._on_screen_entered)
         return sm
 
+    def _on_screen_change(self, sm, name):
+        self._transition_began = time.perf_counter()
+
+    def _on_screen_entered(self, screen):
+        instrument.recorder.record(f"screen.{screen.name}", self._transition_began)
+
+    def on_start(self):
+        from kivy.core.window import Window
+        Window.bind(on_flip=self._on_first_frame)
+        if instrument.ENABLED:
+            Window.add_widget(PerfOverlay())
+
+    def _on_first_frame(self, window):
+        window.unbind(on_flip=self._on_first_frame)
+        profile.mark("first_frame")
+        report_path = os.environ.get("SURVEY_STARTUP_PROFILE")
+        if report_path:
+            self.exit_code = 0 if profile.write(report_path) else 1
+            self.stop()
+            return
+        # Warm up the Results screen while the user fills in the details form
+        Clock.schedule_once(lambda dt: load_chart_modules(), 0.5)
+        if not self.native_charts:
+            threading.Thread(target=preload_matplotlib, daemon=True).start()
+        # Weekly ANALYZE/VACUUM (and archiving, when configured), off the UI thread
+        Clock.schedule_once(lambda dt: maintenance.start(), 30)
+
+    def on_pause(self):
+        # Android may kill a paused app without calling on_stop, but it also
+        # kills one that takes too long to pause, so only wait so long
+        with instrument.span("app.pause_flush"):
+            flushed = write_queue.flush(timeout=PAUSE_FLUSH_TIMEOUT)
+        if not flushed:
+            log.warning("pausing with %d queued writes not yet saved", write_queue.stats()["pending"])
+        return True
+
+    def on_stop(self):
+        with instrument.span("app.stop_write_queue"):
+            write_queue.close()
+        chart_renderer.shutdown()
+        close_connections()
+        if instrument.TRACE_PATH:
+            instrument.recorder.dump(instrument.TRACE_PATH)
+
 if __name__ == "__main__":
-    SurveyApp().run()
+    app = SurveyApp()
+    app.run()
+    sys.exit(app.exit_code)
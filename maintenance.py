@@ -0,0 +1,98 @@
+"""Periodic database upkeep, run on a background thread.
+
+``run`` archives sessions older than the configured age (app_meta key
+``archive_after_days``, unset by default, with ``archive_period``
+``year`` or ``quarter``), then lets SQLite refresh its planner statistics
+with ``PRAGMA optimize`` (a full ``ANALYZE`` the first time), ``VACUUM``s
+when at least ``VACUUM_FREE_FRACTION`` of the file is free pages, and
+truncates the WAL. The app calls ``start`` a while after its first frame;
+it does nothing unless ``INTERVAL`` has passed since the last run
+(app_meta ``maintenance_at``).
+
+    python maintenance.py --db survey.db --archive-after 730
+"""
+import argparse
+import datetime
+import logging
+import sys
+import threading
+import time
+
+import archive
+import database
+
+log = logging.getLogger(__name__)
+
+INTERVAL = datetime.timedelta(days=7)
+# Archiving a year of sessions typically frees this much and more
+VACUUM_FREE_FRACTION = 0.2
+
+
+def is_due(conn, now=None):
+    last = database.get_meta(conn, "maintenance_at")
+    now = now or datetime.datetime.now()
+    return last is None or now - datetime.datetime.fromisoformat(last) >= INTERVAL
+
+
+def run(conn, archive_after_days=None, period=None):
+    """Run every maintenance step; returns ``{step: seconds}``."""
+    steps = {}
+
+    def step(name, fn):
+        start = time.perf_counter()
+        fn()
+        steps[name] = time.perf_counter() - start
+
+    if archive_after_days is None and database.get_meta(conn, "archive_after_days"):
+        archive_after_days = int(database.get_meta(conn, "archive_after_days"))
+    if archive_after_days is not None:
+        before = (datetime.date.today() - datetime.timedelta(days=archive_after_days)).isoformat()
+        period = period or database.get_meta(conn, "archive_period") or archive.YEAR
+        step("archive", lambda: archive.archive_sessions(conn, before, period))
+    if conn.execute("SELECT 1 FROM sqlite_master WHERE name='sqlite_stat1'").fetchone() is None:
+        step("analyze", lambda: conn.execute("ANALYZE"))
+    step("optimize", lambda: conn.execute("PRAGMA optimize"))
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    if pages and free / pages >= VACUUM_FREE_FRACTION:
+        step("vacuum", lambda: conn.execute("VACUUM"))
+    step("checkpoint", lambda: conn.execute("PRAGMA wal_checkpoint(TRUNCATE)"))
+    with conn:
+        database.set_meta(conn, "maintenance_at", datetime.datetime.now().isoformat(timespec="seconds"))
+    return steps
+
+
+def _run_if_due():
+    try:
+        conn = database.get_connection()
+        if is_due(conn):
+            log.info("maintenance done: %s", run(conn))
+    except Exception:
+        log.exception("maintenance failed")
+
+
+def start():
+    """Run maintenance on a daemon thread if it is due; returns the thread."""
+    thread = threading.Thread(target=_run_if_due, name="maintenance", daemon=True)
+    thread.start()
+    return thread
+
+
+def main(argv=None):
+    from migrations import create_db
+
+    parser = argparse.ArgumentParser(description="Archive old sessions and tidy up survey.db.")
+    parser.add_argument("--db", default=database.DB_NAME, help="path to survey.db")
+    parser.add_argument("--archive-after", type=int, metavar="DAYS", help="archive sessions older than this")
+    parser.add_argument("--period", choices=(archive.YEAR, archive.QUARTER), help="archive file per year or quarter")
+    args = parser.parse_args(argv)
+    database.manager.path = args.db
+    conn = database.get_connection()
+    create_db(conn)
+    for name, seconds in run(conn, args.archive_after, args.period).items():
+        print(f"{name:10s} {seconds * 1000:9.1f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
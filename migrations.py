@@ -0,0 +1,248 @@
+"""Versioned schema migrations for survey.db.
+
+The schema version lives in ``PRAGMA user_version``. Opening an up-to-date
+database costs one pragma read and one fingerprint lookup; only missing
+migrations run, each in its own transaction, and the question bank is
+reseeded only when its fingerprint changes. Collected sessions and
+responses are never touched.
+"""
+import archive
+import catalog
+import packed_storage
+import question_bank
+import rollups
+import session_search
+import sync
+import trends
+from database import get_connection
+
+
+def _create_base_schema(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY,
+            date TEXT,
+            sub_centre TEXT,
+            location TEXT,
+            phc TEXT,
+            reported_by TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS survey_categories (
+            id INTEGER PRIMARY KEY,
+            name TEXT UNIQUE
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS questions (
+            id INTEGER PRIMARY KEY,
+            category_id INTEGER,
+            question_text TEXT,
+            FOREIGN KEY(category_id) REFERENCES survey_categories(id)
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS responses (
+            id INTEGER PRIMARY KEY,
+            session_id INTEGER,
+            question_id INTEGER,
+            answer TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(session_id) REFERENCES sessions(id),
+            FOREIGN KEY(question_id) REFERENCES questions(id)
+        )
+    ''')
+
+
+def _create_app_meta(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS app_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+
+
+def _create_results_indexes(c):
+    # Covering indexes for both shapes of get_responses_by_category: questions
+    # are found by category, then each question's answers are read straight
+    # from the index, optionally narrowed to one session.
+    c.execute("CREATE INDEX IF NOT EXISTS idx_questions_category ON questions (category_id, id, question_text)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_responses_question_answer ON responses (question_id, answer)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_responses_session_question ON responses (session_id, question_id, answer)")
+
+
+def _create_answer_rollups(c):
+    rollups.create_tables(c)
+    rollups.refill(c)
+
+
+def _add_session_uid(c):
+    # Globally unique session identifier, so sessions collected on other
+    # devices can be imported or merged without duplicating them
+    c.execute("ALTER TABLE sessions ADD COLUMN uid TEXT")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_sessions_uid ON sessions (uid)")
+
+
+def _create_packed_responses(c):
+    # Optional one-row-per-category storage; stays empty until the database
+    # is converted with ``python packed_storage.py pack``
+    packed_storage.create_tables(c)
+
+
+def _create_trend_rollups(c):
+    # Normalised ISO day per session, then per-day and per-week counts
+    c.execute("ALTER TABLE sessions ADD COLUMN day TEXT")
+    trends.backfill_days(c)
+    trends.create_tables(c)
+    trends.refill(c, packed_storage.response_source(c))
+
+
+def _create_sync_tables(c):
+    # Pulled network counts on devices, merge revisions on a sync server
+    sync.create_tables(c)
+
+
+def _create_archive_tables(c):
+    # Index of archive files and the totals of the sessions moved into them
+    archive.create_tables(c)
+
+
+def _create_session_search(c):
+    # Full-text index for the session picker, when SQLite has FTS5
+    if session_search.create_tables(c):
+        c.execute("INSERT INTO session_search (rowid, sub_centre, location, phc, reported_by, date) "
+                  "SELECT id, sub_centre, location, phc, reported_by, date FROM sessions")
+
+
+def _add_question_retired(c):
+    # Questions dropped or reworded in question_bank are retired rather than
+    # deleted, so answers stored against them keep their question
+    c.execute("ALTER TABLE questions ADD COLUMN retired INTEGER NOT NULL DEFAULT 0")
+    c.execute("DROP INDEX IF EXISTS idx_questions_category")
+    c.execute("CREATE INDEX idx_questions_category ON questions (category_id, retired, id, question_text)")
+    # Reseed once, so questions left behind by earlier rewordings get retired
+    c.execute("DELETE FROM app_meta WHERE key='question_bank'")
+
+
+def _index_archived_uids(c):
+    # Archived uids are unique too, so imports and merges can tell an
+    # archived session from a new one. A uid moved out twice by an earlier
+    # re-import keeps only its first session.
+    c.execute("UPDATE archived_sessions SET uid = NULL WHERE uid IS NOT NULL AND id NOT IN "
+              "(SELECT MIN(id) FROM archived_sessions WHERE uid IS NOT NULL GROUP BY uid)")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_archived_sessions_uid ON archived_sessions (uid)")
+
+
+# (version, migration) pairs, applied in order. Never edit or reorder a
+# released migration; append a new one instead.
+MIGRATIONS = [
+    (1, _create_base_schema),
+    (2, _create_app_meta),
+    (3, _create_results_indexes),
+    (4, _create_answer_rollups),
+    (5, _add_session_uid),
+    (6, _create_packed_responses),
+    (7, _create_trend_rollups),
+    (8, _create_sync_tables),
+    (9, _create_archive_tables),
+    (10, _create_session_search),
+    (11, _add_question_retired),
+    (12, _index_archived_uids),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def apply_migrations(conn):
+    """Run every migration newer than the database's version.
+
+    Returns the list of versions that were applied.
+    """
+    applied = []
+    current = schema_version(conn)
+    if current > SCHEMA_VERSION:
+        raise RuntimeError(f"survey.db schema version {current} is newer than this app ({SCHEMA_VERSION})")
+    for version, migration in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            migration(conn.cursor())
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
+
+
+def seed_question_bank(conn):
+    """Bring categories and questions in line with question_bank.
+
+    Existing rows keep their ids, so stored responses stay attached to their
+    questions; questions no longer in the bank are marked retired, and
+    brought back if they return. Returns True when the bank had to be
+    reseeded.
+    """
+    fingerprint = question_bank.fingerprint()
+    row = conn.execute("SELECT value FROM app_meta WHERE key='question_bank'").fetchone()
+    if row and row[0] == fingerprint:
+        return False
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        c = conn.cursor()
+        current = set()
+        for name, questions in question_bank.CATEGORIES:
+            c.execute("INSERT OR IGNORE INTO survey_categories (name) VALUES (?)", (name,))
+            cat_id = c.execute("SELECT id FROM survey_categories WHERE name=?", (name,)).fetchone()[0]
+            existing = dict(c.execute("SELECT question_text, id FROM questions WHERE category_id=?", (cat_id,)))
+            for q in questions:
+                if q not in existing:
+                    existing[q] = c.execute('INSERT INTO questions (category_id, question_text) VALUES (?, ?)',
+                                            (cat_id, q)).lastrowid
+                current.add(existing[q])
+        retired = [(qid,) for (qid,) in c.execute("SELECT id FROM questions").fetchall() if qid not in current]
+        c.execute("UPDATE questions SET retired=0 WHERE retired")
+        c.executemany("UPDATE questions SET retired=1 WHERE id=?", retired)
+        c.execute("INSERT OR REPLACE INTO app_meta (key, value) VALUES ('question_bank', ?)", (fingerprint,))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return True
+
+
+# Callables run after create_db changed the schema or question bank, so
+# anything caching questions or categories can drop its copy.
+change_listeners = []
+
+
+def add_change_listener(callback):
+    if callback not in change_listeners:
+        change_listeners.append(callback)
+
+
+add_change_listener(catalog.invalidate)
+
+
+def create_db(conn=None):
+    """Open or create survey.db and bring it up to date.
+
+    Returns True if anything (schema or question bank) changed.
+    """
+    conn = conn or get_connection()
+    applied = apply_migrations(conn)
+    reseeded = seed_question_bank(conn)
+    changed = bool(applied) or reseeded
+    if changed:
+        for callback in list(change_listeners):
+            callback()
+    return changed
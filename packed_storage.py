@@ -0,0 +1,213 @@
+"""Optional packed answer storage.
+
+In the default ``rows`` mode every answer is its own ``responses`` row. In
+``packed`` mode a session's answers to one category are stored as a
+single ``packed_responses`` row whose ``answers`` BLOB has one byte per
+question of that category, in ``questions.id`` order: ``0``..``5`` for an
+answer and ``0xFF`` for none. A full four-category visit becomes four
+rows instead of 111. Answers outside 0..5 are not stored. Positions stay
+valid because seed_question_bank only ever appends questions; a retired
+question keeps its byte.
+
+The mode is kept in ``app_meta``. ``write_responses`` and
+``responses_by_category`` pick the right format, and the
+``response_rows`` view unpacks both formats into
+``(session_id, question_id, answer, timestamp)`` rows for anything that
+reads raw responses. SQLite materializes that view for an ORDER BY or a
+large join, so bulk readers (exporter.py, analytics.py) read
+``packed_responses`` directly instead and unpack the blobs themselves
+with ``category_questions``. Convert an existing database with::
+
+    python packed_storage.py pack --db survey.db      # or: unpack
+"""
+import argparse
+import sys
+from collections import defaultdict
+from itertools import groupby
+from operator import itemgetter
+
+import rollups
+
+ROWS = "rows"
+PACKED = "packed"
+MISSING = 0xFF
+
+# One row per answered byte of every packed blob
+_UNPACKED_SQL = '''
+    SELECT p.session_id, q.id AS question_id,
+           CASE hex(substr(p.answers, q.position, 1)) {} END AS answer,
+           p.timestamp
+    FROM packed_responses p
+    JOIN (SELECT id, category_id,
+                 ROW_NUMBER() OVER (PARTITION BY category_id ORDER BY id) AS position
+          FROM questions) q ON q.category_id = p.category_id
+    WHERE q.position <= length(p.answers)
+      AND hex(substr(p.answers, q.position, 1)) != 'FF'
+'''.format(" ".join(f"WHEN '0{i}' THEN '{i}'" for i in range(len(rollups.ANSWER_COLUMNS))))
+
+
+def create_tables(c):
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS packed_responses (
+            id INTEGER PRIMARY KEY,
+            session_id INTEGER,
+            category_id INTEGER,
+            answers BLOB NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY(session_id) REFERENCES sessions(id),
+            FOREIGN KEY(category_id) REFERENCES survey_categories(id)
+        )
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_packed_category ON packed_responses (category_id, session_id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_packed_session ON packed_responses (session_id, category_id)")
+    c.execute(f"CREATE VIEW IF NOT EXISTS response_rows AS "
+              f"SELECT session_id, question_id, answer, timestamp FROM responses UNION ALL {_UNPACKED_SQL}")
+
+
+def storage_mode(conn):
+    row = conn.execute("SELECT value FROM app_meta WHERE key='storage_mode'").fetchone()
+    return row[0] if row else ROWS
+
+
+def response_source(conn):
+    """Table or view that holds every response in row form."""
+    return "response_rows" if storage_mode(conn) == PACKED else "responses"
+
+
+def question_layout(conn):
+    """Return ``({question_id: (category_id, position)}, {category_id: width})``."""
+    positions = {}
+    widths = defaultdict(int)
+    for qid, category_id in conn.execute("SELECT id, category_id FROM questions ORDER BY category_id, id"):
+        positions[qid] = (category_id, widths[category_id])
+        widths[category_id] += 1
+    return positions, dict(widths)
+
+
+def category_questions(conn):
+    """``{category_id: [question_id, ...]}``, each list in blob byte order."""
+    questions = defaultdict(list)
+    for qid, category_id in conn.execute("SELECT id, category_id FROM questions ORDER BY category_id, id"):
+        questions[category_id].append(qid)
+    return dict(questions)
+
+
+def pack(answers, positions, widths):
+    """Pack ``(question_id, answer)`` pairs into ``[(category_id, blob)]``.
+
+    A question answered twice starts a second blob for its category, the
+    same way the rows format would simply hold two rows.
+    """
+    blobs = defaultdict(list)
+    for question_id, answer in answers:
+        category_id, position = positions[question_id]
+        value = rollups.answer_index(answer)
+        value = MISSING if value is None else value
+        for blob in blobs[category_id]:
+            if blob[position] == MISSING:
+                blob[position] = value
+                break
+        else:
+            blob = bytearray([MISSING]) * widths[category_id]
+            blob[position] = value
+            blobs[category_id].append(blob)
+    return [(category_id, bytes(blob)) for category_id, category_blobs in blobs.items() for blob in category_blobs]
+
+
+def write_responses(conn, session_id, answers, layout=None):
+    """Store one session's ``(question_id, answer)`` pairs in the current format.
+
+    Must run inside the caller's transaction.
+    """
+    if storage_mode(conn) != PACKED:
+        conn.executemany('''INSERT INTO responses (session_id, question_id, answer) VALUES (?, ?, ?)''',
+                         [(session_id, question_id, answer) for question_id, answer in answers])
+        return
+    _insert_packed(conn, session_id, answers, *(layout or question_layout(conn)))
+
+
+def _insert_packed(conn, session_id, answers, positions, widths):
+    conn.executemany("INSERT INTO packed_responses (session_id, category_id, answers) VALUES (?, ?, ?)",
+                     [(session_id, category_id, blob) for category_id, blob in pack(answers, positions, widths)])
+
+
+def _count_columns(blobs, width):
+    # Concatenate equal-width blobs so each question is a strided slice and
+    # bytes.count does the counting at C speed
+    data = b"".join(blob.ljust(width, bytes([MISSING])) for blob in blobs)
+    columns = [data[i::width] for i in range(width)]
+    return [[column.count(value) for value in range(len(rollups.ANSWER_COLUMNS))] for column in columns]
+
+
+def responses_by_category(conn, category_id, session_id=None):
+    """Packed-mode equivalent of database.get_responses_by_category.
+
+    Returns the same ``(question_id, question_text, answer, count)`` rows,
+    with ``(question_id, question_text, None, 0)`` for unanswered questions.
+    """
+    # Retired questions keep their blob byte, so read them all and skip them below
+    questions = conn.execute(
+        "SELECT id, question_text, retired FROM questions WHERE category_id=? ORDER BY id", (category_id,)).fetchall()
+    if session_id:
+        blobs = [blob for (blob,) in conn.execute(
+            "SELECT answers FROM packed_responses WHERE session_id=? AND category_id=?", (session_id, category_id))]
+    else:
+        blobs = [blob for (blob,) in conn.execute(
+            "SELECT answers FROM packed_responses WHERE category_id=?", (category_id,))]
+    counts = _count_columns(blobs, len(questions))
+    rows = []
+    for (qid, text, retired), question_counts in zip(questions, counts):
+        if retired:
+            continue
+        answered = [(str(value), n) for value, n in enumerate(question_counts) if n]
+        rows.extend((qid, text, answer, n) for answer, n in answered)
+        if not answered:
+            rows.append((qid, text, None, 0))
+    return rows
+
+
+def convert(conn, mode):
+    """Move every stored answer into ``mode`` (``rows`` or ``packed``)."""
+    with conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if mode == PACKED:
+            positions, widths = question_layout(conn)
+            # Streamed off the ordered cursor and written a session at a
+            # time, so memory stays flat however many rows there are
+            rows = conn.execute("SELECT session_id, question_id, answer FROM responses ORDER BY session_id, id")
+            for session_id, session_rows in groupby(rows, key=itemgetter(0)):
+                answers = [(question_id, answer) for _, question_id, answer in session_rows if question_id in positions]
+                if answers:
+                    _insert_packed(conn, session_id, answers, positions, widths)
+            conn.execute("DELETE FROM responses")
+        else:
+            conn.execute("INSERT INTO responses (session_id, question_id, answer, timestamp) "
+                         "SELECT session_id, question_id, answer, timestamp FROM (" + _UNPACKED_SQL + ")")
+            conn.execute("DELETE FROM packed_responses")
+        conn.execute("INSERT OR REPLACE INTO app_meta (key, value) VALUES ('storage_mode', ?)", (mode,))
+        # Row ids change table, so sync pushes everything again; the server
+        # merges by session uid and question, so nothing is counted twice
+        conn.execute("DELETE FROM app_meta WHERE key LIKE 'sync_watermark:%'")
+
+
+def main(argv=None):
+    import database
+    from migrations import create_db
+
+    parser = argparse.ArgumentParser(description="Convert survey.db between row and packed answer storage.")
+    parser.add_argument("command", choices=("pack", "unpack", "status"))
+    parser.add_argument("--db", default=database.DB_NAME, help="path to survey.db")
+    args = parser.parse_args(argv)
+    database.manager.path = args.db
+    conn = database.get_connection()
+    create_db(conn)
+    if args.command != "status":
+        convert(conn, PACKED if args.command == "pack" else ROWS)
+    rows = conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+    packed = conn.execute("SELECT COUNT(*) FROM packed_responses").fetchone()[0]
+    print(f"storage mode {storage_mode(conn)}: {rows} response rows, {packed} packed rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""Fixed question bank shipped with the app.
+
+The migration engine seeds ``survey_categories`` and ``questions`` from
+``CATEGORIES`` and reseeds only when ``fingerprint()`` changes.
+"""
+import hashlib
+import json
+
+# --- QUESTIONS BY SECTION ---
+infra_questions = [
+    "Is the subcentre a Government or Rented building?",
+    "What is the condition of the building? (Good/Average/Poor)",
+    "Is the surrounding cleanliness satisfactory?",
+    "Is electricity supply available?",
+    "Is power backup (Inverter/Solar) available?",
+    "Is safe drinking water available?",
+    "Are toilets available and functional?",
+    "Is the hand washing facility functional?",
+    "Is the BMWM facility functional?",
+    "Is patient seating adequate?",
+    "Are ANC IEC posters displayed?",
+    "Are Danger Signs IEC posters displayed?",
+    "Are HRP IEC posters displayed?",
+    "Are Breastfeeding IEC posters displayed?",
+    "Are BPCR IEC posters displayed?",
+    "Are BMW IEC posters displayed?",
+    "Are Steps of Hand Washing posters displayed?"
+]
+anc_questions = [
+    "Is the newborn weighing machine functional?",
+    "Is the examination table available?",
+    "Is the adult weighing scale available?",
+    "Is the infant weighing scale available?",
+    "Is the adult height scale available?",
+    "Is the infantometer available?",
+    "Is the BP apparatus available?",
+    "Is the stethoscope available?",
+    "Is the fetoscope available?",
+    "Is the thermometer (digital & low-reading) available?",
+    "Is the hemoglobinometer available?",
+    "Are urine sugar/albumin strips available?",
+    "Is a glucometer with strips available?",
+    "Is the pregnancy test kit (Nischay) available?",
+    "Is the vaccine carrier with ice packs available?",
+    "Is a measuring tape available?",
+    "Are IFA tablets available?",
+    "Are calcium tablets available?",
+    "Is albendazole available?",
+    "Are tetanus / Td vials available?",
+    "Is vitamin K injection available?",
+    "Is oxytocin injection available?",
+    "Is the emergency drug kit available?",
+    "Is the HBNC Kit for ASHA available?"
+]
+delivery_questions = [
+    "Is a digital watch available?",
+    "Is a digital thermometer available?",
+    "Is a neonatal weighing scale with sling available?",
+    "Is a baby blanket available?",
+    "Is a feeding spoon available?",
+    "Is a warm bag available?",
+    "Are essential newborn medicines available?",
+    "Are sterile gloves available?",
+    "Is a delivery/SBA kit available?",
+    "Is hand sanitizer available?",
+    "Is soap available?",
+    "Is a towel available?",
+    "Is chlorine solution available?",
+    "Is bucket & mug available?",
+    "Is a needle/hub cutter available?",
+    "Are color-coded waste bins available?",
+    "Are MCP cards with RCH ID available?",
+    "Are PMSMA stickers available?",
+    "Are ANC/PNC registers available?",
+    "Are referral slips available?",
+    "Is data entered in ANMOL/UWIN within 48 hours?",
+    "Is contact of nearest FRU displayed?",
+    "Is stock register updated?",
+    "Is ANC first visit within 12 weeks conducted?",
+    "Are all first visit lab investigations done?"
+]
+hbnc_questions = [
+    "Are all first visit clinical assessments done?",
+    "Are first visit medications given?",
+    "Is danger signs counselling provided in first visit?",
+    "Is counselling on nutrition, hygiene and breastfeeding done?",
+    "Is ANC second visit conducted between 14–26 weeks?",
+    "Are second visit lab investigations done?",
+    "Are second visit clinical assessments done?",
+    "Are second visit medications given?",
+    "Is danger signs counselling provided in second visit?",
+    "Is ANC third visit conducted?",
+    "Are third visit lab investigations done?",
+    "Are third visit clinical assessments done?",
+    "Is danger signs counselling provided in third visit?",
+    "Is ANC fourth visit (36–40 wks) conducted?",
+    "Are fourth visit lab investigations done?",
+    "Are fourth visit clinical assessments done?",
+    "Is danger signs counselling provided in fourth visit?",
+    "Is institutional delivery promoted?",
+    "Is trained staff available for deliveries?",
+    "Are referral slips/registers maintained for deliveries?",
+    "Are hygiene protocols and clean delivery kits used?",
+    "Is transport arranged for delivery?",
+    "Are HRPs/emergencies referred timely with feedback?",
+    "Are JSY/JSSK/Ija Boi incentives disbursed properly?",
+    "Is respectful maternity care ensured?",
+    "Is breastfeeding initiated within 1 hour of birth?",
+    "Is postnatal care equipment available (clamp, resuscitator, wraps)?",
+    "Are PNC visits conducted on recommended days?",
+    "Is postnatal assessment of mother and baby documented?",
+    "Is the newborn monitored for weight, feeding, danger signs?",
+    "Is exclusive breastfeeding promoted postnatally?",
+    "Are postnatal visit records properly maintained?",
+    "Is counselling on cord care, hygiene, immunization provided?",
+    "Is KMC advised for LBW/preterm babies?",
+    "Has ASHA completed 7 HBNC visits (13 for LBW)?",
+    "Did ASHA assess temperature, weight, cord care in each visit?",
+    "Is ASHA trained and equipped for HBNC?",
+    "Is exclusive breastfeeding promoted by ASHA?",
+    "Are danger signs identified and referred by ASHA?",
+    "Are ASHAs equipped with HBNC kits?",
+    "Are ASHAs trained on breastfeeding, hygiene, danger signs?",
+    "Are ASHAs oriented on JSY/Eja Boi schemes?",
+    "Are ASHA incentives regularly disbursed?",
+    "Is ASHA diary/register reviewed regularly?",
+    "Are ASHAs treated respectfully at health facilities?"
+]
+
+CATEGORIES = [
+    ("Infrastructure & Equipment", infra_questions),
+    ("ANC Services", anc_questions),
+    ("Delivery & Postnatal Care", delivery_questions),
+    ("HBNC & ASHA Activities", hbnc_questions),
+]
+
+
+def fingerprint():
+    payload = json.dumps(CATEGORIES, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
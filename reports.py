@@ -0,0 +1,186 @@
+"""Headless per-sub-centre report bundles.
+
+One report per (PHC, sub-centre) seen in ``sessions``, archived ones
+included: a PNG page per category with a pie chart for every question,
+and the same pages in one PDF. Counts for every report come from one
+grouped query over the live tables and one per archive.
+
+Rendering runs on a process pool, matplotlib's Agg backend in each
+worker, so it scales with cores rather than the GIL. It is split in two
+passes. First every distinct answer-count vector across all reports is
+rendered once into the chart disk cache (``<out>/charts``), keyed like
+the app's ChartCache; many questions share a vector, particularly in
+small sub-centres. Then each worker pastes one report's pages together
+from the cached pie PNGs with Pillow (installed with matplotlib).
+Rerunning into the same directory only renders counts it has not seen
+before.
+
+    python reports.py --db survey.db --out reports --workers 4
+"""
+import argparse
+import os
+import re
+import sys
+import textwrap
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+import archive
+import catalog
+import database
+import packed_storage
+from charts import PIE_DPI, PIE_FIGSIZE, ChartCache, chart_key, preload_matplotlib, render_pie_png
+from rollups import ANSWER_COLUMNS
+
+PAGE_COLUMNS = 3
+# Pixel heights of the page heading and of each question's title above its pie
+HEADER_HEIGHT = 80
+TITLE_HEIGHT = 40
+
+
+def _add_counts(conn, schema, responses, reports, sessions):
+    sums = ", ".join(f"SUM(r.answer = '{i}')" for i in range(len(ANSWER_COLUMNS)))
+    for phc, sub_centre, qid, *counts in conn.execute(f'''
+            SELECT COALESCE(s.phc, ''), COALESCE(s.sub_centre, ''), r.question_id, {sums}
+            FROM {schema}.{responses} r
+            JOIN {schema}.sessions s ON s.id = r.session_id
+            GROUP BY 1, 2, r.question_id'''):
+        report = reports.setdefault((phc, sub_centre), {})
+        report[qid] = tuple(map(sum, zip(report.get(qid, (0,) * len(counts)), counts)))
+    for phc, sub_centre, n in conn.execute(
+            f"SELECT COALESCE(phc, ''), COALESCE(sub_centre, ''), COUNT(*) FROM {schema}.sessions GROUP BY 1, 2"):
+        sessions[(phc, sub_centre)] = sessions.get((phc, sub_centre), 0) + n
+
+
+def report_counts(conn):
+    """``{(phc, sub_centre): {question_id: (c0..c5)}}`` plus per-report session counts.
+
+    Archived sessions are counted too, one attached archive at a time.
+    """
+    reports, sessions = {}, {}
+    _add_counts(conn, "main", packed_storage.response_source(conn), reports, sessions)
+    for schema in archive.each_archive(conn):
+        _add_counts(conn, schema, "responses", reports, sessions)
+    return reports, sessions
+
+
+def _slug(text):
+    return re.sub(r"[^\w.-]+", "_", text).strip("_")
+
+
+def report_name(phc, sub_centre):
+    return _slug(f"{phc or 'no PHC'} - {sub_centre or 'no sub-centre'}")
+
+
+def _report_cache(cache_dir):
+    # Uncapped: every chart rendered in the first pass is pasted in the second
+    return ChartCache(disk_dir=cache_dir, max_disk_files=None, max_disk_bytes=None)
+
+
+def _render_chart(cache_dir, counts):
+    cache = _report_cache(cache_dir)
+    key = chart_key(counts)
+    if cache.get_png(key) is None:
+        cache.put_png(key, render_pie_png(counts))
+
+
+def _font(size):
+    from matplotlib import font_manager
+    from PIL import ImageFont
+    try:
+        return ImageFont.truetype(font_manager.findfont("DejaVu Sans"), size)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def _render_report(cache_dir, out_dir, title, pages, formats):
+    """Lay out one report; ``pages`` is ``[(category, [(question, counts)])]``.
+
+    The pies are already rendered, so a page is only pasted together from
+    their cached PNGs: no resampling and no second matplotlib pass.
+    """
+    from PIL import Image, ImageDraw
+
+    cache = _report_cache(cache_dir)
+    heading, label = _font(22), _font(13)
+    cell_width, pie_height = (int(n * PIE_DPI) for n in PIE_FIGSIZE)
+    cell_height = pie_height + TITLE_HEIGHT
+    os.makedirs(out_dir, exist_ok=True)
+    images = []
+    for number, (category, questions) in enumerate(pages, 1):
+        rows = -(-len(questions) // PAGE_COLUMNS)
+        page = Image.new("RGB", (cell_width * PAGE_COLUMNS, HEADER_HEIGHT + cell_height * rows), "white")
+        draw = ImageDraw.Draw(page)
+        draw.multiline_text((cell_width * PAGE_COLUMNS // 2, HEADER_HEIGHT // 2), f"{title}\n{category}",
+                            fill="black", font=heading, anchor="mm", align="center")
+        for i, (question, counts) in enumerate(questions):
+            x = cell_width * (i % PAGE_COLUMNS)
+            y = HEADER_HEIGHT + cell_height * (i // PAGE_COLUMNS)
+            draw.multiline_text((x + cell_width // 2, y + TITLE_HEIGHT // 2), textwrap.fill(question, 48),
+                                fill="black", font=label, anchor="mm", align="center")
+            with Image.open(BytesIO(cache.get_png(chart_key(counts)))) as pie:
+                page.paste(pie.convert("RGB"), (x, y + TITLE_HEIGHT))
+        if "png" in formats:
+            page.save(os.path.join(out_dir, f"{number:02d}_{_slug(category)}.png"), optimize=False)
+        images.append(page)
+    if "pdf" in formats and images:
+        images[0].save(os.path.join(out_dir, "report.pdf"), save_all=True, append_images=images[1:],
+                       resolution=PIE_DPI)
+    return len(images)
+
+
+def generate_reports(out_dir, conn=None, workers=None, formats=("png", "pdf")):
+    """Write every sub-centre's report bundle under ``out_dir``; returns stats."""
+    conn = conn or database.get_connection()
+    questions = catalog.get_catalog(conn)
+    reports, sessions = report_counts(conn)
+    cache_dir = os.path.join(out_dir, "charts")
+    unique = sorted({counts for report in reports.values() for counts in report.values()})
+    stats = {"reports": len(reports), "charts": sum(map(len, reports.values())), "unique_charts": len(unique)}
+
+    workers = workers or os.cpu_count() or 1
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers, initializer=preload_matplotlib) as pool:
+        # A few chunks per worker keeps them all busy without per-chart IPC
+        chunksize = max(1, len(unique) // (4 * workers))
+        list(pool.map(_render_chart, [cache_dir] * len(unique), unique, chunksize=chunksize))
+        stats["chart_seconds"] = time.perf_counter() - start
+
+        jobs = []
+        for (phc, sub_centre), counts_by_question in sorted(reports.items()):
+            pages = []
+            for category in questions.categories:
+                answered = [(q.text, counts_by_question[q.id]) for q in category.questions if q.id in counts_by_question]
+                if answered:
+                    pages.append((category.name, answered))
+            title = f"{phc or 'No PHC'} / {sub_centre or 'No sub-centre'} ({sessions.get((phc, sub_centre), 0)} sessions)"
+            jobs.append(pool.submit(_render_report, cache_dir, os.path.join(out_dir, report_name(phc, sub_centre)),
+                                    title, pages, formats))
+        stats["pages"] = sum(job.result() for job in jobs)
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def main(argv=None):
+    from migrations import create_db
+
+    parser = argparse.ArgumentParser(description="Write a chart report for every sub-centre.")
+    parser.add_argument("--db", default=database.DB_NAME, help="path to survey.db")
+    parser.add_argument("--out", default="reports", help="output directory")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--format", choices=("png", "pdf", "both"), default="both")
+    args = parser.parse_args(argv)
+    database.manager.path = args.db
+    conn = database.get_connection()
+    create_db(conn)
+    formats = ("png", "pdf") if args.format == "both" else (args.format,)
+    stats = generate_reports(args.out, conn, args.workers, formats)
+    print(f"{stats['reports']} reports, {stats['pages']} pages, {stats['charts']} charts from "
+          f"{stats['unique_charts']} distinct count vectors in {stats['seconds']:.1f} s "
+          f"(charts {stats['chart_seconds']:.1f} s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
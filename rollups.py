@@ -0,0 +1,198 @@
+"""Answer-count rollups for the Results screen.
+
+``answer_counts`` keeps one row per question with the number of 0..5
+answers it has received; ``answer_counts_by_phc`` keeps the same counts
+per PHC. Both are bumped by the write helpers in the same transaction that
+inserts the responses, so reading a category's results is an indexed
+lookup of a few dozen rows however many responses exist. Per-session
+results need no rollup: a session has at most one answer per question and
+is served by ``idx_responses_session_question``.
+
+Answers moved out by archive.py keep being counted here. If the tables
+ever drift from ``responses`` plus the archived totals, run::
+
+    python rollups.py verify            # report mismatches, exit 1 if any
+    python rollups.py rebuild           # recompute both tables from scratch
+"""
+import argparse
+import sys
+
+ANSWER_COLUMNS = ("c0", "c1", "c2", "c3", "c4", "c5")
+
+_COLS = ", ".join(ANSWER_COLUMNS)
+_ADD_EXCLUDED = ", ".join(f"{c} = {c} + excluded.{c}" for c in ANSWER_COLUMNS)
+_SUM_ANSWERS = ", ".join(f"SUM(r.answer = '{i}') AS {col}" for i, col in enumerate(ANSWER_COLUMNS))
+
+
+def create_tables(c):
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS answer_counts (
+            question_id INTEGER PRIMARY KEY,
+            {", ".join(f"{col} INTEGER NOT NULL DEFAULT 0" for col in ANSWER_COLUMNS)},
+            FOREIGN KEY(question_id) REFERENCES questions(id)
+        )
+    ''')
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS answer_counts_by_phc (
+            question_id INTEGER NOT NULL,
+            phc TEXT NOT NULL,
+            {", ".join(f"{col} INTEGER NOT NULL DEFAULT 0" for col in ANSWER_COLUMNS)},
+            PRIMARY KEY (question_id, phc),
+            FOREIGN KEY(question_id) REFERENCES questions(id)
+        ) WITHOUT ROWID
+    ''')
+
+
+def answer_index(answer):
+    if answer is not None and str(answer).isdigit():
+        idx = int(answer)
+        if 0 <= idx < len(ANSWER_COLUMNS):
+            return idx
+    return None
+
+
+def bump(conn, session_id, answers, phc=None):
+    """Add ``(question_id, answer)`` pairs of one session to the rollups.
+
+    Must be called inside the transaction that inserts the responses. Pass
+    the session's ``phc`` when it is already known to skip looking it up.
+    """
+    deltas = {}
+    for question_id, answer in answers:
+        idx = answer_index(answer)
+        if idx is None:
+            continue
+        deltas.setdefault(question_id, [0] * len(ANSWER_COLUMNS))[idx] += 1
+    if not deltas:
+        return
+    if phc is None:
+        row = conn.execute("SELECT phc FROM sessions WHERE id=?", (session_id,)).fetchone()
+        phc = row[0] if row else None
+    phc = phc or ""
+    add_counts(conn, {(qid, phc): counts for qid, counts in deltas.items()})
+
+
+def add_counts(conn, counts_by_phc):
+    """Add ``{(question_id, phc): [c0..c5]}`` to both rollup tables."""
+    totals = {}
+    for (qid, _), counts in counts_by_phc.items():
+        total = totals.setdefault(qid, [0] * len(ANSWER_COLUMNS))
+        for i, n in enumerate(counts):
+            total[i] += n
+    placeholders = ", ".join("?" * len(ANSWER_COLUMNS))
+    conn.executemany(
+        f"INSERT INTO answer_counts (question_id, {_COLS}) VALUES (?, {placeholders}) "
+        f"ON CONFLICT(question_id) DO UPDATE SET {_ADD_EXCLUDED}",
+        [(qid, *counts) for qid, counts in totals.items()])
+    conn.executemany(
+        f"INSERT INTO answer_counts_by_phc (question_id, phc, {_COLS}) VALUES (?, ?, {placeholders}) "
+        f"ON CONFLICT(question_id, phc) DO UPDATE SET {_ADD_EXCLUDED}",
+        [(qid, phc or "", *counts) for (qid, phc), counts in counts_by_phc.items()])
+
+
+def get_answer_counts(conn, category_id, phc=None):
+    """Return ``[(question_id, question_text, [c0..c5]), ...]`` for a category."""
+    if phc is None:
+        rows = conn.execute(f'''
+            SELECT q.id, q.question_text, {", ".join(f"a.{c}" for c in ANSWER_COLUMNS)}
+            FROM questions q
+            LEFT JOIN answer_counts a ON a.question_id = q.id
+            WHERE q.category_id=? AND q.retired = 0
+            ORDER BY q.id
+        ''', (category_id,))
+    else:
+        rows = conn.execute(f'''
+            SELECT q.id, q.question_text, {", ".join(f"a.{c}" for c in ANSWER_COLUMNS)}
+            FROM questions q
+            LEFT JOIN answer_counts_by_phc a ON a.question_id = q.id AND a.phc = ?
+            WHERE q.category_id=? AND q.retired = 0
+            ORDER BY q.id
+        ''', (phc, category_id))
+    return [(qid, text, [count or 0 for count in counts]) for qid, text, *counts in rows]
+
+
+def _has_archived_counts(c):
+    return c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='archived_counts'").fetchone() is not None
+
+
+def _fresh_counts_sql(source="responses", archived=False):
+    # ``source`` is the responses table, or packed_storage's response_rows
+    # view when answers are stored packed
+    queries = {
+        "answer_counts": ("question_id", f'''
+            SELECT r.question_id AS question_id, {_SUM_ANSWERS}
+            FROM {source} r
+            GROUP BY r.question_id
+        '''),
+        "answer_counts_by_phc": ("question_id, phc", f'''
+            SELECT r.question_id AS question_id, COALESCE(s.phc, '') AS phc, {_SUM_ANSWERS}
+            FROM {source} r
+            LEFT JOIN sessions s ON s.id = r.session_id
+            GROUP BY r.question_id, COALESCE(s.phc, '')
+        '''),
+    }
+    if not archived:
+        return {table: select for table, (_, select) in queries.items()}
+    # Sessions moved out by archive.py still count, through the totals it
+    # keeps in archived_counts
+    sums = ", ".join(f"SUM({col})" for col in ANSWER_COLUMNS)
+    return {table: f'''
+                SELECT {key}, {sums}
+                FROM ({select} UNION ALL SELECT {key}, {_COLS} FROM archived_counts)
+                GROUP BY {key}
+            ''' for table, (key, select) in queries.items()}
+
+
+def refill(c, source="responses"):
+    for table, select in _fresh_counts_sql(source, _has_archived_counts(c)).items():
+        c.execute(f"DELETE FROM {table}")
+        key = "question_id" if table == "answer_counts" else "question_id, phc"
+        c.execute(f"INSERT INTO {table} ({key}, {_COLS}) {select}")
+
+
+def rebuild(conn, source="responses"):
+    with conn:
+        refill(conn, source)
+
+
+def verify(conn, source="responses"):
+    """Return a list of ``(table, key, stored, expected)`` mismatches."""
+    mismatches = []
+    for table, select in _fresh_counts_sql(source, _has_archived_counts(conn)).items():
+        width = 1 if table == "answer_counts" else 2
+        expected = {tuple(row[:width]): tuple(row[width:]) for row in conn.execute(select)}
+        stored = {tuple(row[:width]): tuple(row[width:])
+                  for row in conn.execute(f"SELECT * FROM {table}")}
+        empty = (0,) * len(ANSWER_COLUMNS)
+        for key in expected.keys() | stored.keys():
+            want = expected.get(key, empty)
+            have = stored.get(key, empty)
+            if want != have:
+                mismatches.append((table, key, have, want))
+    return mismatches
+
+
+def main(argv=None):
+    import database
+    import packed_storage
+
+    parser = argparse.ArgumentParser(description="Verify or rebuild the answer-count rollups.")
+    parser.add_argument("command", choices=("verify", "rebuild"))
+    parser.add_argument("--db", default=database.DB_NAME, help="path to survey.db")
+    args = parser.parse_args(argv)
+    database.manager.path = args.db
+    conn = database.get_connection()
+    source = packed_storage.response_source(conn)
+    if args.command == "rebuild":
+        rebuild(conn, source)
+        print("rollups rebuilt")
+        return 0
+    mismatches = verify(conn, source)
+    for table, key, have, want in mismatches:
+        print(f"{table} {key}: stored {have}, expected {want}")
+    print(f"{len(mismatches)} mismatching rollup rows")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
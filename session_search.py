@@ -0,0 +1,139 @@
+"""Full-text lookup of past sessions for the session picker.
+
+``session_search`` is an FTS5 index of each session's sub-centre,
+location, PHC and reporter (plus its date, stored but not indexed),
+keyed by session id and kept current by triggers on ``sessions``. Words
+typed are matched as prefixes (see ``match_query``), and prefix indexes
+for 1-3 characters keep type-ahead to a few index pages. Results come
+newest first straight from the rowid order with a LIMIT, so nothing is
+sorted however many sessions match. Sessions moved out by archive.py
+stay in the index (its delete trigger skips ids listed in
+``archived_sessions``), so they can still be found and reopened. The
+migration that creates the index only fills it from live sessions; run
+with ``--rebuild`` once to add sessions archived before then.
+
+SQLite builds without FTS5 get no index and fall back to a LIKE scan.
+
+    python session_search.py "phc 3 sc 3-2" --db survey.db
+"""
+import argparse
+import re
+import sqlite3
+import sys
+
+COLUMNS = ("sub_centre", "location", "phc", "reported_by")
+DEFAULT_LIMIT = 20
+
+_INDEXED = ", ".join(COLUMNS)
+_NEW = ", ".join(f"new.{col}" for col in ("id", *COLUMNS, "date"))
+
+
+def create_tables(c):
+    try:
+        c.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS session_search USING fts5(
+                {_INDEXED}, date UNINDEXED,
+                tokenize = 'unicode61 remove_diacritics 2',
+                prefix = '1 2 3'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        if "fts5" not in str(e):
+            raise
+        return False
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS sessions_search_insert AFTER INSERT ON sessions BEGIN
+            INSERT INTO session_search (rowid, {_INDEXED}, date) VALUES ({_NEW});
+        END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS sessions_search_update AFTER UPDATE OF {_INDEXED}, date ON sessions BEGIN
+            DELETE FROM session_search WHERE rowid = old.id;
+            INSERT INTO session_search (rowid, {_INDEXED}, date) VALUES ({_NEW});
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS sessions_search_delete AFTER DELETE ON sessions
+        WHEN NOT EXISTS (SELECT 1 FROM archived_sessions WHERE id = old.id) BEGIN
+            DELETE FROM session_search WHERE rowid = old.id;
+        END
+    ''')
+    return True
+
+
+def available(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name='session_search'").fetchone() is not None
+
+
+def rebuild(conn):
+    """Re-index every live and archived session."""
+    import archive
+
+    with conn:
+        conn.execute("DELETE FROM session_search")
+        conn.execute(f"INSERT INTO session_search (rowid, {_INDEXED}, date) SELECT id, {_INDEXED}, date FROM sessions")
+    for (name,) in conn.execute("SELECT name FROM archives").fetchall():
+        with archive.attached(conn, name) as schema, conn:
+            conn.execute(f"INSERT OR REPLACE INTO session_search (rowid, {_INDEXED}, date) "
+                         f"SELECT id, {_INDEXED}, date FROM {schema}.sessions")
+
+
+def match_query(text):
+    """FTS5 query for ``text``, or None when it has no words.
+
+    Every space-separated chunk must match the start of a word in the
+    session; a chunk such as "2-3" is a phrase, so it does not find "3-2".
+    Numbers before the last chunk are matched whole, so "sc 2-3 v" does
+    not also find "SC 2-31".
+    """
+    chunks = [re.findall(r"\w+", chunk) for chunk in text.lower().split()]
+    chunks = [" ".join(words) for words in chunks if words]
+    return " ".join(f'"{chunk}"' if chunk.replace(" ", "").isdigit() and i < len(chunks) - 1 else f'"{chunk}"*'
+                    for i, chunk in enumerate(chunks)) or None
+
+
+def search(conn, text, limit=DEFAULT_LIMIT):
+    """Return ``[(session_id, date, sub_centre, location, phc, reported_by)]``, newest first."""
+    query = match_query(text)
+    if query is None:
+        return []
+    if available(conn):
+        return conn.execute(f'''
+            SELECT rowid, date, {_INDEXED} FROM session_search
+            WHERE session_search MATCH ?
+            ORDER BY rowid DESC LIMIT ?''', (query, limit)).fetchall()
+    words = re.findall(r"\w+", text.lower())
+    where = " AND ".join(f"({' OR '.join(f'{col} LIKE ?' for col in COLUMNS)})" for _ in words)
+    params = [f"%{word}%" for word in words for _ in COLUMNS]
+    return conn.execute(f"SELECT id, date, {_INDEXED} FROM sessions WHERE {where} ORDER BY id DESC LIMIT ?",
+                        (*params, limit)).fetchall()
+
+
+def main(argv=None):
+    import time
+
+    import database
+    from migrations import create_db
+
+    parser = argparse.ArgumentParser(description="Find past sessions by sub-centre, location, PHC or reporter.")
+    parser.add_argument("text", nargs="?", default="", help="words to match as prefixes")
+    parser.add_argument("--db", default=database.DB_NAME, help="path to survey.db")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    parser.add_argument("--rebuild", action="store_true", help="re-index every session first")
+    args = parser.parse_args(argv)
+    database.manager.path = args.db
+    conn = database.get_connection()
+    create_db(conn)
+    if args.rebuild:
+        rebuild(conn)
+    start = time.perf_counter()
+    rows = search(conn, args.text, args.limit)
+    elapsed = (time.perf_counter() - start) * 1000
+    for session_id, date, *details in rows:
+        print(f"{session_id:8d}  {date or '-':10s}  " + " | ".join(d or "-" for d in details))
+    print(f"{len(rows)} sessions in {elapsed:.2f} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,69 @@
+"""Startup profiler for SurveyApp.
+
+``profile`` records how long each import group and startup phase took and
+the time to the first drawn frame, all in milliseconds since this module
+was imported (main.py imports it first). Set ``SURVEY_STARTUP_PROFILE`` to
+a file path to have the app write the report there as JSON and quit after
+the first frame; it exits non-zero when time-to-first-frame exceeds
+``SURVEY_STARTUP_BUDGET_MS`` (default ``STARTUP_BUDGET_MS``).
+"""
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+STARTUP_BUDGET_MS = 1500.0
+
+
+class StartupProfile:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.marks = {}
+
+    def _now_ms(self):
+        return (time.perf_counter() - self.start) * 1000
+
+    @contextmanager
+    def phase(self, name):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + (time.perf_counter() - begin) * 1000
+
+    def mark(self, name):
+        self.marks.setdefault(name, self._now_ms())
+
+    @property
+    def first_frame_ms(self):
+        return self.marks.get("first_frame")
+
+    def report(self):
+        return {
+            "first_frame_ms": self.first_frame_ms,
+            "phases_ms": dict(self.phases),
+            "marks_ms": dict(self.marks),
+        }
+
+    def check_budget(self, budget_ms=None):
+        if budget_ms is None:
+            budget_ms = float(os.environ.get("SURVEY_STARTUP_BUDGET_MS", STARTUP_BUDGET_MS))
+        return self.first_frame_ms is not None and self.first_frame_ms <= budget_ms
+
+    def write(self, path, budget_ms=None):
+        """Write the report to ``path`` and return whether the budget was met."""
+        ok = self.check_budget(budget_ms)
+        report = self.report()
+        report["within_budget"] = ok
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        if not ok:
+            log.error("startup took %s ms, over budget", self.first_frame_ms)
+        return ok
+
+
+profile = StartupProfile()
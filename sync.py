@@ -0,0 +1,383 @@
+"""Multi-device sync: push new responses to an aggregation server.
+
+Every tablet keeps its own survey.db. ``push`` sends only the responses
+stored since the device's last sync, as gzip-compressed JSON batches of
+sessions with their answers, and moves a per-table watermark (the last
+pushed response row id, kept in ``app_meta``) after each batch the server
+accepts. A push therefore costs as much as the new data, however large
+the database is, and an interrupted push resumes from the last accepted
+batch. ``pull`` then fetches the aggregate answer counts that changed on
+the server since the device's last pull into ``network_answer_counts``.
+
+The server (``python sync.py serve``) is itself a survey.db. It merges a
+batch by session uid and question, so re-sent batches and sessions pushed
+in several parts are only counted once, and it keeps its rollups and
+trends current through the normal write helpers. Its asyncio front end
+takes any number of devices at once; merges run one at a time on a
+single database thread. Questions travel as category name and question
+text, so devices whose question ids differ still merge correctly.
+
+    python sync.py serve --db server.db --port 8765
+    python sync.py push --server http://10.0.0.2:8765 --db survey.db
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import sys
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import archive
+import catalog
+import database
+import packed_storage
+from rollups import ANSWER_COLUMNS, answer_index
+
+log = logging.getLogger(__name__)
+
+BATCH_ROWS = 5000
+MAX_BODY_BYTES = 64 * 2 ** 20
+SESSION_COLUMNS = ("date", "day", "sub_centre", "location", "phc", "reported_by")
+
+_COLS = ", ".join(ANSWER_COLUMNS)
+
+
+def create_tables(c):
+    # Device side: the server's counts as of the last pull
+    c.execute(f'''
+        CREATE TABLE IF NOT EXISTS network_answer_counts (
+            question_id INTEGER NOT NULL,
+            phc TEXT NOT NULL,
+            {", ".join(f"{col} INTEGER NOT NULL DEFAULT 0" for col in ANSWER_COLUMNS)},
+            PRIMARY KEY (question_id, phc),
+            FOREIGN KEY(question_id) REFERENCES questions(id)
+        ) WITHOUT ROWID
+    ''')
+    # Server side: the merge revision that last changed each count
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS sync_changes (
+            question_id INTEGER NOT NULL,
+            phc TEXT NOT NULL,
+            revision INTEGER NOT NULL,
+            PRIMARY KEY (question_id, phc)
+        ) WITHOUT ROWID
+    ''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_sync_changes_revision ON sync_changes (revision)")
+
+
+def device_id(conn):
+    value = database.get_meta(conn, "device_id")
+    if value is None:
+        value = uuid.uuid4().hex
+        with conn:
+            database.set_meta(conn, "device_id", value)
+    return value
+
+
+# --- device side -------------------------------------------------------------
+
+def _pending_rows(conn, table, watermark, limit):
+    """``(row_id, session_id, question_id, answer)`` rows stored after ``watermark``."""
+    if table == "responses":
+        return conn.execute(
+            "SELECT id, session_id, question_id, answer FROM responses WHERE id > ? ORDER BY id LIMIT ?",
+            (watermark, limit)).fetchall()
+    questions = packed_storage.category_questions(conn)
+    rows = []
+    for row_id, session_id, category_id, blob in conn.execute(
+            "SELECT id, session_id, category_id, answers FROM packed_responses WHERE id > ? ORDER BY id LIMIT ?",
+            (watermark, max(1, limit // 16))):
+        for qid, value in zip(questions.get(category_id, ()), blob):
+            if value != packed_storage.MISSING:
+                rows.append((row_id, session_id, qid, str(value)))
+    return rows
+
+
+def build_batch(conn, table, watermark, limit=BATCH_ROWS):
+    """Return ``(payload, last_row_id)`` for the next batch, or ``(None, watermark)``."""
+    rows = _pending_rows(conn, table, watermark, limit)
+    if not rows:
+        return None, watermark
+    device = device_id(conn)
+    questions = catalog.get_catalog(conn)
+    session_ids = sorted({session_id for _, session_id, _, _ in rows})
+    sessions = {}
+    with conn:
+        for sid in session_ids:
+            row = conn.execute(f"SELECT uid, {', '.join(SESSION_COLUMNS)} FROM sessions WHERE id=?", (sid,)).fetchone()
+            if row is None:
+                continue
+            uid = row[0]
+            if uid is None:
+                # Sessions from before uids existed get a stable one now
+                uid = f"{device}:{sid}"
+                conn.execute("UPDATE sessions SET uid=? WHERE id=?", (uid, sid))
+            sessions[sid] = {"uid": uid, **dict(zip(SESSION_COLUMNS, row[1:])), "answers": []}
+    for _, sid, qid, answer in rows:
+        question = questions.question(qid)
+        if sid in sessions and question is not None:
+            sessions[sid]["answers"].append([questions.category_name(question.category_id), question.text, answer])
+    return {"device": device, "sessions": list(sessions.values())}, rows[-1][0]
+
+
+def encode(payload):
+    return gzip.compress(json.dumps(payload, separators=(",", ":")).encode("utf-8"))
+
+
+def _request(url, data=None, timeout=60):
+    headers = {"Accept-Encoding": "gzip"}
+    if data is not None:
+        headers.update({"Content-Type": "application/json", "Content-Encoding": "gzip"})
+    request = urllib.request.Request(url, data=data, headers=headers, method="POST" if data else "GET")
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        payload = response.read()
+        if response.headers.get("Content-Encoding") == "gzip":
+            payload = gzip.decompress(payload)
+    return json.loads(payload)
+
+
+def push(server, conn=None, batch_rows=BATCH_ROWS):
+    """Send every response stored since the last push; returns totals."""
+    conn = conn or database.get_connection()
+    totals = {"batches": 0, "bytes": 0, "sessions": 0, "responses": 0, "duplicates": 0, "rejected": 0}
+    for table in ("responses", "packed_responses"):
+        key = database.WATERMARK_PREFIX + table
+        watermark = int(database.get_meta(conn, key, 0))
+        while True:
+            payload, last_id = build_batch(conn, table, watermark, batch_rows)
+            if payload is None:
+                break
+            data = encode(payload)
+            result = _request(server.rstrip("/") + "/push", data)
+            with conn:
+                database.set_meta(conn, key, last_id)
+            watermark = last_id
+            totals["batches"] += 1
+            totals["bytes"] += len(data)
+            for name in ("sessions", "responses", "duplicates", "rejected"):
+                totals[name] += result.get(name, 0)
+    return totals
+
+
+def pull(server, conn=None):
+    """Fetch counts changed on the server since the last pull; returns how many."""
+    conn = conn or database.get_connection()
+    since = int(database.get_meta(conn, "sync_revision", 0))
+    result = _request(server.rstrip("/") + "/counts?" + urllib.parse.urlencode({"since": since}))
+    questions = {(c.name, q.text): q.id for c in catalog.get_catalog(conn).categories for q in c.questions}
+    rows = [(questions[(category, text)], phc, *counts)
+            for category, text, phc, counts in result["counts"] if (category, text) in questions]
+    with conn:
+        conn.executemany(f"INSERT OR REPLACE INTO network_answer_counts (question_id, phc, {_COLS}) "
+                         f"VALUES (?, ?, {', '.join('?' * len(ANSWER_COLUMNS))})", rows)
+        database.set_meta(conn, "sync_revision", result["revision"])
+    return len(rows)
+
+
+def sync(server, conn=None):
+    totals = push(server, conn)
+    totals["counts"] = pull(server, conn)
+    return totals
+
+
+# --- server side -------------------------------------------------------------
+
+def merge_batch(conn, payload):
+    """Merge one pushed batch inside a single transaction; returns totals."""
+    # Retired questions included, so answers from devices on an older bank still count
+    questions = {(category, text): qid for qid, category, text in conn.execute(
+        "SELECT q.id, c.name, q.question_text FROM questions q JOIN survey_categories c ON c.id = q.category_id")}
+    source = packed_storage.response_source(conn)
+    totals = {"sessions": 0, "responses": 0, "duplicates": 0, "rejected": 0}
+    changed = set()
+    with conn:
+        for session in payload["sessions"]:
+            details = [session.get(column) for column in SESSION_COLUMNS]
+            if not database.session_exists(conn, session["uid"]):
+                session_id = conn.execute(f"INSERT INTO sessions (uid, {', '.join(SESSION_COLUMNS)}) "
+                                          f"VALUES (?, {', '.join('?' * len(SESSION_COLUMNS))})",
+                                          (session["uid"], *details)).lastrowid
+                answered = set()
+                totals["sessions"] += 1
+            elif archive.archive_of_uid(conn, session["uid"]):
+                # Archived here: its answers are already in the archived totals
+                totals["duplicates"] += len(session["answers"])
+                continue
+            else:
+                session_id = database.session_id_for_uid(conn, session["uid"])
+                answered = {qid for (qid,) in conn.execute(
+                    f"SELECT question_id FROM {source} WHERE session_id=?", (session_id,))}
+            answers, rejected = [], []
+            for category, text, answer in session["answers"]:
+                qid = questions.get((category, text))
+                if qid is None or answer_index(answer) is None:
+                    rejected.append((category, text, answer))
+                    continue
+                if qid in answered:
+                    totals["duplicates"] += 1
+                    continue
+                answered.add(qid)
+                answers.append((qid, answer))
+            if rejected:
+                # Unknown question or an answer outside 0..5: not stored, and not a duplicate either
+                log.warning("rejected %d answers in session %s, first %r", len(rejected), session["uid"], rejected[0])
+                totals["rejected"] += len(rejected)
+            if answers:
+                database.add_responses(conn, session_id, answers)
+                phc = session.get("phc") or ""
+                changed.update((qid, phc) for qid, _ in answers)
+                totals["responses"] += len(answers)
+        if changed:
+            revision = int(database.get_meta(conn, "sync_revision", 0)) + 1
+            database.set_meta(conn, "sync_revision", revision)
+            conn.executemany("INSERT OR REPLACE INTO sync_changes (question_id, phc, revision) VALUES (?, ?, ?)",
+                             [(qid, phc, revision) for qid, phc in changed])
+    return totals
+
+
+def changed_counts(conn, since):
+    """Counts whose merge revision is newer than ``since``, plus the current revision."""
+    revision = int(database.get_meta(conn, "sync_revision", 0))
+    questions = catalog.get_catalog(conn)
+    counts = []
+    for qid, phc, *values in conn.execute(f'''
+            SELECT a.question_id, a.phc, {", ".join(f"a.{col}" for col in ANSWER_COLUMNS)}
+            FROM sync_changes s
+            JOIN answer_counts_by_phc a ON a.question_id = s.question_id AND a.phc = s.phc
+            WHERE s.revision > ?''', (since,)):
+        question = questions.question(qid)
+        if question is not None:
+            counts.append([questions.category_name(question.category_id), question.text, phc, values])
+    return {"revision": revision, "counts": counts}
+
+
+class SyncServer:
+    """Minimal HTTP/1.1 front end: ``POST /push`` and ``GET /counts?since=N``."""
+
+    def __init__(self, host="0.0.0.0", port=8765):
+        self.host = host
+        self.port = port
+        # One thread owns the database, so merges never contend for the write lock
+        self._db = ThreadPoolExecutor(1, thread_name_prefix="sync-db")
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        async with self._server:
+            await self._server.serve_forever()
+
+    def close(self):
+        if self._server is not None:
+            self._server.close()
+        self._db.shutdown(wait=True)
+
+    async def _run_db(self, fn, *args):
+        def call():
+            return fn(database.get_connection(), *args)
+        return await asyncio.get_running_loop().run_in_executor(self._db, call)
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {"error": "batch too large"}, headers, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b""
+                status, result = await self._dispatch(method, target, headers, body)
+                close = headers.get("connection", "").lower() == "close"
+                await self._respond(writer, status, result, headers, close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, target, headers, body):
+        url = urllib.parse.urlsplit(target)
+        try:
+            if method == "POST" and url.path == "/push":
+                if headers.get("content-encoding") == "gzip":
+                    body = gzip.decompress(body)
+                return 200, await self._run_db(merge_batch, json.loads(body))
+            if method == "GET" and url.path == "/counts":
+                since = int(urllib.parse.parse_qs(url.query).get("since", ["0"])[0])
+                return 200, await self._run_db(changed_counts, since)
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            return 400, {"error": str(e)}
+        except Exception:
+            log.exception("sync request failed")
+            return 500, {"error": "internal error"}
+        return 404, {"error": f"no route for {method} {url.path}"}
+
+    async def _respond(self, writer, status, result, headers, close=False):
+        body = json.dumps(result, separators=(",", ":")).encode("utf-8")
+        extra = ""
+        if "gzip" in headers.get("accept-encoding", "") and len(body) > 1024:
+            body = gzip.compress(body)
+            extra = "Content-Encoding: gzip\r\n"
+        reason = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large"}.get(status, "Error")
+        writer.write((f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n{extra}"
+                      f"Content-Length: {len(body)}\r\nConnection: {'close' if close else 'keep-alive'}\r\n\r\n"
+                      ).encode("latin-1") + body)
+        await writer.drain()
+
+
+def main(argv=None):
+    from migrations import create_db
+
+    parser = argparse.ArgumentParser(description="Sync survey.db with an aggregation server.")
+    parser.add_argument("command", choices=("serve", "push", "pull", "sync"))
+    parser.add_argument("--db", default=database.DB_NAME, help="path to survey.db")
+    parser.add_argument("--server", default="http://127.0.0.1:8765", help="server URL (push/pull/sync)")
+    parser.add_argument("--host", default="0.0.0.0", help="address to listen on (serve)")
+    parser.add_argument("--port", type=int, default=8765, help="port to listen on (serve)")
+    args = parser.parse_args(argv)
+    database.manager.path = args.db
+    create_db()
+    if args.command == "serve":
+        logging.basicConfig(level=logging.INFO)
+
+        async def serve():
+            server = await SyncServer(args.host, args.port).start()
+            log.info("sync server listening on %s:%s", args.host, server.port)
+            try:
+                await server.serve_forever()
+            finally:
+                server.close()
+
+        try:
+            asyncio.run(serve())
+        except KeyboardInterrupt:
+            pass
+        return 0
+    if args.command == "pull":
+        print(f"{pull(args.server)} counts updated")
+        return 0
+    totals = push(args.server) if args.command == "push" else sync(args.server)
+    print(", ".join(f"{value} {name}" for name, value in totals.items()))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
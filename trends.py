@@ -0,0 +1,243 @@
+"""Daily and weekly answer-count rollups for trend queries.
+
+``sessions.date`` is whatever the surveyor typed, so every session also
+gets a normalised ISO ``day`` (falling back to the day it was recorded
+when the text cannot be parsed). ``trend_daily`` and ``trend_weekly``
+keep the number of 0..5 answers per category, PHC and day or ISO week
+(keyed by its Monday); they are bumped in the same transaction that
+inserts the responses, like the rollups in rollups.py. A trend such as
+"HBNC for PHC X over the last 12 weeks" is then a primary-key range read
+of at most 12 rows per PHC::
+
+    python trends.py show --category "HBNC & ASHA Activities" --phc "PHC X" --weeks 12
+    python trends.py verify             # report mismatches, exit 1 if any
+    python trends.py rebuild            # recompute both tables from scratch
+"""
+import argparse
+import datetime
+import sys
+
+import packed_storage
+from rollups import ANSWER_COLUMNS, answer_index
+
+DAILY = "day"
+WEEKLY = "week"
+_TABLES = {DAILY: "trend_daily", WEEKLY: "trend_weekly"}
+
+_COLS = ", ".join(ANSWER_COLUMNS)
+_ADD_EXCLUDED = ", ".join(f"{c} = {c} + excluded.{c}" for c in ANSWER_COLUMNS)
+
+# Tried in order; day-first before month-first, as entered in the field
+DATE_FORMATS = (
+    "%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%d.%m.%Y", "%Y/%m/%d",
+    "%d-%m-%y", "%d/%m/%y", "%d %b %Y", "%d %B %Y", "%b %d %Y", "%B %d %Y",
+)
+
+
+def create_tables(c):
+    for period, table in _TABLES.items():
+        c.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                category_id INTEGER NOT NULL,
+                phc TEXT NOT NULL,
+                {period} TEXT NOT NULL,
+                {", ".join(f"{col} INTEGER NOT NULL DEFAULT 0" for col in ANSWER_COLUMNS)},
+                PRIMARY KEY (category_id, phc, {period}),
+                FOREIGN KEY(category_id) REFERENCES survey_categories(id)
+            ) WITHOUT ROWID
+        ''')
+
+
+def normalize_date(text, fallback=None):
+    """Return ``text`` as an ISO ``YYYY-MM-DD`` string, or ``fallback``."""
+    text = " ".join((text or "").replace(",", " ").split())
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return fallback
+
+
+def week_start(day):
+    """Monday of the ISO week containing the ISO date ``day``."""
+    d = datetime.date.fromisoformat(day)
+    return (d - datetime.timedelta(days=d.weekday())).isoformat()
+
+
+def backfill_days(c):
+    rows = c.execute("SELECT id, date, substr(timestamp, 1, 10) FROM sessions WHERE day IS NULL").fetchall()
+    c.executemany("UPDATE sessions SET day=? WHERE id=?",
+                  [(normalize_date(date, recorded), sid) for sid, date, recorded in rows])
+
+
+def bump(conn, session_id, answers):
+    """Add ``(question_id, answer)`` pairs of one session to the trend tables.
+
+    Must be called inside the transaction that inserts the responses.
+    """
+    row = conn.execute("SELECT day, COALESCE(phc, '') FROM sessions WHERE id=?", (session_id,)).fetchone()
+    if row is None or row[0] is None:
+        return
+    day, phc = row
+    answers = [(qid, idx) for qid, idx in ((qid, answer_index(answer)) for qid, answer in answers) if idx is not None]
+    if not answers:
+        return
+    qids = sorted({qid for qid, _ in answers})
+    category_of = dict(conn.execute(
+        f"SELECT id, category_id FROM questions WHERE id IN ({', '.join('?' * len(qids))})", qids))
+    deltas = {}
+    for qid, idx in answers:
+        if qid in category_of:
+            deltas.setdefault((category_of[qid], phc, day), [0] * len(ANSWER_COLUMNS))[idx] += 1
+    add_counts(conn, deltas)
+
+
+def add_counts(conn, daily):
+    """Add ``{(category_id, phc, day): [c0..c5]}`` to the daily and weekly tables."""
+    weekly = {}
+    for (category_id, phc, day), counts in daily.items():
+        total = weekly.setdefault((category_id, phc, week_start(day)), [0] * len(ANSWER_COLUMNS))
+        for i, n in enumerate(counts):
+            total[i] += n
+    placeholders = ", ".join("?" * len(ANSWER_COLUMNS))
+    for period, counts_by_key in ((DAILY, daily), (WEEKLY, weekly)):
+        conn.executemany(
+            f"INSERT INTO {_TABLES[period]} (category_id, phc, {period}, {_COLS}) VALUES (?, ?, ?, {placeholders}) "
+            f"ON CONFLICT(category_id, phc, {period}) DO UPDATE SET {_ADD_EXCLUDED}",
+            [(*key, *counts) for key, counts in counts_by_key.items()])
+
+
+def _has_archived_counts(c):
+    row = c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='archived_trend_daily'").fetchone()
+    return row is not None
+
+
+def _fresh_counts_sql(source, archived=False):
+    sums = ", ".join(f"SUM(r.answer = '{i}') AS {col}" for i, col in enumerate(ANSWER_COLUMNS))
+    daily = f'''
+        SELECT q.category_id AS category_id, COALESCE(s.phc, '') AS phc, s.day AS day, {sums}
+        FROM {source} r
+        JOIN sessions s ON s.id = r.session_id
+        JOIN questions q ON q.id = r.question_id
+        WHERE s.day IS NOT NULL
+        GROUP BY q.category_id, COALESCE(s.phc, ''), s.day
+    '''
+    if archived:
+        # Plus the daily totals archive.py kept for the sessions it moved out
+        daily = f'''
+            SELECT category_id, phc, day, {", ".join(f"SUM({col}) AS {col}" for col in ANSWER_COLUMNS)}
+            FROM ({daily} UNION ALL SELECT category_id, phc, day, {_COLS} FROM archived_trend_daily)
+            GROUP BY category_id, phc, day
+        '''
+    # date(day, 'weekday 0', '-6 days') is the Monday on or before day
+    weekly = f'''
+        SELECT category_id, phc, date(day, 'weekday 0', '-6 days') AS week,
+               {", ".join(f"SUM({col})" for col in ANSWER_COLUMNS)}
+        FROM ({daily})
+        GROUP BY category_id, phc, week
+    '''
+    return {DAILY: daily, WEEKLY: weekly}
+
+
+def refill(c, source="responses"):
+    for period, select in _fresh_counts_sql(source, _has_archived_counts(c)).items():
+        table = _TABLES[period]
+        c.execute(f"DELETE FROM {table}")
+        c.execute(f"INSERT INTO {table} (category_id, phc, {period}, {_COLS}) {select}")
+
+
+def rebuild(conn, source="responses"):
+    with conn:
+        refill(conn, source)
+
+
+def verify(conn, source="responses"):
+    """Return a list of ``(table, key, stored, expected)`` mismatches."""
+    mismatches = []
+    empty = (0,) * len(ANSWER_COLUMNS)
+    for period, select in _fresh_counts_sql(source, _has_archived_counts(conn)).items():
+        table = _TABLES[period]
+        expected = {tuple(row[:3]): tuple(row[3:]) for row in conn.execute(select)}
+        stored = {tuple(row[:3]): tuple(row[3:]) for row in conn.execute(
+            f"SELECT category_id, phc, {period}, {_COLS} FROM {table}")}
+        for key in expected.keys() | stored.keys():
+            want = expected.get(key, empty)
+            have = stored.get(key, empty)
+            if want != have:
+                mismatches.append((table, key, have, want))
+    return mismatches
+
+
+def score(counts):
+    """Mean answer for a ``[c0..c5]`` list, or None when nothing was answered."""
+    total = sum(counts)
+    return sum(i * n for i, n in enumerate(counts)) / total if total else None
+
+
+def get_trend(conn, category_id, phc=None, periods=12, period=WEEKLY, end=None):
+    """Return ``[(period_start, [c0..c5], mean), ...]`` oldest first.
+
+    Covers the ``periods`` days or weeks up to and including ``end`` (an ISO
+    date, default today); periods without answers have zero counts and a
+    mean of None. Without ``phc`` every PHC is summed.
+    """
+    end = end or datetime.date.today().isoformat()
+    step = datetime.timedelta(days=7 if period == WEEKLY else 1)
+    last = datetime.date.fromisoformat(week_start(end) if period == WEEKLY else end)
+    keys = [(last - step * i).isoformat() for i in reversed(range(periods))]
+    if not keys:
+        return []
+    sums = ", ".join(f"SUM({col})" for col in ANSWER_COLUMNS)
+    where = f"category_id=? AND {period} BETWEEN ? AND ?"
+    params = [category_id, keys[0], keys[-1]]
+    if phc is not None:
+        where = f"category_id=? AND phc=? AND {period} BETWEEN ? AND ?"
+        params.insert(1, phc)
+    found = {key: list(counts) for key, *counts in conn.execute(
+        f"SELECT {period}, {sums} FROM {_TABLES[period]} WHERE {where} GROUP BY {period}", params)}
+    return [(key, found.get(key, [0] * len(ANSWER_COLUMNS)), score(found.get(key, ()))) for key in keys]
+
+
+def main(argv=None):
+    import database
+    from migrations import create_db
+
+    parser = argparse.ArgumentParser(description="Show, verify or rebuild the trend rollups.")
+    parser.add_argument("command", choices=("show", "verify", "rebuild"))
+    parser.add_argument("--db", default=database.DB_NAME, help="path to survey.db")
+    parser.add_argument("--category", help="category name or id (show)")
+    parser.add_argument("--phc", help="limit to one PHC (show; default: all)")
+    parser.add_argument("--period", choices=(DAILY, WEEKLY), default=WEEKLY)
+    parser.add_argument("--weeks", "--periods", dest="periods", type=int, default=12, help="periods to show")
+    parser.add_argument("--end", help="last date to include (YYYY-MM-DD, default today)")
+    args = parser.parse_args(argv)
+    database.manager.path = args.db
+    conn = database.get_connection()
+    create_db(conn)
+    source = packed_storage.response_source(conn)
+    if args.command == "rebuild":
+        rebuild(conn, source)
+        print("trends rebuilt")
+        return 0
+    if args.command == "verify":
+        mismatches = verify(conn, source)
+        for table, key, have, want in mismatches:
+            print(f"{table} {key}: stored {have}, expected {want}")
+        print(f"{len(mismatches)} mismatching trend rows")
+        return 1 if mismatches else 0
+    if not args.category:
+        parser.error("show needs --category")
+    categories = dict(database.get_categories())
+    category_id = int(args.category) if args.category.isdigit() else {
+        name: cid for cid, name in categories.items()}.get(args.category)
+    if category_id not in categories:
+        parser.error(f"unknown category {args.category}")
+    print(f"{categories[category_id]}, {args.phc or 'all PHCs'}:")
+    for key, counts, mean in get_trend(conn, category_id, args.phc, args.periods, args.period, args.end):
+        print(f"  {key}  {'-' if mean is None else f'{mean:.2f}':>5}  over {sum(counts)} answers")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+"""Write-behind queue for survey.db.
+
+UI callbacks hand their writes to ``write_queue`` instead of touching the
+database themselves. A single writer thread takes jobs off a bounded queue
+and commits whatever has piled up as one transaction, so a slow SD card
+stalls the writer rather than touch input. Each job runs in its own
+savepoint: a failing job is rolled back and reported without losing the
+rest of its batch.
+
+A job is a callable taking the writer's connection; it must not commit.
+``on_done(result)`` or ``on_error(exc)`` is called from the writer thread
+once the batch has been committed, so UI callers hop back to the main
+thread (Kivy: ``Clock.schedule_once``) before touching widgets.
+``after_pending`` does the same for a callback with no write of its own,
+for screens that should show what was just submitted. ``flush`` blocks
+until everything submitted so far is on disk, or a timeout passes; the
+app flushes for a moment in ``on_pause`` and closes the queue in
+``on_stop`` so no accepted write is lost when Android suspends or kills
+it.
+
+A batch that cannot get the write lock within the connection's busy
+timeout (maintenance can hold it through a VACUUM or an archive run) is
+retried, up to ``BUSY_RETRIES`` times, rather than failed.
+"""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import database
+import instrument
+
+log = logging.getLogger(__name__)
+
+_STOP = object()
+# Each attempt already waits out the connection's busy timeout (5 s)
+BUSY_RETRIES = 24
+
+
+class _Job:
+    __slots__ = ("fn", "on_done", "on_error", "queued_at")
+
+    def __init__(self, fn, on_done, on_error):
+        self.fn = fn
+        self.on_done = on_done
+        self.on_error = on_error
+        self.queued_at = time.perf_counter()
+
+
+class WriteQueue:
+    def __init__(self, max_pending=256, max_batch=64, latency_window=256):
+        self.max_batch = max_batch
+        self._queue = queue.Queue(max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._submitted = 0
+        self._finished = 0
+        self._latencies = deque(maxlen=latency_window)
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_depth = 0
+
+    def submit(self, fn, on_done=None, on_error=None):
+        """Queue ``fn(conn)``; blocks only while ``max_pending`` jobs are waiting."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+                self._thread.start()
+            self._submitted += 1
+        self._queue.put(_Job(fn, on_done, on_error))
+        with self._lock:
+            self.max_depth = max(self.max_depth, self._queue.qsize())
+
+    def after_pending(self, callback):
+        """Call ``callback(None)`` once every job submitted so far has landed."""
+        self.submit(lambda conn: None, on_done=callback)
+
+    def flush(self, timeout=None):
+        """Wait until every job submitted so far has been committed or failed.
+
+        Returns False if ``timeout`` seconds passed first.
+        """
+        with self._idle:
+            target = self._submitted
+            return self._idle.wait_for(lambda: self._finished >= target, timeout)
+
+    def close(self, timeout=None):
+        """Flush, then stop the writer thread. A later submit starts a new one."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return True
+        self._queue.put(_STOP)
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch and batch[-1] is not _STOP:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            stop = batch[-1] is _STOP
+            jobs = batch[:-1] if stop else batch
+            if jobs:
+                self._write(database.get_connection(), jobs)
+            if stop:
+                return
+
+    def _begin(self, conn):
+        for attempt in range(1, BUSY_RETRIES + 1):
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                return
+            except sqlite3.OperationalError as e:
+                if attempt == BUSY_RETRIES or not ("locked" in str(e) or "busy" in str(e)):
+                    raise
+                log.warning("database busy, retrying write batch (attempt %d)", attempt)
+
+    @instrument.timed("db.write_batch")
+    def _write(self, conn, jobs):
+        outcomes = []
+        try:
+            self._begin(conn)
+            for job in jobs:
+                conn.execute("SAVEPOINT job")
+                try:
+                    result = job.fn(conn)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO job")
+                    outcomes.append((job, False, e))
+                else:
+                    outcomes.append((job, True, result))
+                conn.execute("RELEASE job")
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            outcomes = [(job, False, e) for job in jobs]
+        committed_at = time.perf_counter()
+
+        with self._lock:
+            self.batches += 1
+            for job, ok, _ in outcomes:
+                self._latencies.append(committed_at - job.queued_at)
+                if ok:
+                    self.written += 1
+                else:
+                    self.failed += 1
+        for job, ok, value in outcomes:
+            callback = job.on_done if ok else job.on_error
+            if not ok:
+                log.error("queued write failed", exc_info=value)
+            if callback is not None:
+                try:
+                    callback(value)
+                except Exception:
+                    log.exception("write callback failed")
+        with self._idle:
+            self._finished += len(jobs)
+            self._idle.notify_all()
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                "depth": self._queue.qsize(),
+                "pending": self._submitted - self._finished,
+                "max_depth": self.max_depth,
+                "written": self.written,
+                "failed": self.failed,
+                "batches": self.batches,
+                "latency_avg": sum(latencies) / len(latencies) if latencies else 0.0,
+                "latency_p95": latencies[int(len(latencies) * 0.95)] if latencies else 0.0,
+                "latency_max": latencies[-1] if latencies else 0.0,
+            }
+
+
+write_queue = WriteQueue()